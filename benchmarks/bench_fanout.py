@@ -0,0 +1,66 @@
+# benchmarks/bench_fanout.py
+# 并发扇出对比：N 个同时发起的流式请求，线程池 + 同步引擎 vs 单事件循环 + 异步引擎。
+# 需要真实的 AI_API_KEY / AI_BASE_URL，会产生少量调用费用（请求不走缓存）。
+#
+# 用法：python -m benchmarks.bench_fanout --concurrency 10 30
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ai_engine import NetworkArchitectAI  # noqa: E402
+from utils.ai_engine_async import AsyncNetworkArchitectAI, collect  # noqa: E402
+
+PROMPT = [{"role": "user", "content": "用三句话解释 VLAN 间路由。"}]
+
+
+def run_threads(engine, n):
+    def one(_):
+        return "".join(engine._chat_stream(PROMPT, cacheable=False))
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(one, range(n)))
+
+
+async def run_async(engine, n):
+    return await asyncio.gather(*(collect(engine._chat_stream(PROMPT, cacheable=False)) for _ in range(n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发扇出：线程 vs asyncio")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 30])
+    args = parser.parse_args()
+
+    sync_engine = NetworkArchitectAI()
+    print(f"{'n':>4} {'threads s':>10} {'peak thr':>9} {'asyncio s':>10} {'peak thr':>9}")
+    for n in args.concurrency:
+        base = threading.active_count()
+        peak = [base]
+        stop = threading.Event()
+
+        def watch():
+            while not stop.wait(0.01):
+                peak[0] = max(peak[0], threading.active_count())
+        threading.Thread(target=watch, daemon=True).start()
+
+        t0 = time.perf_counter()
+        run_threads(sync_engine, n)
+        threaded = time.perf_counter() - t0
+        threaded_peak, peak[0] = peak[0] - base, threading.active_count()
+
+        async def timed():
+            engine = AsyncNetworkArchitectAI()  # 客户端绑定到本次 asyncio.run 的循环
+            t = time.perf_counter()
+            await run_async(engine, n)
+            return time.perf_counter() - t
+        asynced = asyncio.run(timed())
+        stop.set()
+        print(f"{n:>4} {threaded:>10.2f} {threaded_peak:>9} {asynced:>10.2f} {peak[0] - base:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/bench_history_load.py
+# 登录时历史加载基准：conversations 表从 1 万行涨到百万行，
+# load_user_conversations 的耗时应保持平稳（走复合索引，而不是全表扫描）。
+#
+# 用法：python -m benchmarks.bench_history_load --sizes 10000 100000 1000000
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.blob_store import put_blob  # noqa: E402
+
+MODULES = ("s1", "s3", "inquiry")
+
+
+def fill(conn, start, stop, users):
+    """批量插入 [start, stop) 行假数据，均匀分布到 users 个用户"""
+    bodies = [put_blob(conn, f"### 模拟正文 {k}\n" + "x" * 200) for k in range(50)]
+    rows = ((random.randint(1, users), MODULES[i % 3], f"[{i % 24:02d}:00] 主题{i % 50}",
+             bodies[i % 50], None, f"2024-01-01 00:00:{i % 60:02d}")
+            for i in range(start, stop))
+    conn.executemany("INSERT INTO conversations (user_id, module, title, content_hash, solution_hash, created_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def measure(load, users, rounds):
+    samples = []
+    for _ in range(rounds):
+        uid = random.randint(1, users)
+        t0 = time.perf_counter()
+        load(uid)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录历史加载耗时 vs 表规模")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="netarch_bench_")
+    os.environ["NETARCHITECT_DB_PATH"] = os.path.join(tmp, "bench.db")
+    from utils.db_helper import init_db, get_conn, load_user_conversations
+
+    init_db()
+    print(f"{'rows':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    filled = 0
+    with get_conn() as conn:
+        for size in sorted(args.sizes):
+            fill(conn, filled, size, args.users)
+            filled = size
+            p50, p95 = measure(load_user_conversations, args.users, args.rounds)
+            print(f"{size:>10} {p50:>8.3f} {p95:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
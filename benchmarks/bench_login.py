@@ -0,0 +1,86 @@
+# benchmarks/bench_login.py
+# 登录吞吐基准：一个班同时登录时，authenticate_user 每秒能处理多少次（按核折算），
+# 以及登录延迟的 p50/p95。scrypt 在有界线程池里算，线程数超过池大小只会排队。
+#
+# 用法：
+#   python -m benchmarks.bench_login --threads 40 --duration 10
+#   PASSWORD_SCRYPT_N=32768 PASSWORD_HASH_WORKERS=4 python -m benchmarks.bench_login
+#   python -m benchmarks.bench_login --legacy   # 旧 SHA-256 账号：首登升级 + 之后的登录
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import percentile  # noqa: E402
+
+
+def login_loop(db, users, stop_at, latencies, lock, offset):
+    i = offset
+    local = []
+    while time.perf_counter() < stop_at:
+        name, password = users[i % len(users)]
+        t0 = time.perf_counter()
+        if db.authenticate_user(name, password) is None:
+            raise RuntimeError(f"{name} 登录失败")
+        local.append((time.perf_counter() - t0) * 1000)
+        i += 1
+    with lock:
+        latencies.extend(local)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录吞吐（logins/s/核）")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=40, help="并发登录的会话数")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--legacy", action="store_true", help="账号以旧的无盐 SHA-256 形式入库")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="netarch_login_")
+    os.environ["NETARCHITECT_DB_PATH"] = os.path.join(tmp, "login.db")
+    from utils import db_helper as db
+    from utils import password_hash as ph
+
+    db.init_db()
+    users = [(f"student{i:04d}", f"pw-{i}") for i in range(args.users)]
+    if args.legacy:
+        hashes = [hashlib.sha256(p.encode()).hexdigest() for _, p in users]
+    else:
+        hashes = [ph.hash_password(p) for _, p in users]
+    db.register_users_bulk([(name, h, None) for (name, _), h in zip(users, hashes)])
+
+    if args.legacy:  # 第一次登录：校验 SHA-256 + 计算 scrypt 并排队写回
+        t0 = time.perf_counter()
+        for name, password in users:
+            db.authenticate_user(name, password)
+        db.flush_writes()
+        print(f"旧账号首登（含升级）：{(time.perf_counter() - t0) * 1000 / len(users):.1f} ms/次")
+
+    latencies, lock = [], threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=login_loop,
+                                args=(db, users, stop_at, latencies, lock, i * 7))
+               for i in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    rate = len(latencies) / wall
+    print(f"scrypt N={ph.SCRYPT_N} r={ph.SCRYPT_R} p={ph.SCRYPT_P}，哈希线程 {ph.HASH_WORKERS}，会话 {args.threads}")
+    print(f"{len(latencies)} 次登录 / {wall:.1f}s = {rate:.1f} logins/s，"
+          f"{rate / ph.HASH_WORKERS:.1f} logins/s/核")
+    print(f"延迟 p50 {percentile(latencies, 50):.1f} ms，p95 {percentile(latencies, 95):.1f} ms，"
+          f"p99 {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
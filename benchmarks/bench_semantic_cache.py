@@ -0,0 +1,91 @@
+# benchmarks/bench_semantic_cache.py
+# 概念近似索引基准：索引里已有 N 个概念时，增量 add 和 lookup 的耗时，
+# 以及几组真实换问法 / 近似但不同的问题的命中情况（用于调 SEMANTIC_CACHE_THRESHOLD）。
+#
+# 用法：python -m benchmarks.bench_semantic_cache --sizes 1000 10000 50000
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import percentile  # noqa: E402
+from utils.semantic_cache import ConceptIndex, THRESHOLD  # noqa: E402
+
+PROTOCOLS = ("TCP", "UDP", "OSPF", "BGP", "RIP", "STP", "VLAN", "ARP", "DHCP", "DNS", "NAT", "ACL",
+             "IPv6", "ICMP", "HTTP", "VRRP", "MPLS", "PPP", "QoS", "IPSec")
+ASPECTS = ("三次握手", "四次挥手", "拥塞控制", "滑动窗口", "DR/BDR 选举", "邻居状态机", "路径属性选路",
+           "水平分割", "根桥选举", "端口状态", "Trunk 封装", "报文格式", "地址分配", "递归查询",
+           "地址转换", "通配符掩码", "报文分片", "超时重传", "主备切换", "标签交换")
+TEMPLATES = ("为什么 {p} 需要{a}？", "{p}{a}的原因", "{p} 的{a}是什么", "请解释一下 {p} {a}",
+             "{p} {a}原理", "{p}中{a}怎么工作")
+# (新问法, 已有问法, 是否应当命中)。不该命中的是协议名相同、问的方面不同的近似问题
+PARAPHRASES = (
+    ("TCP三次握手的原因", "为什么 TCP 需要三次握手？", True),
+    ("tcp 为什么要三次握手", "为什么 TCP 需要三次握手？", True),
+    ("OSPF中DR选举", "OSPF 的 DR/BDR 选举", True),
+    ("DR BDR 怎么选举", "OSPF 的 DR/BDR 选举", True),
+    ("how does the 3-way handshake work", "why 3-way handshake", True),
+    ("ARP 欺骗", "什么是 ARP", False),
+    ("VLAN", "VLAN 间路由", False),
+    ("TCP 三次握手和四次挥手的区别", "为什么 TCP 需要三次握手？", False),
+    ("TCP 四次挥手", "为什么 TCP 需要三次握手？", False),
+    ("OSPF 邻居状态机", "OSPF 的 DR/BDR 选举", False),
+    ("STP 端口状态", "STP 根桥选举", False),
+)
+
+
+def synthetic_concepts(n, rng):
+    concepts = []
+    while len(concepts) < n:
+        template = rng.choice(TEMPLATES)
+        concept = template.format(p=rng.choice(PROTOCOLS), a=rng.choice(ASPECTS))
+        concepts.append(f"{concept} #{len(concepts)}")  # 编号保证每条都是不同的文档
+    return concepts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="语义缓存索引：add/lookup 耗时 vs 索引规模")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # 1. 换问法该命中的命中、近似问题不误命中
+    index = ConceptIndex()
+    for original in dict.fromkeys(original for _, original, _ in PARAPHRASES):
+        index.add(original, original)
+    print(f"阈值 {THRESHOLD}")
+    for question, expected, should_hit in PARAPHRASES:
+        score, matched, _ = index.search(question, 1)[0]
+        hit = score >= THRESHOLD
+        if should_hit:
+            mark = "命中" if hit and matched == expected else "漏命中"
+        else:
+            mark = "误命中" if hit else "未命中（正确）"
+        print(f"  {question!r:36} -> {matched!r:28} {score:.2f} {mark}")
+
+    # 2. 规模 vs 耗时
+    print(f"{'concepts':>10} {'add µs':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    index = ConceptIndex()
+    for size in sorted(args.sizes):
+        batch = synthetic_concepts(size - len(index), rng)
+        t0 = time.perf_counter()
+        for concept in batch:
+            index.add(concept, None)
+        add_us = (time.perf_counter() - t0) * 1e6 / max(1, len(batch))
+        samples = []
+        for query in synthetic_concepts(args.queries, rng):
+            t0 = time.perf_counter()
+            index.lookup(query)
+            samples.append((time.perf_counter() - t0) * 1000)
+        samples.sort()
+        print(f"{size:>10} {add_us:>8.1f} {percentile(samples, 50):>8.3f} "
+              f"{percentile(samples, 95):>8.3f} {percentile(samples, 99):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_single_flight.py
+# 单飞合并：模拟老师一声令下，N 个会话在一秒内发出完全相同的概念追问，
+# 统计实际发往上游的请求数和各会话的首段 / 完整耗时。
+# 需要真实的 AI_API_KEY / AI_BASE_URL；每轮的概念带随机后缀，避免命中回复缓存。
+#
+# 用法：python -m benchmarks.bench_single_flight --sessions 40
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import percentile  # noqa: E402
+from utils.ai_engine import NetworkArchitectAI  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单飞合并：相同并发请求的上游调用数")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--spread-ms", type=float, default=1000, help="各会话发起时间在这个范围内随机分布")
+    args = parser.parse_args()
+
+    engine = NetworkArchitectAI()
+    concept = f"VLAN 间路由 #{random.randint(0, 10 ** 6)}"
+    first_ms, total_ms = [], []
+    lock = threading.Lock()
+
+    def session():
+        time.sleep(random.uniform(0, args.spread_ms) / 1000)
+        t0 = time.perf_counter()
+        first = None
+        for _ in engine.socratic_quiz(concept):
+            if first is None:
+                first = (time.perf_counter() - t0) * 1000
+        with lock:
+            first_ms.append(first or 0.0)
+            total_ms.append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = engine.resilience_stats()
+    first_ms.sort()
+    total_ms.sort()
+    print(f"会话数 {args.sessions}，上游请求 {stats['requests']}，合并 {stats['coalesced']}")
+    print(f"首段 p50 {percentile(first_ms, 50):.0f} ms / p95 {percentile(first_ms, 95):.0f} ms；"
+          f"完整 p50 {percentile(total_ms, 50):.0f} ms / p95 {percentile(total_ms, 95):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
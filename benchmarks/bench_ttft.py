@@ -0,0 +1,53 @@
+# benchmarks/bench_ttft.py
+# 首 token 时间（TTFT）对比：每个会话新建客户端（旧做法，每次都要 TCP + TLS 握手）
+# vs 进程共享、已预热的客户端。需要真实的 AI_API_KEY / AI_BASE_URL，会产生少量调用费用。
+#
+# 用法：python -m benchmarks.bench_ttft --rounds 5
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI  # noqa: E402
+from utils.ai_engine import NetworkArchitectAI, MODEL  # noqa: E402
+
+PROMPT = [{"role": "user", "content": "用一句话解释 ARP。"}]
+
+
+def ttft(client):
+    """发请求到收到第一段文本的毫秒数（收到后即中断，只测首 token）"""
+    t0 = time.perf_counter()
+    stream = client.chat.completions.create(model=MODEL, messages=PROMPT, stream=True, max_tokens=16)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            break
+    elapsed = (time.perf_counter() - t0) * 1000
+    stream.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="首 token 时间：新建客户端 vs 共享预热客户端")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    cold = []
+    for _ in range(args.rounds):
+        client = OpenAI(api_key=os.getenv("AI_API_KEY"), base_url=os.getenv("AI_BASE_URL"))
+        cold.append(ttft(client))
+        client.close()
+
+    engine = NetworkArchitectAI()
+    print(f"预热耗时 {engine.warm_up():.0f} ms")
+    warm = [ttft(engine.client) for _ in range(args.rounds)]
+
+    for name, samples in (("每会话新建客户端", cold), ("共享预热客户端", warm)):
+        print(f"{name}: TTFT 中位数 {statistics.median(samples):.0f} ms，"
+              f"最小 {min(samples):.0f} ms，最大 {max(samples):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# benchmarks/load_test.py
+# 并发会话压测：模拟 N 个学生同时操作（登录、保存、删除、翻历史、搜索），
+# 针对临时数据库统计各操作 p50/p95/p99 延迟、吞吐和 "database is locked" 错误率。
+# Streamlit 的每个会话跑在同一进程的独立线程里，这里用线程模拟。
+#
+# 用法：
+#   python -m benchmarks.load_test --sessions 60 --duration 20
+#   python -m benchmarks.load_test --sessions 200 --max-lock-error-rate 0
+#   python -m benchmarks.load_test --sessions 200 --write-mode queue   # 写操作只计入队延迟
+#   python -m benchmarks.load_test --sessions 200 --sharding class --classes 8
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULES = ("s1", "s3", "inquiry")
+TOPICS = ("OSPF 邻居建立", "VLAN 间路由", "ACL 策略", "NAT 配置", "BGP 属性选路", "STP 根桥选举")
+
+# 默认操作权重：一节实验课里大部分请求是生成后保存 + 浏览历史
+DEFAULT_MIX = {"login": 1, "save": 5, "update": 1, "delete": 1, "history": 3, "search": 1}
+WRITE_OPS = ("save", "update", "delete")
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.lock_errors = defaultdict(int)
+        self.other_errors = defaultdict(int)
+
+    def record(self, op, fn):
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except sqlite3.OperationalError as e:
+            msg = str(e).lower()
+            with self._lock:
+                if "locked" in msg or "busy" in msg:
+                    self.lock_errors[op] += 1
+                else:
+                    self.other_errors[op] += 1
+            return None
+        except Exception:
+            with self._lock:
+                self.other_errors[op] += 1
+            return None
+        elapsed = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.latencies[op].append(elapsed)
+        return result
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def session_loop(db, user, password, uid, mix, stop_at, recorder, write_mode, seed, think_ms):
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    mine = []  # 本会话保存过的记录 id（int 或 PendingWrite）
+    body = "### 🎯 今日挑战目标\n" + "配置要求与验收标准。" * rng.randint(20, 200)
+    while time.perf_counter() < stop_at:
+        if think_ms:
+            time.sleep(rng.expovariate(1000 / think_ms))
+        op = rng.choices(ops, weights)[0]
+        if op == "login":
+            def login():
+                if db.authenticate_user(user, password) is None:
+                    raise RuntimeError("登录失败")
+                return db.load_user_conversations(uid)
+            recorder.record(op, login)
+        elif op == "save":
+            module, topic = rng.choice(MODULES), rng.choice(TOPICS)
+            title = f"[{rng.randint(8, 17):02d}:{rng.randint(0, 59):02d}] {topic}"
+            if write_mode == "queue":
+                cid = recorder.record(op, lambda: db.enqueue_save_conversation(uid, module, title, body))
+            else:
+                cid = recorder.record(op, lambda: db.save_conversation(uid, module, title, body))
+            if cid is not None:
+                mine.append(cid)
+        elif op == "update" and mine:
+            cid = rng.choice(mine)
+            if write_mode == "queue":
+                recorder.record(op, lambda: db.enqueue_update_solution(uid, cid, "参考答案" * 50))
+            else:
+                recorder.record(op, lambda: db.update_conversation_solution(uid, cid, "参考答案" * 50))
+        elif op == "delete" and mine:
+            cid = mine.pop(rng.randrange(len(mine)))
+            if write_mode == "queue":
+                recorder.record(op, lambda: db.enqueue_delete_conversation(uid, cid))
+            else:
+                recorder.record(op, lambda: db.delete_conversation(uid, cid))
+        elif op == "history":
+            module = rng.choice(MODULES)
+            # 侧边栏“加载更早的记录”：带游标翻页
+            before = ("9999-12-31 00:00:00", rng.randint(1, 1 << 30))
+            recorder.record(op, lambda: db.load_conversation_page(uid, module, before=before))
+        elif op == "search":
+            recorder.record(op, lambda: db.search_conversations(uid, rng.choice(TOPICS).split()[0]))
+
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="netarch_load_")
+    os.environ["NETARCHITECT_DB_PATH"] = os.path.join(tmp, "load.db")
+    os.environ["DB_SHARDING"] = args.sharding
+    # 注册只接受配置过的班级
+    os.environ["DB_CLASSES"] = ",".join(f"class{i}" for i in range(args.classes))
+    from utils import db_helper as db
+
+    db.init_db()
+    users = []
+    for i in range(args.sessions):
+        name, password = f"student{i:04d}", f"pw-{i}"
+        db.register_user(name, password, class_name=f"class{i % args.classes}")
+        users.append((name, password, db.authenticate_user(name, password)))
+
+    recorder = Recorder()
+    mix = dict(DEFAULT_MIX)
+    for item in args.mix or ():
+        op, weight = item.split("=")
+        mix[op] = float(weight)
+
+    stop_at = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=session_loop,
+                                args=(db, name, password, uid, mix, stop_at, recorder,
+                                      args.write_mode, args.seed + i, args.think_ms))
+               for i, (name, password, uid) in enumerate(users)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if args.write_mode == "queue":
+        db.flush_writes()
+    wall = time.perf_counter() - t0
+    return recorder, wall, (db.write_stats() if args.write_mode == "queue" else None)
+
+
+def report(recorder, wall, write_mode="sync"):
+    from utils.password_hash import HASH_WORKERS, SCRYPT_N
+
+    # 登录延迟主要取决于口令哈希线程数：默认 1 个 worker 时并发登录要排队
+    print(f"口令哈希：HASH_WORKERS={HASH_WORKERS}，scrypt N={SCRYPT_N}")
+    print(f"{'op':<8} {'count':>8} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'locked':>7} {'errors':>7}")
+    total_ok = total_locked = 0
+    for op in DEFAULT_MIX:
+        values = sorted(recorder.latencies.get(op, []))
+        locked, errors = recorder.lock_errors.get(op, 0), recorder.other_errors.get(op, 0)
+        total_ok += len(values)
+        total_locked += locked
+        label = f"{op}*" if write_mode == "queue" and op in WRITE_OPS else op
+        print(f"{label:<8} {len(values):>8} {len(values) / wall:>8.1f} {percentile(values, 50):>8.2f} "
+              f"{percentile(values, 95):>8.2f} {percentile(values, 99):>8.2f} {locked:>7} {errors:>7}")
+    attempts = total_ok + total_locked + sum(recorder.other_errors.values())
+    lock_rate = total_locked / attempts if attempts else 0.0
+    print(f"总吞吐 {total_ok / wall:.1f} ops/s，锁错误率 {lock_rate:.4%}（{wall:.1f}s）")
+    if write_mode == "queue":
+        # 入队即返回，提交在后台写线程里：这几行不能当写入容量看，看下面的写队列统计
+        print(f"* {'/'.join(WRITE_OPS)} 为入队延迟（enqueue latency），不含提交")
+    return lock_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 持久层并发会话压测")
+    parser.add_argument("--sessions", type=int, default=50, help="并发会话（学生）数")
+    parser.add_argument("--duration", type=float, default=15, help="压测时长（秒）")
+    parser.add_argument("--write-mode", choices=("sync", "queue"), default="sync",
+                        help="sync：直接写库，延迟含提交；queue：走后台写队列（与页面一致），"
+                             "写操作只计入队延迟")
+    parser.add_argument("--sharding", choices=("off", "hash", "class"), default="off",
+                        help="分库模式（同 DB_SHARDING 环境变量）")
+    parser.add_argument("--classes", type=int, default=4, help="--sharding class 时学生平均分到的班级数")
+    parser.add_argument("--mix", nargs="*", metavar="OP=WEIGHT",
+                        help=f"覆盖操作权重，默认 {DEFAULT_MIX}")
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="每次操作前的平均思考时间（指数分布）；0 = 满负荷")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子（结果可复现）")
+    parser.add_argument("--max-lock-error-rate", type=float, default=None,
+                        help="超过该锁错误率时以非零状态退出（用于回归检测）")
+    args = parser.parse_args()
+
+    recorder, wall, stats = run(args)
+    lock_rate = report(recorder, wall, args.write_mode)
+    if stats:
+        print(f"写队列：{stats}")
+    if args.max_lock_error_rate is not None and lock_rate > args.max_lock_error_rate:
+        sys.exit(f"锁错误率 {lock_rate:.4%} 超过阈值 {args.max_lock_error_rate:.4%}")
+
+
+if __name__ == "__main__":
+    main()
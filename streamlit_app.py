@@ -5,118 +5,188 @@ for proxy_var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'OPE
 # ===============================================
 
 
-from utils.db_helper import get_db_path  # 仅此一处导入
+from utils.db_helper import (init_db, register_user, authenticate_user,
+                             load_user_conversations, load_conversation_body,
+                             load_conversation_page, history_cursor,
+                             search_conversations,
+                             enqueue_save_conversation,
+                             enqueue_update_solution, enqueue_delete_conversation,
+                             write_stats, start_backups, backup_stats,
+                             create_session, restore_session, enqueue_session_snapshot, delete_session,
+                             registration_classes, HISTORY_LIMIT)
+from utils.write_behind import persisted_id
 import streamlit as st
 from utils.ai_engine import NetworkArchitectAI
+from utils.speculative import get_speculator, SolutionAnswer
+from utils.task_pool import get_task_pool
+from utils.llm_cache import replay
+from utils.lru_cache import LRUCache
 from datetime import datetime  # 导入 datetime 类
+import re
+import threading
 # ====== 新增：数据库初始化 ======
-import sqlite3
-import hashlib
 import os
 # 在文件最顶部添加防护（防止命名冲突）
 
 
-# 创建数据库连接函数
-def init_db():
-    # 修改后（云端持久化！）
-    conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-    c = conn.cursor()
+# 数据库初始化在下方 bootstrap() 中完成：每个服务器进程一次，而不是每次重跑一次
 
-    # 用户表
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
+# 用户认证 & 对话存取函数已移至 utils/db_helper（共享连接池）
 
-    # 对话历史表（统一存储三个模块）
-    c.execute('''CREATE TABLE IF NOT EXISTS conversations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        module TEXT NOT NULL,  -- 's1', 's3', 'inquiry'
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        solution TEXT,         -- 仅s3需要
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id)
-    )''')
+# 每个会话缓存的历史正文条数
+HISTORY_BODY_CACHE_SIZE = 8
+# 每个模块的历史列表最多保留多少条（窗口缓存，窗口外的按需翻页加载）
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "50"))
+# 本次会话新建的记录只有最近这么多条保留正文，更早的只留标题，查看时经 history_body 回库
+HISTORY_BODIES_KEPT = HISTORY_BODY_CACHE_SIZE
 
-    conn.commit()
-    conn.close()
 
+def history_body(record):
+    """取历史记录的正文/答案。
 
-# 初始化数据库（应用启动时调用）
-init_db()
+    本次会话新生成的记录自带 content；登录时加载的只有标题，
+    点击查看时才查库，结果放进会话级 LRU。
+    """
+    if "content" in record:
+        return record
+    cache = st.session_state.history_body_cache
+    body = cache.get(record["id"])
+    if body is None:
+        body = load_conversation_body(st.session_state.user_id, record["id"]) or {"content": "", "solution": ""}
+        cache.put(record["id"], body)
+    return body
 
 
-# ====== 新增：用户认证函数 ======
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
-def register_user(username, password):
-    try:
-        # 修改后（云端持久化！）
-        conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-        c = conn.cursor()
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                  (username, hash_password(password)))
-        conn.commit()
-        conn.close()
-        return True, "注册成功！请登录"
-    except sqlite3.IntegrityError:
-        return False, "用户名已存在"
-
-
-def authenticate_user(username, password):
-    # 修改后（云端持久化！）
-    conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-    c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE username = ? AND password_hash = ?",
-              (username, hash_password(password)))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
-
-
-def load_user_conversations(user_id):
-    """加载用户所有历史对话"""
-    # 修改后（云端持久化！）
-    conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-    c = conn.cursor()
-
-    # 加载S1历史
-    c.execute(
-        "SELECT title, content FROM conversations WHERE user_id = ? AND module = 's1' ORDER BY created_at DESC LIMIT 10",
-        (user_id,))
-    s1_list = [{"title": row[0], "content": row[1]} for row in c.fetchall()]
-
-    # 加载S3历史
-    c.execute(
-        "SELECT title, content, solution FROM conversations WHERE user_id = ? AND module = 's3' ORDER BY created_at DESC LIMIT 10",
-        (user_id,))
-    s3_list = [{"title": row[0], "content": row[1], "solution": row[2] or ""} for row in c.fetchall()]
-
-    # 加载追问历史
-    c.execute(
-        "SELECT title, content FROM conversations WHERE user_id = ? AND module = 'inquiry' ORDER BY created_at DESC LIMIT 10",
-        (user_id,))
-    inquiry_list = [{"title": row[0], "content": row[1]} for row in c.fetchall()]
-
-    conn.close()
-    return s1_list, s3_list, inquiry_list
+# 模块 -> (历史列表, 当前查看下标, 导航菜单项)
+MODULE_STATE = {
+    "s1": ("s1_chat_history_list", "s1_active_history_index", "🔍 网络智能诊断"),
+    "s3": ("s3_chat_history_list", "s3_active_history_index", "🎯 自适应实验工场"),
+    "inquiry": ("inquiry_chat_history_list", "inquiry_active_history_index", "🧠 协议认知诊断"),
+}
 
 
-def save_conversation(user_id, module, title, content, solution=None):
-    """保存单条对话到数据库"""
-    # 修改后（云端持久化！）
-    conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-    c = conn.cursor()
-    c.execute("INSERT INTO conversations (user_id, module, title, content, solution) VALUES (?, ?, ?, ?, ?)",
-              (user_id, module, title, content, solution))
-    conn.commit()
-    conn.close()
+def open_search_result(hit):
+    """搜索结果“打开”按钮回调：切到对应模块，把该记录放进历史列表并选中"""
+    list_key, index_key, menu_label = MODULE_STATE[hit["module"]]
+    history = st.session_state[list_key]
+    position = None
+    for i, record in enumerate(history):
+        # 本次会话新建的记录 id 是后台写入句柄，取其已落库的主键比较
+        if getattr(record.get("id"), "row_id", record.get("id")) == hit["id"]:
+            position = i
+            break
+    if position is None:
+        # 按时间插到正确位置（本次会话新建的记录没有 created_at，总是最新）
+        position = 0
+        for i, record in enumerate(history):
+            if "created_at" in record and (record["created_at"], record["id"]) < (hit["created_at"], hit["id"]):
+                position = i + 1
+        history.insert(position, {"id": hit["id"], "title": hit["title"], "created_at": hit["created_at"]})
+    st.session_state[index_key] = position
+    st.session_state.nav_menu = menu_label
+    trim_history(hit["module"])
+
+
+def _newer_key(module):
+    # 游标表里的标记：窗口已经往旧翻过，最新的一段被丢掉了
+    return f"{module}:newer"
+
+
+def _release_bodies(module):
+    """较早的新建记录丢掉正文（已落库的才丢，查看时 history_body 回库加载）"""
+    list_key, index_key, _ = MODULE_STATE[module]
+    history = st.session_state[list_key]
+    active = st.session_state[index_key]
+    for i, record in enumerate(history[:-HISTORY_BODIES_KEPT]):
+        if i == active or "content" not in record:
+            continue
+        row_id = persisted_id(record.get("id"))
+        if row_id is None:
+            continue
+        record["id"] = row_id
+        if module == "s3":
+            record["has_solution"] = bool(record.get("solution"))
+        record.pop("content", None)
+        record.pop("solution", None)
+
+
+def reset_history_window(module):
+    """回到最新的一页（窗口往旧翻过之后，或有新记录时）"""
+    list_key, index_key, _ = MODULE_STATE[module]
+    page, next_cursor = load_conversation_page(st.session_state.user_id, module)
+    st.session_state[list_key] = page
+    st.session_state.history_cursors[module] = next_cursor
+    st.session_state.history_cursors.pop(_newer_key(module), None)
+    st.session_state[index_key] = None
+
+
+def trim_history(module):
+    """列表新增记录后调用：超出窗口就丢掉最旧的（正在查看的除外），
+    “加载更早记录”的游标改指保留下来的最旧一条"""
+    list_key, index_key, _ = MODULE_STATE[module]
+    if st.session_state.history_cursors.get(_newer_key(module)):
+        # 窗口停在较早的位置，新记录和它之间有断档：直接回到最新一页（含刚保存的记录）
+        reset_history_window(module)
+        return
+    history = st.session_state[list_key]
+    overflow = len(history) - HISTORY_WINDOW
+    if overflow > 0:
+        active = st.session_state[index_key]
+        drop = set([i for i in range(len(history)) if i != active][:overflow])
+        kept = [r for i, r in enumerate(history) if i not in drop]
+        oldest = next((r for r in kept if active is None or r is not history[active]), None)
+        if active is not None:
+            st.session_state[index_key] = active - sum(1 for i in drop if i < active)
+        st.session_state[list_key] = history = kept
+        st.session_state.history_cursors[module] = (
+            history_cursor(oldest, st.session_state.user_id) if oldest is not None else None)
+    _release_bodies(module)
+
+
+def load_more_history(module, list_key, index_key):
+    """侧边栏“加载更早记录”：按 (created_at, id) 游标翻一页，拼到列表头部。
+    超出窗口时丢掉最新的一段，侧边栏出现“回到最新记录”"""
+    cursor = st.session_state.history_cursors.get(module)
+    page, next_cursor = load_conversation_page(st.session_state.user_id, module, before=cursor)
+    # 通过搜索打开过的旧记录可能已经在列表里了，去重
+    known = {persisted_id(record.get("id")) for record in st.session_state[list_key]}
+    page = [record for record in page if record["id"] not in known]
+    history = page + st.session_state[list_key]
+    st.session_state.history_cursors[module] = next_cursor
+    # 列表头部插入了新元素，正在查看的记录下标要跟着后移
+    active = st.session_state[index_key]
+    if active is not None:
+        active += len(page)
+    overflow = len(history) - HISTORY_WINDOW
+    if overflow > 0:
+        history = history[:-overflow]
+        st.session_state.history_cursors[_newer_key(module)] = True
+        if active is not None and active >= len(history):
+            active = None
+    st.session_state[list_key] = history
+    st.session_state[index_key] = active
+
+
+def _history_lists():
+    return tuple(st.session_state[MODULE_STATE[m][0]] for m in ("s1", "s3", "inquiry"))
+
+
+def _snapshot_signature():
+    lists = _history_lists()
+    return (tuple((len(l), id(l[0]) if l else None, id(l[-1]) if l else None) for l in lists),
+            sum(1 for r in lists[1] if r.get("solution") or r.get("has_solution")),
+            tuple(sorted(st.session_state.history_cursors.items())))
+
+
+def sync_session_snapshot():
+    """历史列表变了（新建/删除/翻页/出答案）就把快照写回会话表，刷新页面后直接恢复"""
+    token = st.session_state.get("session_token")
+    if not token:
+        return
+    signature = _snapshot_signature()
+    if signature != st.session_state.get("session_snapshot_sig"):
+        enqueue_session_snapshot(token, _history_lists(), st.session_state.history_cursors)
+        st.session_state.session_snapshot_sig = signature
 
 
 
@@ -141,8 +211,7 @@ st.set_page_config(
 
 # ========== CSS 样式注入 (浅绿色背景 + 细节优化) ==========
 
-st.html("""
-<style>
+APP_CSS = """
 /* ===== 手机文字强制可见（深色/浅色模式通吃）===== */
 * {
     color: #2D3748 !important; /* 深灰文字 */
@@ -239,29 +308,68 @@ button[kind="primary"]:disabled {
 [data-testid="stChatMessageAvatarBackground"] {
     background-color: #1976D2;
 }
-</style>
-""")
-
-# 检查环境变量（关键！Streamlit Cloud 不读 .env）
-ai_api_key = os.getenv("AI_API_KEY")
-ai_base_url = os.getenv("AI_BASE_URL")
-
-# 严格验证
-if not ai_api_key:
-    st.error("❌ **AI_API_KEY 未配置**\n请在 Streamlit Cloud → Manage app → Secrets 中添加：\n`AI_API_KEY = sk-你的密钥`")
-    st.stop()
-if not ai_base_url:
-    st.error("❌ **AI_BASE_URL 未配置**\n请在 Secrets 中添加：\n`AI_BASE_URL = https://api.deepseek.com/v1`")
-    st.stop()
-if not ai_base_url.rstrip("/").endswith("/v1"):
-    st.error(f"❌ **AI_BASE_URL 格式错误**\n当前值: `{ai_base_url}`\n✅ 正确格式: `https://api.deepseek.com/v1`\n（必须包含 `/v1` 后缀）")
+"""
+
+
+def _minify_css(css):
+    """去掉注释和多余空白，减小每次重跑下发的样式体积"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};])\s*", r"\1", css).strip()
+
+
+def _check_ai_env():
+    """检查环境变量（关键！Streamlit Cloud 不读 .env），返回错误提示或 None"""
+    ai_api_key = os.getenv("AI_API_KEY")
+    ai_base_url = os.getenv("AI_BASE_URL")
+    if not ai_api_key:
+        return "❌ **AI_API_KEY 未配置**\n请在 Streamlit Cloud → Manage app → Secrets 中添加：\n`AI_API_KEY = sk-你的密钥`"
+    if not ai_base_url:
+        return "❌ **AI_BASE_URL 未配置**\n请在 Secrets 中添加：\n`AI_BASE_URL = https://api.deepseek.com/v1`"
+    if not ai_base_url.rstrip("/").endswith("/v1"):
+        return f"❌ **AI_BASE_URL 格式错误**\n当前值: `{ai_base_url}`\n✅ 正确格式: `https://api.deepseek.com/v1`\n（必须包含 `/v1` 后缀）"
+    return None
+
+
+@st.cache_resource(show_spinner=False)
+def bootstrap():
+    """进程级启动：建表/迁移、定时备份、环境校验、样式预处理，每个服务器进程只做一次。
+
+    Streamlit 每次交互都会从头重跑本脚本，之后的重跑直接复用这里的结果。
+    """
+    return {
+        "schema_version": init_db(),
+        "backups": start_backups(),
+        "env_error": _check_ai_env(),
+        "css": "<style>" + _minify_css(APP_CSS) + "</style>",
+        "booted_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+boot = bootstrap()
+# 样式属于页面元素，每次重跑都要重新下发，否则会被清掉；这里只发预处理好的字符串
+st.html(boot["css"])
+
+if boot["env_error"]:
+    st.error(boot["env_error"])
+    bootstrap.clear()  # 配置错误不缓存，修好 Secrets 后下次交互即可恢复
     st.stop()
 
 
 
 # 2. 初始化 AI
+@st.cache_resource(show_spinner=False)
+def get_ai_engine():
+    """进程内共享一个 AI 引擎：一个 OpenAI 客户端、一个 HTTP 连接池，
+    会话里只存它的引用。引擎本身不含任何用户状态。"""
+    engine = NetworkArchitectAI()
+    if os.getenv("AI_WARMUP", "on") != "off":
+        threading.Thread(target=engine.warm_up, name="ai-warmup", daemon=True).start()
+    return engine
+
+
 if "ai_engine" not in st.session_state:
-    st.session_state.ai_engine = NetworkArchitectAI()
+    st.session_state.ai_engine = get_ai_engine()
 
 # --- 初始化学习进度计数器 ---
 if "weekly_progress_count" not in st.session_state:
@@ -293,6 +401,29 @@ if "inquiry_chat_history_list" not in st.session_state:
 if "inquiry_active_history_index" not in st.session_state:
     st.session_state.inquiry_active_history_index = None  # 深度追问当前查看的历史索引
 
+# --- 初始化 历史正文缓存（按需加载） ---
+if "history_body_cache" not in st.session_state:
+    st.session_state.history_body_cache = LRUCache(HISTORY_BODY_CACHE_SIZE)
+
+# --- 初始化 历史分页游标 (None 代表没有更早的记录) ---
+if "history_cursors" not in st.session_state:
+    st.session_state.history_cursors = {}
+
+# --- 刷新页面后凭 URL 里的会话令牌恢复登录（一次主键查询，不重新加载历史） ---
+if "user_id" not in st.session_state and st.query_params.get("sid"):
+    restored = restore_session(st.query_params["sid"])
+    if restored:
+        st.session_state.user_id = restored["user_id"]
+        st.session_state.username = restored["username"]
+        (st.session_state.s1_chat_history_list, st.session_state.s3_chat_history_list,
+         st.session_state.inquiry_chat_history_list) = restored["histories"]
+        st.session_state.history_cursors = restored["cursors"]
+        st.session_state.session_token = st.query_params["sid"]
+        st.session_state.session_snapshot_sig = _snapshot_signature()
+    else:  # 过期或已退出登录
+        del st.query_params["sid"]
+sync_session_snapshot()
+
 # --- 初始化删除模式状态 ---
 if "delete_mode" not in st.session_state:
     st.session_state.delete_mode = False
@@ -311,9 +442,13 @@ with st.sidebar:
         # 已登录状态：显示用户信息和登出按钮
         st.title(f"👨‍💻 欢迎 {st.session_state.username}")
         if st.button("🚪 退出登录", use_container_width=True):
+            if st.session_state.get("session_token"):
+                delete_session(st.session_state.session_token)
+                st.query_params.pop("sid", None)
             # 清除所有用户相关状态
             for key in ["user_id", "username", "s1_chat_history_list",
-                        "s3_chat_history_list", "inquiry_chat_history_list"]:
+                        "s3_chat_history_list", "inquiry_chat_history_list", "history_body_cache",
+                        "history_cursors", "session_token", "session_snapshot_sig"]:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
@@ -322,6 +457,24 @@ with st.sidebar:
         with st.expander("🔍 保存调试日志"):
             for log in st.session_state.debug_save[-5:]:  # 显示最近5条
                 st.text(log)
+    # 调试：后台写队列状态（队列深度 / 提交耗时）
+    if os.getenv("NETARCHITECT_DEBUG"):
+        with st.expander("🔍 写队列状态"):
+            st.caption(f"schema v{boot['schema_version']} · 进程启动于 {boot['booted_at']}")
+            st.json(write_stats())
+            if backup_stats():
+                st.json(backup_stats())
+        with st.expander("🔍 大模型回复缓存"):
+            st.caption(f"连接预热：{getattr(st.session_state.ai_engine, 'warmup', '进行中')}")
+            st.json(st.session_state.ai_engine.cache_stats() or {"enabled": False})
+        with st.expander("🔍 大模型调用健康度（重试 / 熔断）"):
+            st.json(st.session_state.ai_engine.resilience_stats())
+        if get_speculator() is not None:
+            with st.expander("🔍 参考答案推测生成"):
+                st.json(get_speculator().stats())
+        if get_task_pool() is not None:
+            with st.expander("🔍 任务单预生成池"):
+                st.json(get_task_pool().stats())
 #===================================================================
     try:
         st.image("xinkecolorlog.png", use_container_width=True)
@@ -340,11 +493,25 @@ with st.sidebar:
     menu = st.radio(
         "功能导航",
         ["🔍 网络智能诊断", "🎯 自适应实验工场", "🧠 协议认知诊断"],
-        index=0
+        key="nav_menu"
     )
 
     st.markdown("---")
 
+    # 全文搜索：三个模块的历史诊断/任务/追问
+    if "user_id" in st.session_state:
+        search_query = st.text_input("🔎 搜索历史记录", key="history_search", placeholder="例如：NAT 诊断")
+        if search_query.strip():
+            hits = search_conversations(st.session_state.user_id, search_query)
+            if not hits:
+                st.caption("没有找到相关记录")
+            for hit in hits:
+                st.markdown(f"**{MODULE_STATE[hit['module']][2]}** · {hit['title_hl']}")
+                st.caption(hit["snippet"])
+                st.button("📂 打开", key=f"search_open_{hit['id']}",
+                          on_click=open_search_result, args=(hit,))
+            st.markdown("---")
+
     # 删除模式按钮
     if st.button("🗑️ 删除模式", use_container_width=True):
         st.session_state.delete_mode = not st.session_state.delete_mode
@@ -377,16 +544,8 @@ with st.sidebar:
                     # 1. 从session_state删除
                     deleted_record = st.session_state.s1_chat_history_list.pop(real_index)
                     # 2. 从数据库删除（关键！）
-                    if "user_id" in st.session_state:
-                        # 修改后（云端持久化！）
-                        conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-                        c = conn.cursor()
-                        # 通过标题+模块+用户精确匹配（实际生产建议用ID）
-                        c.execute("""DELETE FROM conversations 
-                                        WHERE user_id = ? AND module = 's1' AND title = ?""",
-                                  (st.session_state.user_id, deleted_record['title']))
-                        conn.commit()
-                        conn.close()
+                    if "user_id" in st.session_state and deleted_record.get("id"):
+                        enqueue_delete_conversation(st.session_state.user_id, deleted_record["id"])
                     # 如果当前正在查看被删除的记录，回到当前对话
                     if st.session_state.s1_active_history_index == real_index:
                         st.session_state.s1_active_history_index = None
@@ -398,6 +557,16 @@ with st.sidebar:
                     st.session_state.s1_active_history_index = real_index
                     st.rerun()
 
+        # 3. 加载更早的记录 (keyset 分页，列表只是窗口缓存)
+        if st.session_state.history_cursors.get(_newer_key("s1")):
+            if st.button("⬆️ 回到最新的记录", key="newest_s1", use_container_width=True):
+                reset_history_window("s1")
+                st.rerun()
+        if st.session_state.history_cursors.get("s1"):
+            if st.button("⬇️ 加载更早的记录", key="more_s1", use_container_width=True):
+                load_more_history("s1", "s1_chat_history_list", "s1_active_history_index")
+                st.rerun()
+
     elif menu == "🎯 自适应实验工场":
         st.markdown("#### 🕒 历史对话")
 
@@ -427,16 +596,8 @@ with st.sidebar:
                     deleted_record = st.session_state.s3_chat_history_list.pop(real_index)
 
                     # 2. 从数据库删除（关键！）
-                    if "user_id" in st.session_state:
-                        # 修改后（云端持久化！）
-                        conn = sqlite3.connect(get_db_path(), check_same_thread=False)
-                        c = conn.cursor()
-                        # 通过标题+模块+用户精确匹配（实际生产建议用ID）
-                        c.execute("""DELETE FROM conversations 
-                                        WHERE user_id = ? AND module = 's3' AND title = ?""",
-                                  (st.session_state.user_id, deleted_record['title']))
-                        conn.commit()
-                        conn.close()
+                    if "user_id" in st.session_state and deleted_record.get("id"):
+                        enqueue_delete_conversation(st.session_state.user_id, deleted_record["id"])
                     # 如果当前正在查看被删除的记录，回到当前对话
                     if st.session_state.s3_active_history_index == real_index:
                         st.session_state.s3_active_history_index = None
@@ -447,6 +608,16 @@ with st.sidebar:
                     st.session_state.s3_active_history_index = real_index
                     st.rerun()
 
+        # 3. 加载更早的记录 (keyset 分页，列表只是窗口缓存)
+        if st.session_state.history_cursors.get(_newer_key("s3")):
+            if st.button("⬆️ 回到最新的记录", key="newest_s3", use_container_width=True):
+                reset_history_window("s3")
+                st.rerun()
+        if st.session_state.history_cursors.get("s3"):
+            if st.button("⬇️ 加载更早的记录", key="more_s3", use_container_width=True):
+                load_more_history("s3", "s3_chat_history_list", "s3_active_history_index")
+                st.rerun()
+
     elif menu == "🧠 协议认知诊断":
         st.markdown("#### 🕒 历史对话")
 
@@ -473,15 +644,8 @@ with st.sidebar:
                     deleted_record = st.session_state.inquiry_chat_history_list.pop(real_index)
 
                     # 2. 从数据库删除（关键！）
-                    if "user_id" in st.session_state:
-                        conn = sqlite3.connect('netarchitect.db')
-                        c = conn.cursor()
-                        # 通过标题+模块+用户精确匹配（实际生产建议用ID）
-                        c.execute("""DELETE FROM conversations 
-                                        WHERE user_id = ? AND module = 'inquiry' AND title = ?""",
-                                  (st.session_state.user_id, deleted_record['title']))
-                        conn.commit()
-                        conn.close()
+                    if "user_id" in st.session_state and deleted_record.get("id"):
+                        enqueue_delete_conversation(st.session_state.user_id, deleted_record["id"])
                     # 如果当前正在查看被删除的记录，回到当前对话
                     if st.session_state.inquiry_active_history_index == real_index:
                         st.session_state.inquiry_active_history_index = None
@@ -492,6 +656,16 @@ with st.sidebar:
                     st.session_state.inquiry_active_history_index = real_index
                     st.rerun()
 
+        # 3. 加载更早的记录 (keyset 分页，列表只是窗口缓存)
+        if st.session_state.history_cursors.get(_newer_key("inquiry")):
+            if st.button("⬆️ 回到最新的记录", key="newest_inquiry", use_container_width=True):
+                reset_history_window("inquiry")
+                st.rerun()
+        if st.session_state.history_cursors.get("inquiry"):
+            if st.button("⬇️ 加载更早的记录", key="more_inquiry", use_container_width=True):
+                load_more_history("inquiry", "inquiry_chat_history_list", "inquiry_active_history_index")
+                st.rerun()
+
     # 显示删除模式提示
     if st.session_state.delete_mode and st.session_state.delete_menu == menu:
         st.warning("⚠️ 已进入删除模式！点击对话标题即可删除。再次点击删除模式按钮退出。")
@@ -552,6 +726,17 @@ if "user_id" not in st.session_state:
                     st.session_state.s1_chat_history_list = s1_h
                     st.session_state.s3_chat_history_list = s3_h
                     st.session_state.inquiry_chat_history_list = iq_h
+                    # 满一页说明库里可能还有更早的记录，记下翻页游标
+                    st.session_state.history_cursors = {
+                        module: history_cursor(records[0]) if len(records) >= HISTORY_LIMIT else None
+                        for module, records in (("s1", s1_h), ("s3", s3_h), ("inquiry", iq_h))
+                    }
+                    # 令牌放进 URL：刷新页面时凭它恢复，不用重新登录
+                    token = create_session(uid, st.session_state.username, (s1_h, s3_h, iq_h),
+                                           st.session_state.history_cursors)
+                    st.session_state.session_token = token
+                    st.query_params["sid"] = token
+                    st.session_state.session_snapshot_sig = _snapshot_signature()
                     st.success(f"🎉 欢迎回来，{st.session_state.username}！")
                     st.rerun()
                 else:
@@ -566,9 +751,13 @@ if "user_id" not in st.session_state:
             with st.form("reg_form"):
                 ru = st.text_input("新用户名", key="reg_user")
                 rp = st.text_input("新密码", type="password", key="reg_pass")
+                # 按班级分库时，班级决定该学生数据落在哪个数据库文件，只能选已有的班级
+                classes = registration_classes()
+                rc = st.selectbox("班级（选填）", ["（不填）"] + classes, key="reg_class") if classes else None
+                rc = None if rc == "（不填）" else rc
                 rsub = st.form_submit_button("✅ 注册", use_container_width=True)
                 if rsub:
-                    ok, msg = register_user(ru, rp)
+                    ok, msg = register_user(ru, rp, class_name=rc or None)
                     if ok:
                         st.success(msg)
                         st.session_state.show_register = False
@@ -640,12 +829,12 @@ if menu == "🔍 网络智能诊断":
                         timestamp = datetime.now().strftime("%H:%M")
                         title = f"[{timestamp}] {topic}"
 
-                        # 2. 存入列表
-                        new_record = {"title": title, "content": response_text}
+                        # 2. 存入列表（id 为后台写入句柄，删除时按主键定位）
+                        new_record = {"id": None, "title": title, "content": response_text}
                         st.session_state.s1_chat_history_list.append(new_record)
 ####################################################################
                         if "user_id" in st.session_state:
-                            save_conversation(
+                            new_record["id"] = enqueue_save_conversation(
                                 user_id=st.session_state.user_id,
                                 module="s1",
                                 title=title,
@@ -653,12 +842,9 @@ if menu == "🔍 网络智能诊断":
                             )
 
 ###########################################################################
-                        # 3. 限制只存 10 条 (超过就把最旧的删掉)
-                        if len(st.session_state.s1_chat_history_list) > 10:
-                            st.session_state.s1_chat_history_list.pop(0)
-
-                        # 4. 重置查看状态为"当前"
+                        # 3. 重置查看状态为"当前" (列表是窗口缓存，超出部分通过侧边栏分页加载)
                         st.session_state.s1_active_history_index = None
+                        trim_history("s1")
         # 场景 B: 用户点击了侧边栏的历史记录 (查看旧存档)
         elif st.session_state.s1_active_history_index is not None:
             # 根据索引取出历史数据
@@ -667,7 +853,7 @@ if menu == "🔍 网络智能诊断":
                 with st.chat_message("assistant", avatar="🤖"):
                     # 显示标题提示这是历史
                     st.caption(f"📂 正在查看历史存档：{record['title']}")
-                    st.markdown(record["content"])
+                    st.markdown(history_body(record)["content"])
 
 
 
@@ -720,8 +906,20 @@ elif menu == "🎯 自适应实验工场":
         st.session_state.current_task_scored = False  # <--- 新增这行：重置计分状态，允许新任务加分
         st.session_state.s3_solution_text = ""  # <--- 新增：生成新题时，清空旧的答案记忆！
         with st.spinner(f"正在构建关于【{today_focus}】的拓扑环境..."):
-            # 调用 AI 生成任务
-            stream = st.session_state.ai_engine.generate_personalized_task(today_focus, level)
+            # 热门的（主题, 掌握度）组合后台已备好任务单，取一份现成的；否则现场生成
+            pooled_task = None
+            if get_task_pool() is not None:
+                get_task_pool().record_request(today_focus, level)
+                pooled_task = get_task_pool().take(today_focus, level)
+            # 只有完整的任务单才值得后台推测答案；错误提示、中途断开的不回调
+            completed_task = []
+            if pooled_task is not None:
+                stream = replay(pooled_task)
+                completed_task.append(pooled_task)  # 入池前已确认完整
+            else:
+                # 调用 AI 生成任务
+                stream = st.session_state.ai_engine.generate_personalized_task(
+                    today_focus, level, on_complete=completed_task.append)
             # 关键点：st.write_stream 会返回完整的生成文本，我们将它存入 session_state
             # 这样点击"查看答案"刷新页面后，题目文字才不会消失
             st.session_state.s3_task_text = st.write_stream(stream)
@@ -731,44 +929,47 @@ elif menu == "🎯 自适应实验工场":
             title = f"[{timestamp}] {today_focus}"
 
             # 2. 存入列表
-            new_record = {"title": title, "content": st.session_state.s3_task_text, "level": level, "solution": ""}
+            new_record = {"id": None, "title": title, "content": st.session_state.s3_task_text,
+                          "level": level, "solution": ""}
             st.session_state.s3_chat_history_list.append(new_record)
 
             if "user_id" in st.session_state:
-                save_conversation(
+                new_record["id"] = enqueue_save_conversation(
                     user_id=st.session_state.user_id,
                     module="s3",
                     title=title,
                     content=st.session_state.s3_task_text
                 )
+                # 学生做实验的这段时间里，后台先把参考答案写好
+                if completed_task and get_speculator() is not None:
+                    get_speculator().start(st.session_state.user_id, completed_task[0], new_record["id"])
 
 
 
 
 
-            # 3. 限制只存 10 条 (超过就把最旧的删掉)
-            if len(st.session_state.s3_chat_history_list) > 10:
-                st.session_state.s3_chat_history_list.pop(0)
-
-            # 4. 重置查看状态为"当前"
+            # 3. 重置查看状态为"当前" (列表是窗口缓存，超出部分通过侧边栏分页加载)
             st.session_state.s3_active_history_index = None
+            trim_history("s3")
 
     # 2. 负责显示任务 (添加历史记录查看逻辑)
     # 场景 A: 用户点击了侧边栏的历史记录 (查看旧存档)
     if st.session_state.s3_active_history_index is not None:
         # 根据索引取出历史数据
         record = st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index]
-        st.markdown(record["content"])
+        body = history_body(record)
+        st.markdown(body["content"])
         st.markdown("---")
 
-        # 显示历史答案（如果有）
-        if record.get("solution"):
+        # 显示历史答案（如果有；本次会话刚生成的答案优先）
+        solution = record.get("solution") or body.get("solution")
+        if solution:
             st.subheader("📝 历史参考答案与解析")
             with st.chat_message("assistant", avatar="🤖"):
-                st.markdown(record["solution"])
+                st.markdown(solution)
             # 设置答案已显示标志
             st.session_state.s3_show_answer = True
-            st.session_state.s3_solution_text = record["solution"]
+            st.session_state.s3_solution_text = solution
 
     # 2. 负责显示任务 (只要 session 里有题目，就一直显示，不管是刚生成的还是刷新后的)
     elif "s3_task_text" in st.session_state and st.session_state.s3_task_text:
@@ -793,7 +994,8 @@ elif menu == "🎯 自适应实验工场":
     # 3. 负责显示"查看答案"按钮 (只有存在题目时才显示这个按钮)
     if ("s3_task_text" in st.session_state and st.session_state.s3_task_text) or \
             (st.session_state.s3_active_history_index is not None and
-             st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index].get("solution")):
+             (st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index].get("solution") or
+              st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index].get("has_solution"))):
         st.markdown("---")
 
         # 这是一个开关逻辑：点击按钮，把开关打开
@@ -821,20 +1023,32 @@ elif menu == "🎯 自适应实验工场":
                         "solution"] = st.session_state.s3_solution_text
             # 场景 B：这是第一次点查看（内存是空的），需要生成并存储
             else:
+                # 后台推测生成的答案：已写完直接显示，已在输出就接上它的流，否则（或它卡住时）现场生成
+                speculation = None
+                if get_speculator() is not None and "user_id" in st.session_state:
+                    speculation = get_speculator().get(st.session_state.user_id, st.session_state.s3_task_text)
+                task_text = st.session_state.s3_task_text
+                answer = SolutionAnswer(speculation, lambda on_complete: st.session_state.ai_engine
+                                        .generate_task_solution(task_text, on_complete=on_complete))
                 with st.spinner("AI 正在撰写解题思路..."):
                     with st.chat_message("assistant", avatar="🤖"):
-                        ans_stream = st.session_state.ai_engine.generate_task_solution(
-                            st.session_state.s3_task_text)
-                        # 重点：生成完立刻存进去
-                        st.session_state.s3_solution_text = st.write_stream(ans_stream)
+                        st.write_stream(iter(answer))
+                # 重点：只记住完整的答案；出错 / 中断时留空，下次点“查看”重新生成
+                st.session_state.s3_solution_text = answer.text or ""
 
                 # --- (新增) 更新历史记录中的答案 ---
+                target_record = None
                 if st.session_state.s3_active_history_index is not None:
-                    st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index][
-                        "solution"] = st.session_state.s3_solution_text
+                    target_record = st.session_state.s3_chat_history_list[st.session_state.s3_active_history_index]
                 elif len(st.session_state.s3_chat_history_list) > 0:
                     # 如果当前是最新任务，更新最后一条记录
-                    st.session_state.s3_chat_history_list[-1]["solution"] = st.session_state.s3_solution_text
+                    target_record = st.session_state.s3_chat_history_list[-1]
+                if target_record is not None and answer.text:
+                    target_record["solution"] = answer.text
+                    # 按主键回写数据库，下次登录也能看到答案（推测生成的已由后台写过）
+                    if "user_id" in st.session_state and target_record.get("id") and not answer.stored:
+                        enqueue_update_solution(st.session_state.user_id, target_record["id"],
+                                                st.session_state.s3_solution_text)
 
 
 # ==================== 模块三：原理深度追问 (新增) ====================
@@ -858,23 +1072,20 @@ elif menu == "🧠 协议认知诊断":
             title = f"[{timestamp}] {concept}"
 
             # 存入列表
-            new_record = {"title": title, "content": response_text}
+            new_record = {"id": None, "title": title, "content": response_text}
             st.session_state.inquiry_chat_history_list.append(new_record)
 #################################################################################
             if "user_id" in st.session_state:
-                save_conversation(
+                new_record["id"] = enqueue_save_conversation(
                     user_id=st.session_state.user_id,
                     module="inquiry",
                     title=title,
                     content=response_text
                 )
 ###################################################################################
-            # 限制只存 10 条 (超过就把最旧的删掉)
-            if len(st.session_state.inquiry_chat_history_list) > 10:
-                st.session_state.inquiry_chat_history_list.pop(0)
-
-            # 重置查看状态为"当前"
+            # 重置查看状态为"当前" (列表是窗口缓存，超出部分通过侧边栏分页加载)
             st.session_state.inquiry_active_history_index = None
+            trim_history("inquiry")
         else:
             st.error("请输入概念名称")
 
@@ -886,7 +1097,7 @@ elif menu == "🧠 协议认知诊断":
         with st.chat_message("assistant", avatar="🤖"):
             # 显示标题提示这是历史
             st.caption(f"📂 正在查看历史存档：{record['title']}")
-            st.markdown(record["content"])
+            st.markdown(history_body(record)["content"])
 
     # 场景 B：没点按钮，但有历史记录（切换页面回来的情况）
     elif st.session_state.deep_inquiry_history:
@@ -902,4 +1113,7 @@ elif menu == "🧠 协议认知诊断":
 
                 请在上方输入你想要深入理解的网络概念（如 OSPF、ARP、TCP等），
                 我会用苏格拉底式教学法带你从原理层面攻克它！🚀
-                """)
\ No newline at end of file
+                """)
+
+# 本次运行里新建/删除的记录同步进会话快照
+sync_session_snapshot()
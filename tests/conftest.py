@@ -0,0 +1,44 @@
+# tests/conftest.py
+# 测试不需要 API 密钥、不连网：数据库都建在临时目录，上游换成 tests/fakes.py 的假客户端。
+# 运行：python -m pytest -q tests
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 必须在导入 utils 之前设置：回复缓存等进程级单例按首次使用时的路径建库
+_TMP = tempfile.mkdtemp(prefix="netarch_test_")
+os.environ["NETARCHITECT_DB_PATH"] = os.path.join(_TMP, "netarchitect.db")
+os.environ["DB_SHARDING"] = "off"
+os.environ.setdefault("AI_API_KEY", "test-key")
+os.environ.setdefault("AI_BASE_URL", "http://127.0.0.1:9/v1")
+
+from tests.fakes import FakeUpstream, ENGINE_DEPS  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """每个测试一个独立的主库"""
+    path = str(tmp_path / "netarchitect.db")
+    monkeypatch.setenv("NETARCHITECT_DB_PATH", path)
+    return path
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    """(假上游, 同步引擎, 异步引擎)，两个引擎的客户端都指向同一个假上游"""
+    for name in ENGINE_DEPS:
+        pytest.importorskip(name)
+    from utils.ai_engine import NetworkArchitectAI
+    from utils.ai_engine_async import get_async_ai_engine
+
+    upstream = FakeUpstream()
+    engine = NetworkArchitectAI()
+    engine.client = upstream.sync_client()
+    async_engine = get_async_ai_engine()
+    monkeypatch.setattr(async_engine, "client", upstream.async_client())
+    return upstream, engine, async_engine
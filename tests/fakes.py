@@ -0,0 +1,85 @@
+# tests/fakes.py
+# 假的 OpenAI 客户端（同步 / 异步）：按设定逐段返回流式分片，统计上游调用次数。
+# gate 关上时响应停在第一段之前，用来让多个请求同时处于“在途”状态；
+# hold 关上时停在第一段之后，用来让读取方只读到半截就离开。
+import asyncio
+import threading
+from types import SimpleNamespace
+
+# 引擎依赖的第三方包；没装时相关测试跳过
+ENGINE_DEPS = ("openai", "httpx", "dotenv", "streamlit")
+
+
+def _chunk(content=None, finish_reason=None):
+    delta = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+
+class FakeUpstream:
+    def __init__(self, pieces=("你好，", "世界"), error=None):
+        self.pieces = list(pieces)
+        self.error = error      # 设了就在发请求时抛出
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+        self.hold = threading.Event()
+        self.hold.set()
+        self._lock = threading.Lock()
+
+    @property
+    def text(self):
+        return "".join(self.pieces)
+
+    def _create(self):
+        with self._lock:
+            self.calls += 1
+        if self.error is not None:
+            raise self.error
+
+    def chunks(self):
+        return [_chunk(piece) for piece in self.pieces] + [_chunk(finish_reason="stop")]
+
+    def sync_client(self):
+        def create(model, messages, stream, **kwargs):
+            self._create()
+            return _SyncResponse(self)
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def async_client(self):
+        async def create(model, messages, stream, **kwargs):
+            self._create()
+            return _AsyncResponse(self)
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+class _SyncResponse:
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    def __iter__(self):
+        self.upstream.gate.wait()
+        for i, chunk in enumerate(self.upstream.chunks()):
+            if i == 1:
+                self.upstream.hold.wait()
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class _AsyncResponse:
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.to_thread(self.upstream.gate.wait)
+        for i, chunk in enumerate(self.upstream.chunks()):
+            if i == 1:
+                await asyncio.to_thread(self.upstream.hold.wait)
+            yield chunk
+
+    async def close(self):
+        pass
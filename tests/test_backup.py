@@ -0,0 +1,54 @@
+# tests/test_backup.py
+# 在线备份：写入不停的 WAL 库也能拷出完整一致的快照，轮换后每个库只留最近 N 份。
+import sqlite3
+import threading
+
+from utils import db_helper
+from utils.backup import BackupScheduler, backup_database
+
+
+def start_writer(db_path, stop):
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+        conn.executemany("INSERT INTO log (payload) VALUES (?)", [("预热" * 200,)] * 2000)
+    written = []
+
+    def run():
+        while not stop.is_set():
+            with db_helper.get_conn(db_path) as conn:
+                conn.executemany("INSERT INTO log (payload) VALUES (?)", [("上课中" * 100,)] * 20)
+            written.append(20)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, written
+
+
+def test_backup_of_a_live_wal_database_is_consistent(db_path, tmp_path):
+    stop = threading.Event()
+    thread, written = start_writer(db_path, stop)
+    try:
+        # 每步只拷几页，保证备份期间写线程插进来很多次
+        result = backup_database(db_path, tmp_path / "backups", keep=5, step_pages=4, step_sleep_ms=1)
+    finally:
+        stop.set()
+        thread.join(5)
+
+    assert sum(written) > 0
+    copy = sqlite3.connect(result["path"])
+    assert copy.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+    assert copy.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    count = copy.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+    assert 2000 <= count <= 2000 + sum(written) and count % 20 == 0  # 只含整批提交的事务
+    assert list((tmp_path / "backups").glob("*.tmp")) == []
+
+
+def test_rotation_keeps_exactly_n_snapshots(db_path, tmp_path):
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    scheduler = BackupScheduler(lambda: [db_path], tmp_path / "backups", interval_s=0, keep=3)
+    paths = [scheduler.run_once()[db_path]["path"] for _ in range(6)]
+
+    kept = sorted(str(p) for p in (tmp_path / "backups" / "netarchitect").glob("*.db"))
+    assert kept == paths[-3:]  # 留下的是最新的 3 份
+    assert scheduler.stats()["backups"] == 6 and scheduler.stats()["failed"] == 0
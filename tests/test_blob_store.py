@@ -0,0 +1,98 @@
+# tests/test_blob_store.py
+# 正文按内容哈希去重 + 压缩存储：同样的正文只存一份，最后一个引用消失时回收，解压后逐字节一致。
+import sqlite3
+
+import pytest
+
+from utils import db_helper
+from utils.blob_store import MIN_COMPRESS_BYTES, content_hash, pack, unpack
+from utils.db_helper import get_conn, init_db, insert_conversation
+from tests.test_migrations import BASELINE_SCHEMA
+
+TASK = "## 任务：VLAN 间路由\n\n" + "在三层交换机上为 VLAN 10/20 配置 SVI，并验证互通。\n" * 20
+# 换行符、全角空格、表情、结尾空白、组合字符……迁移后都必须原样保留
+TRICKY = ("Windows 换行\r\n\t制表符　全角空格 🚀 é 结尾空白   \n", "", "x" * MIN_COMPRESS_BYTES)
+
+
+def blob_refs(path, text):
+    row = sqlite3.connect(path).execute("SELECT refs FROM blobs WHERE hash = ?", (content_hash(text),)).fetchone()
+    return row[0] if row else 0
+
+
+def blob_count(path):
+    return sqlite3.connect(path).execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+
+@pytest.fixture
+def user_db(db_path):
+    init_db(db_path)
+    with get_conn(db_path) as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    return db_path
+
+
+@pytest.mark.parametrize("codec", ["raw", "zlib", "zstd"])
+@pytest.mark.parametrize("text", [TASK, "短文本", *TRICKY])
+def test_pack_unpack_round_trip(codec, text):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    digest, stored_codec, data = pack(text, codec)
+    assert digest == content_hash(text)
+    assert unpack(stored_codec, data) == text
+    if codec == "raw" or len(text.encode("utf-8")) < MIN_COMPRESS_BYTES:
+        assert stored_codec == "raw" and data == text.encode("utf-8")  # 指定不压缩，或太短不值得压缩
+
+
+def test_long_text_is_compressed():
+    _digest, codec, data = pack(TASK, "zlib")
+    assert codec == "zlib" and len(data) < len(TASK.encode("utf-8")) // 4
+
+
+def test_identical_bodies_share_one_blob(user_db):
+    with get_conn(user_db) as conn:
+        for i in range(30):  # 全班拿到同一份任务
+            insert_conversation(conn, 1, "s3", f"任务 {i}", TASK, "参考答案")
+    assert blob_count(user_db) == 2
+    assert blob_refs(user_db, TASK) == 30
+
+
+def test_last_reference_removes_the_blob(user_db):
+    with get_conn(user_db) as conn:
+        first = insert_conversation(conn, 1, "s3", "任务 1", TASK, "答案 A")
+        second = insert_conversation(conn, 1, "s3", "任务 2", TASK, None)
+    assert blob_refs(user_db, TASK) == 2
+
+    db_helper.update_conversation_solution(1, second, "答案 A")  # 换成已有的答案：共享同一份
+    assert blob_refs(user_db, "答案 A") == 2
+    db_helper.update_conversation_solution(1, first, "答案 B")
+    assert blob_refs(user_db, "答案 A") == 1 and blob_refs(user_db, "答案 B") == 1
+
+    db_helper.delete_conversation(1, first)
+    assert blob_refs(user_db, TASK) == 1
+    assert blob_refs(user_db, "答案 B") == 0  # 最后一个引用没了，行被删掉
+    # 不经过 db_helper 的删除（sqlite3 命令行）同样由触发器回收
+    conn = sqlite3.connect(user_db)
+    conn.execute("DELETE FROM conversations WHERE id = ?", (second,))
+    conn.commit()
+    assert blob_count(user_db) == 0
+
+
+def test_migration_keeps_text_byte_for_byte(db_path):
+    conn = sqlite3.connect(db_path)
+    for sql in BASELINE_SCHEMA:
+        conn.execute(sql)
+    conn.execute("PRAGMA user_version = 3")  # 第 4 版迁移之前：正文是 TEXT 列
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    rows = [(TASK, "参考答案\r\n"), (TASK, None), (TRICKY[0], TRICKY[0]), (TRICKY[1], ""), (TRICKY[2], None)]
+    conn.executemany("INSERT INTO conversations (user_id, module, title, content, solution) VALUES (1, 's3', 't', ?, ?)",
+                     rows)
+    conn.commit()
+    conn.close()
+
+    init_db(db_path)
+    for conv_id, (content, solution) in enumerate(rows, start=1):
+        body = db_helper.load_conversation_body(1, conv_id)
+        assert body["content"].encode("utf-8") == content.encode("utf-8")
+        assert body["solution"] == (solution or "")
+    assert blob_refs(db_path, TASK) == 2
+    assert blob_refs(db_path, TRICKY[0]) == 1  # refs 数的是引用它的行：正文和答案相同也只算一次
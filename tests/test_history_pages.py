@@ -0,0 +1,69 @@
+# tests/test_history_pages.py
+# 历史 keyset 分页：游标是 (created_at, id)，同一秒保存的多条记录跨页时既不重复也不遗漏。
+import pytest
+
+from utils import db_helper
+
+SAME_SECOND = "2024-03-01 08:00:00"
+EARLIER = "2024-02-28 21:30:00"
+
+
+@pytest.fixture
+def history(db_path):
+    """alice 的 s1 历史：30 条里 24 条落在同一秒，另有别的模块、别的用户的记录穿插其间"""
+    db_helper.init_db(db_path)
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x'), ('bob', 'x')")
+    alice, bob = 1, 2
+    mine = []
+    for i in range(30):
+        mine.append(db_helper.save_conversation(alice, "s1", f"实验 {i}", f"正文 {i}"))
+        db_helper.save_conversation(bob, "s1", f"bob {i}", "正文")
+        if i % 4 == 0:
+            db_helper.save_conversation(alice, "s3", f"排障 {i}", "正文")
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("UPDATE conversations SET created_at = ?", (SAME_SECOND,))
+        # 一部分早一些：同一页里既有整秒相同的，也有时间更早的
+        conn.executemany("UPDATE conversations SET created_at = ? WHERE id = ?",
+                         [(EARLIER, cid) for cid in mine[3:9]])
+    expected = sorted(mine, key=lambda cid: (SAME_SECOND if cid not in mine[3:9] else EARLIER, cid))
+    return alice, expected
+
+
+def page_through(user_id, first_page, limit):
+    """像侧边栏那样：首屏之后按最旧一条的游标一页页往前翻，返回旧→新的全部 id"""
+    records = first_page
+    pages = [records]
+    cursor = db_helper.history_cursor(records[0]) if records else None
+    while cursor is not None:
+        records, next_cursor = db_helper.load_conversation_page(user_id, "s1", before=cursor, limit=limit)
+        assert len(records) <= limit
+        pages.append(records)
+        cursor = next_cursor
+    return [record["id"] for page in reversed(pages) for record in page]
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 10, 24])
+def test_paging_across_identical_timestamps_has_no_duplicates_or_gaps(history, limit):
+    alice, expected = history
+    first_page, _next = db_helper.load_conversation_page(alice, "s1", limit=limit)
+    assert [r["id"] for r in first_page] == expected[-limit:]
+    ids = page_through(alice, first_page, limit)
+    assert len(ids) == len(set(ids))
+    assert ids == expected
+
+
+def test_login_snapshot_then_load_more(history):
+    # 登录时三个模块一次查出首屏，之后从首屏最旧一条接着翻
+    alice, expected = history
+    s1, _s3, _inquiry = db_helper.load_user_conversations(alice, limit=5)
+    assert [r["created_at"] for r in s1] == [SAME_SECOND] * 5
+    assert page_through(alice, s1, limit=5) == expected
+
+
+def test_last_page_reports_no_more(history):
+    alice, expected = history
+    page, cursor = db_helper.load_conversation_page(alice, "s1", limit=len(expected))
+    assert [r["id"] for r in page] == expected and cursor is None
+    oldest = db_helper.history_cursor(page[0])
+    assert db_helper.load_conversation_page(alice, "s1", before=oldest) == ([], None)
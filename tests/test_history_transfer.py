@@ -0,0 +1,113 @@
+# tests/test_history_transfer.py
+# 导出 / 导入往返：从未分库的老库导出，导入到按班级分库的新部署，
+# user_id 重新分配、正文逐字节一致、锁定账号（"!"）导入后仍然锁定。
+import sqlite3
+
+from utils import db_helper, history_transfer
+from utils.history_transfer import LOCKED_PASSWORD, Importer, export_jsonl, import_jsonl
+from utils.password_hash import hash_password
+
+BODIES = {
+    "long": "### 🎯 今日挑战目标\n" + "配置 OSPF 区域 0 并验证邻居状态。\r\n" * 300,
+    "spaces": "  行首空格\t制表符\n\n行尾空格   \n",
+    "emoji": "排障 ✅ → ❌ 𝔸𝔹 ​ 零宽空格",
+    "tiny": "x",
+}
+
+
+def make_source(path):
+    """老库：alice 有正常的 scrypt 哈希，bob 是早先导入时锁住的账号，carol 没有对话"""
+    db_helper.init_db(path)
+    with db_helper.get_conn(path) as conn:
+        conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                         [("alice", hash_password("alice-pw")), ("bob", LOCKED_PASSWORD), ("carol", hash_password("c"))])
+        rows = [(1, "s1", "长正文", BODIES["long"], None), (1, "s3", "答案带空白", BODIES["spaces"], BODIES["emoji"]),
+                (2, "inquiry", "短", BODIES["tiny"], ""), (2, "s1", "同一份正文", BODIES["long"], None)]
+        for uid, module, title, content, solution in rows:
+            db_helper.insert_conversation(conn, uid, module, title, content, solution, "2024-03-01 08:00:00")
+    # 空答案写库时就记成没有答案（solution_hash 为 NULL）
+    return {(name, module, title, content, solution or None)
+            for (uid, module, title, content, solution), name in zip(rows, ("alice", "alice", "bob", "bob"))}
+
+
+def use_class_sharding(monkeypatch, db_path):
+    # history_transfer 在导入时就拿到了 SHARDING_MODE，两边都要改
+    monkeypatch.setattr(db_helper, "SHARDING_MODE", "class")
+    monkeypatch.setattr(history_transfer, "SHARDING_MODE", "class")
+    monkeypatch.setattr(db_helper, "CONFIGURED_CLASSES", ("网络1班",))
+    monkeypatch.setattr(db_helper, "_directory_ready", False)
+    monkeypatch.setattr(db_helper, "_ready_shards", set())
+    monkeypatch.setattr(db_helper, "_user_shard_cache", {})
+    db_helper.init_db(db_path)
+
+
+def stored_hash(username):
+    user_id = db_helper.find_user_id(username)
+    with db_helper.get_conn(db_helper.user_db_path(user_id)) as conn:
+        return conn.execute("SELECT password_hash FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+
+def imported_conversations():
+    paths = history_transfer.source_paths()
+    return {(c["username"], c["module"], c["title"], c["content"], c["solution"])
+            for c in history_transfer.iter_all_conversations(paths)}
+
+
+def test_unsharded_export_imports_into_a_sharded_deployment(db_path, tmp_path, monkeypatch):
+    source = str(tmp_path / "old.db")
+    expected = make_source(source)
+    dump = str(tmp_path / "history.jsonl.gz")
+    assert export_jsonl(source, dump, include_credentials=True) == {"user": 3, "conversation": 4}
+
+    use_class_sharding(monkeypatch, db_path)
+    # 新部署里已经有两个老师账号：导入的学生拿到的是目录库分配的新 id
+    assert db_helper.register_user("teacher1", "pw", "网络1班")[0]
+    assert db_helper.register_user("teacher2", "pw", "网络1班")[0]
+    stats = import_jsonl(None, dump)
+    assert stats == {"users_created": 3, "users_existing": 0, "users_locked": 1, "conversations": 4, "skipped": 0}
+
+    ids = {name: db_helper.find_user_id(name) for name in ("alice", "bob", "carol")}
+    assert sorted(ids.values()) == [3, 4, 5]  # 源库里是 1、2、3
+    for user_id in ids.values():
+        assert db_helper.user_db_path(user_id).startswith(str(tmp_path / "shards"))
+    assert sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 0
+
+    assert imported_conversations() == expected  # 正文逐字节一致（含 \r\n、首尾空白、emoji）
+    titles = {c["title"]: c["user_id"] for c in history_transfer.iter_all_conversations(history_transfer.source_paths())}
+    assert titles["长正文"] == ids["alice"] and titles["短"] == ids["bob"]
+
+    # 哈希原样保留：alice 能用原密码登录，锁定的 bob 仍然锁定
+    assert stored_hash("bob") == LOCKED_PASSWORD
+    assert db_helper.authenticate_user("alice", "alice-pw") == ids["alice"]
+    assert db_helper.authenticate_user("bob", "") is None
+    assert db_helper.authenticate_user("bob", LOCKED_PASSWORD) is None
+
+
+def test_export_without_credentials_imports_locked_accounts(db_path, tmp_path, monkeypatch):
+    source = str(tmp_path / "old.db")
+    make_source(source)
+    dump = str(tmp_path / "history.jsonl")
+    export_jsonl(source, dump)
+    assert "scrypt$" not in open(dump, encoding="utf-8").read()
+
+    use_class_sharding(monkeypatch, db_path)
+    assert import_jsonl(None, dump)["users_locked"] == 3
+    assert all(stored_hash(name) == LOCKED_PASSWORD for name in ("alice", "bob", "carol"))
+    assert db_helper.authenticate_user("alice", "alice-pw") is None
+
+
+def test_reimport_reuses_existing_accounts(db_path, tmp_path, monkeypatch):
+    source = str(tmp_path / "old.db")
+    make_source(source)
+    dump = str(tmp_path / "history.jsonl")
+    export_jsonl(source, dump, include_credentials=True)
+    use_class_sharding(monkeypatch, db_path)
+    import_jsonl(None, dump)
+    alice = db_helper.find_user_id("alice")
+
+    importer = Importer(None)
+    importer.add("user", {"id": 1, "username": "alice", "password_hash": LOCKED_PASSWORD})
+    importer.add("conversation", {"user_id": 1, "module": "s1", "title": "补录", "content": "补录正文"})
+    assert importer.finish()["users_existing"] == 1
+    assert importer.user_map == {1: alice}
+    assert db_helper.authenticate_user("alice", "alice-pw") == alice  # 已有账号的密码不被覆盖
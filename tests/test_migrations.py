@@ -0,0 +1,65 @@
+# tests/test_migrations.py
+# 原始版本（未做迁移、正文直接存在 conversations 里）的数据库原地升级到最新 schema。
+import sqlite3
+
+from utils import db_helper
+from utils.db_helper import SCHEMA_VERSION, init_db, insert_conversation, get_conn
+
+BASELINE_SCHEMA = (
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        module TEXT NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        solution TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )""",
+)
+SHARED = "交换机 trunk 配置：switchport mode trunk"
+
+
+def make_baseline(path):
+    conn = sqlite3.connect(path)
+    for sql in BASELINE_SCHEMA:
+        conn.execute(sql)
+    conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    conn.executemany("INSERT INTO conversations (user_id, module, title, content, solution) VALUES (?, ?, ?, ?, ?)", [
+        (1, "s1", "VLAN 划分", SHARED, None),
+        (1, "s3", "Trunk 实验", SHARED, "参考答案：允许 VLAN 10,20 通过"),
+        (1, "inquiry", "OSPF DR 选举", "为什么要选 DR？", None),
+        (1, "s1", "已删除", "这条会被删掉", None),
+    ])
+    conn.execute("DELETE FROM conversations WHERE id = 4")  # 自增游标停在 4，最大 id 是 3
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_upgrades_to_latest(db_path):
+    make_baseline(db_path)
+    assert init_db(db_path) == SCHEMA_VERSION
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    rows = conn.execute("SELECT id, title FROM conversations ORDER BY id").fetchall()
+    assert rows == [(1, "VLAN 划分"), (2, "Trunk 实验"), (3, "OSPF DR 选举")]
+    assert db_helper.load_conversation_body(1, 2)["solution"] == "参考答案：允许 VLAN 10,20 通过"
+    # 再跑一次是空操作
+    assert init_db(db_path) == SCHEMA_VERSION
+
+
+def test_autoincrement_sequence_survives_rebuild(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    seq = sqlite3.connect(db_path).execute("SELECT seq FROM sqlite_sequence WHERE name = 'conversations'").fetchone()
+    assert seq == (4,)
+    # 已删除的 id 4 不会被复用
+    with get_conn(db_path) as conn:
+        assert insert_conversation(conn, 1, "s1", "新记录", "新内容") == 5
+
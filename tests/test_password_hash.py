@@ -0,0 +1,86 @@
+# tests/test_password_hash.py
+# 密码哈希与登录：scrypt 校验、旧 SHA-256 记录登录后自动升级、锁定账号（"!"）永远登不上。
+import hashlib
+import sqlite3
+
+import pytest
+
+from utils import db_helper
+from utils.password_hash import SCRYPT_N, hash_password, is_legacy, verify_password
+from utils.history_transfer import LOCKED_PASSWORD
+
+
+def legacy_hash(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def test_scrypt_hash_and_verify():
+    stored = hash_password("Passw0rd!")
+    assert stored.startswith(f"scrypt${SCRYPT_N}$") and not is_legacy(stored)
+    assert stored != hash_password("Passw0rd!")  # 每次随机盐
+    assert verify_password("Passw0rd!", stored) == (True, False)
+
+
+@pytest.mark.parametrize("stored", [hash_password("Passw0rd!"), legacy_hash("Passw0rd!")])
+def test_wrong_password_is_rejected(stored):
+    assert verify_password("passw0rd!", stored) == (False, False)
+    assert verify_password("", stored) == (False, False)
+
+
+def test_needs_rehash_for_legacy_and_weaker_params():
+    assert verify_password("Passw0rd!", legacy_hash("Passw0rd!")) == (True, True)
+    weaker = hash_password("Passw0rd!", n=SCRYPT_N // 2)
+    assert verify_password("Passw0rd!", weaker) == (True, True)
+    # 升级只在密码正确时发生
+    assert verify_password("wrong", weaker) == (False, False)
+
+
+@pytest.mark.parametrize("password", ["", "!", LOCKED_PASSWORD, legacy_hash("!")])
+def test_locked_hash_never_verifies(password):
+    assert verify_password(password, LOCKED_PASSWORD) == (False, False)
+
+
+def test_malformed_scrypt_record_is_rejected():
+    assert verify_password("x", "scrypt$16384$8$1$not-base64") == (False, False)
+
+
+@pytest.fixture
+def users(db_path):
+    db_helper.init_db(db_path)
+    with db_helper.get_conn(db_path) as conn:
+        conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)", [
+            ("legacy", legacy_hash("old-secret")),
+            ("locked", LOCKED_PASSWORD),
+        ])
+    return db_path
+
+
+def stored_hash(db_path, username):
+    return sqlite3.connect(db_path).execute("SELECT password_hash FROM users WHERE username = ?",
+                                            (username,)).fetchone()[0]
+
+
+def test_legacy_row_is_rehashed_on_login(users):
+    assert db_helper.authenticate_user("legacy", "wrong") is None
+    assert stored_hash(users, "legacy") == legacy_hash("old-secret")  # 密码错误不动库
+
+    user_id = db_helper.authenticate_user("legacy", "old-secret")
+    assert user_id == 1
+    db_helper.flush_writes(5)
+    upgraded = stored_hash(users, "legacy")
+    assert not is_legacy(upgraded) and verify_password("old-secret", upgraded) == (True, False)
+    assert db_helper.authenticate_user("legacy", "old-secret") == user_id
+
+
+def test_register_and_login(users):
+    assert db_helper.register_user("alice", "s3cret") == (True, "注册成功！请登录")
+    assert db_helper.register_user("alice", "other") == (False, "用户名已存在")
+    assert not is_legacy(stored_hash(users, "alice"))
+    assert db_helper.authenticate_user("alice", "s3cret") is not None
+    assert db_helper.authenticate_user("alice", "S3cret") is None
+
+
+def test_locked_account_and_unknown_user_cannot_log_in(users):
+    for password in ("", "!", LOCKED_PASSWORD):
+        assert db_helper.authenticate_user("locked", password) is None
+    assert db_helper.authenticate_user("nobody", "whatever") is None
@@ -0,0 +1,129 @@
+# tests/test_resilience.py
+# 熔断器状态机（注入可拨动的时钟）：closed -> open -> half_open -> closed / open，
+# 以及引擎在熔断打开时不再打上游、冷却后由一个探测请求决定是否恢复。
+import random
+import uuid
+
+import pytest
+
+from utils.resilience import CLOSED, OPEN, HALF_OPEN, CircuitBreaker, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_success()  # 成功一次，连续失败计数清零
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1 and breaker.stats()["opened"] == 1
+
+
+def test_half_opens_after_cooldown_with_a_single_probe(breaker, clock):
+    trip(breaker)
+    clock.advance(29.9)
+    assert not breaker.allow() and breaker.state == OPEN
+    clock.advance(0.1)
+    assert breaker.allow()  # 探测请求
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow() and not breaker.allow()  # 探测在途时其余请求仍被拒绝
+    assert breaker.stats()["half_opened"] == 1
+
+
+def test_successful_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert all(breaker.allow() for _ in range(5))
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_failed_probe_reopens_for_a_full_cooldown(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_failure()  # 一次失败就重新打开，不必再攒满阈值
+    assert breaker.state == OPEN
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert breaker.stats()["opened"] == 2
+
+
+def test_state_does_not_advance_without_a_request(breaker, clock):
+    # 推测生成和任务池只看 state：冷却结束但还没有请求探测时，仍按 open 处理
+    trip(breaker)
+    clock.advance(60)
+    assert breaker.state == OPEN
+    assert breaker.stats()["state_for_s"] == 60
+
+
+def test_backoff_delay_is_bounded():
+    rng = random.Random(7)
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=0.5, cap=8, rng=rng)
+        assert 0 <= delay <= min(8, 0.5 * 2 ** attempt)
+
+
+def test_engine_fails_fast_while_open_and_recovers_after_probe(engines, clock, monkeypatch):
+    from openai import APIConnectionError
+    from utils import ai_engine
+
+    upstream, engine, _async_engine = engines
+    monkeypatch.setattr(ai_engine, "backoff_delay", lambda attempt: 0)
+    engine.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    upstream.error = APIConnectionError(request=None)
+
+    def ask():
+        messages = [{"role": "user", "content": f"STP 根桥 {uuid.uuid4()}"}]  # 不命中缓存
+        return "".join(engine._chat_stream(messages))
+
+    for _ in range(2):
+        assert "AI 连接中断" in ask()
+    assert engine.breaker.state == OPEN
+    calls = upstream.calls
+    assert calls == 2 * (ai_engine.MAX_RETRIES + 1)
+
+    assert "AI 服务暂时不可用" in ask()
+    assert upstream.calls == calls  # 熔断期间不打上游
+
+    upstream.error = None
+    clock.advance(30)
+    assert ask() == upstream.text  # 探测成功
+    assert engine.breaker.state == CLOSED and upstream.calls == calls + 1
@@ -0,0 +1,74 @@
+# tests/test_search.py
+# 历史记录全文检索：按用户过滤、摘要取自命中的列；不依赖自定义 SQL 函数。
+import sqlite3
+
+from utils import db_helper
+from utils.db_helper import init_db
+from tests.test_migrations import make_baseline
+
+
+def test_search_index_built_and_plain_connections_can_write(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    hits = db_helper.search_conversations(1, "trunk")
+    assert sorted(hit["id"] for hit in hits) == [1, 2]
+    hit = db_helper.search_conversations(1, "VLAN 10")[0]
+    assert hit["id"] == 2 and "**" in hit["snippet"]  # 只有答案命中时摘要取自答案
+    # 没注册任何自定义函数的连接（sqlite3 命令行、备份工具）也能改删对话
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE conversations SET title = 'x' WHERE id = 3")
+    conn.execute("DELETE FROM conversations WHERE id = 3")
+    conn.commit()
+    assert [hit["id"] for hit in db_helper.search_conversations(1, "为什么要选")] == []
+
+
+def test_index_keeps_no_copy_of_the_text(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'conversations_fts_content'").fetchone() is None
+    # contentless 表读不出原文，摘要全靠解压 blobs
+    assert conn.execute("SELECT content FROM conversations_fts WHERE rowid = 1").fetchone() == (None,)
+
+
+def test_updates_and_deletes_keep_the_index_in_step(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    db_helper.update_conversation_solution(1, 2, "参考答案：native vlan 99")
+    assert db_helper.search_conversations(1, "允许 VLAN") == []
+    hit = db_helper.search_conversations(1, "native")[0]
+    assert hit["id"] == 2 and "**native**" in hit["snippet"]
+
+    db_helper.delete_conversation(1, 2)
+    assert db_helper.search_conversations(1, "native") == []
+    assert [hit["id"] for hit in db_helper.search_conversations(1, "trunk")] == [1]
+    # 'delete' 命令带的旧值和写入时一致，索引没有被弄坏
+    sqlite3.connect(db_path).execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('integrity-check')")
+
+
+def test_short_terms_and_other_users(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('bob', 'x')")
+        db_helper.insert_conversation(conn, 2, "s1", "DR 选举", "为什么要选 DR？")
+    assert [hit["id"] for hit in db_helper.search_conversations(1, "DR")] == [3]
+    hit = db_helper.search_conversations(2, "dr")[0]
+    assert hit["title_hl"] == "**DR** 选举"
+    long_text = "前言" * 100 + "生成树协议 STP 防环" + "后记" * 100
+    with db_helper.get_conn(db_path) as conn:
+        conv_id = db_helper.insert_conversation(conn, 1, "inquiry", "长文", long_text)
+    hit = db_helper.search_conversations(1, "STP")[0]
+    snippet = hit["snippet"]
+    assert hit["id"] == conv_id
+    assert snippet.startswith("…") and snippet.endswith("…") and "**STP**" in snippet
+    assert len(snippet) < 60
+
+
+def test_trigrams_in_any_order_are_not_a_hit(db_path):
+    make_baseline(db_path)
+    init_db(db_path)
+    # "runk trun" 含 trunk 的全部三字组，但原文里没有 "runk trun"
+    with db_helper.get_conn(db_path) as conn:
+        db_helper.insert_conversation(conn, 1, "s1", "乱序", "runk trun")
+    assert [hit["id"] for hit in db_helper.search_conversations(1, "trunk")] == [2, 1]
@@ -0,0 +1,122 @@
+# tests/test_semantic_cache.py
+# 概念追问的近似缓存：换个问法能命中，协议名相同但问的方面不同的不能命中；
+# 讲解过期 / 被淘汰后不再返回，并发 add 不会在索引里留下重复。
+import time
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from utils import llm_cache  # noqa: E402
+from utils.llm_cache import ResponseCache  # noqa: E402
+from utils.semantic_cache import THRESHOLD, ConceptIndex, SemanticQuizCache  # noqa: E402
+
+KNOWN = ("TCP三次握手", "什么是 ARP", "VLAN 间路由", "OSPF 的 DR/BDR 选举", "TCP四次挥手", "STP 根桥选举")
+
+
+@pytest.fixture
+def index():
+    index = ConceptIndex()
+    for concept in KNOWN:
+        index.add(concept, concept)
+    return index
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("TCP三次握手的原因", "TCP三次握手"),
+    ("为什么 TCP 需要三次握手？", "TCP三次握手"),
+    ("tcp 三次握手是什么", "TCP三次握手"),
+    ("OSPF中DR选举", "OSPF 的 DR/BDR 选举"),
+])
+def test_paraphrase_hits(index, question, expected):
+    hit = index.lookup(question)
+    assert hit is not None and hit[1] == expected and hit[0] >= THRESHOLD
+
+
+@pytest.mark.parametrize("question, nearest", [
+    ("ARP 欺骗", "什么是 ARP"),        # 多出来的“欺骗”才是要问的
+    ("VLAN", "VLAN 间路由"),           # 已有概念多出来的“间路由”没被问到
+    ("TCP 四次挥手的过程", "TCP四次挥手"),
+    ("STP 端口状态", "STP 根桥选举"),
+])
+def test_near_miss_is_rejected_by_the_coverage_gate(index, question, nearest):
+    score, concept, _ = index.search(question, 1)[0]
+    assert concept == nearest and score < THRESHOLD
+    assert index.lookup(question) is None
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()  # 重建索引时 semantic_cache 按真实时间筛选未过期的条目
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    responses = ResponseCache(str(tmp_path / "llm_cache.db"), **kwargs)
+    return responses, SemanticQuizCache(responses)
+
+
+def remember(responses, semantic, concept, text):
+    key = f"key:{concept}"
+    responses.put(key, "test-model", text)
+    semantic.add(concept, key)
+    return key
+
+
+def test_expired_explanation_is_not_served(tmp_path, clock):
+    responses, semantic = make_cache(tmp_path, ttl_hours=1)
+    remember(responses, semantic, "TCP三次握手", "讲解 v1")
+    assert semantic.get("TCP三次握手的原因")[0] == "讲解 v1"
+
+    clock.now += 3601
+    assert semantic.get("TCP三次握手的原因") is None
+    assert semantic.stats()["stale"] == 1
+    # 换个问法重新生成后，即使过期的那条相似度更高也能命中新的
+    remember(responses, semantic, "为什么 TCP 需要三次握手", "讲解 v2")
+    assert semantic.get("TCP三次握手")[0] == "讲解 v2"
+
+
+def test_evicted_explanation_is_not_served_or_reloaded(tmp_path, clock):
+    responses, semantic = make_cache(tmp_path, memory_size=1, max_rows=2)
+    for i, concept in enumerate(KNOWN[:3]):
+        clock.now += 1
+        remember(responses, semantic, concept, f"讲解 {i}")
+    responses.prune()  # 超出 max_rows：最久未用的 “TCP三次握手” 被淘汰
+    assert semantic.get("TCP三次握手的原因") is None
+    assert semantic.get("VLAN 间路由")[0] == "讲解 2"
+
+    # 重启后只重建讲解还在的概念
+    reloaded = SemanticQuizCache(responses)
+    assert len(reloaded.index) == 2
+    rows = sqlite3.connect(responses.db_path).execute("SELECT concept FROM quiz_concepts ORDER BY concept").fetchall()
+    assert rows == [("VLAN 间路由",), ("什么是 ARP",)]
+
+
+def test_concurrent_add_indexes_a_concept_once(tmp_path):
+    responses, semantic = make_cache(tmp_path)
+    responses.put("k", "test-model", "讲解")
+    barrier = threading.Barrier(16)
+
+    def add():
+        barrier.wait()
+        semantic.add("TCP三次握手", "k")
+
+    threads = [threading.Thread(target=add) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(semantic.index) == 1
+    assert [hit[1] for hit in semantic.index.search("TCP三次握手", 5)] == ["TCP三次握手"]
@@ -0,0 +1,91 @@
+# tests/test_sessions.py
+# 持久登录会话：令牌 "<user_id>.<随机串>"，库里只存随机串的 sha256；过期、退出登录后都不能再恢复。
+import glob
+import hashlib
+import sqlite3
+
+import pytest
+
+from utils import db_helper
+
+HISTORIES = (
+    [{"id": 1, "title": "VLAN 划分", "created_at": "2024-03-01 08:00:00"}],
+    [{"id": 2, "title": "Trunk 实验", "created_at": "2024-03-01 09:00:00", "solution": "参考答案"}],
+    [],
+)
+CURSORS = {"s1": ("2024-03-01 08:00:00", 1), "s3": None}
+
+
+@pytest.fixture
+def user(db_path):
+    db_helper.init_db(db_path)
+    with db_helper.get_conn(db_path) as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    return 1
+
+
+def session_rows(db_path):
+    return sqlite3.connect(db_path).execute("SELECT token_hash, user_id FROM sessions").fetchall()
+
+
+def test_create_then_restore(user):
+    token = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    restored = db_helper.restore_session(token)
+    assert restored["user_id"] == user and restored["username"] == "alice"
+    s1, s3, inquiry = restored["histories"]
+    assert s1 == HISTORIES[0] and inquiry == []
+    # 快照只有标题等元数据：答案正文不进快照，只留 has_solution 标记
+    assert s3 == [{"id": 2, "title": "Trunk 实验", "created_at": "2024-03-01 09:00:00", "has_solution": True}]
+    assert restored["cursors"] == CURSORS
+
+
+def test_snapshot_refresh_resolves_queued_ids(user):
+    token = db_helper.create_session(user, "alice", ([], [], []), {})
+    op = db_helper.enqueue_save_conversation(user, "s1", "新记录", "正文")
+    db_helper.enqueue_session_snapshot(token, ([{"id": op, "title": "新记录"}], [], []), {})
+    restored = db_helper.restore_session(token)
+    assert restored["histories"][0] == [{"id": op.result_id(5), "title": "新记录"}]
+
+
+@pytest.mark.parametrize("forge", [
+    lambda token: token[:-1] + ("A" if token[-1] != "A" else "B"),  # 随机串不对
+    lambda token: "2." + token.partition(".")[2],                     # 拿别人的 user_id
+    lambda token: token.partition(".")[2],                            # 缺 user_id
+    lambda token: "1.",
+    lambda token: "",
+])
+def test_forged_tokens_are_rejected(user, forge):
+    token = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    assert db_helper.restore_session(forge(token)) is None
+    assert db_helper.restore_session(token) is not None
+
+
+def test_expired_token_is_rejected_and_pruned(user, db_path, monkeypatch):
+    live = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    monkeypatch.setattr(db_helper, "SESSION_TTL_HOURS", -1)
+    expired = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    assert len(session_rows(db_path)) == 2
+
+    assert db_helper.restore_session(expired) is None
+    assert [row[0] for row in session_rows(db_path)] == [db_helper._parse_token(live)[1]]
+    # 新建会话时也会清理所有已过期的
+    db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    assert db_helper._parse_token(expired)[1] not in [row[0] for row in session_rows(db_path)]
+
+
+def test_logout_revokes_the_token(user, db_path):
+    token = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    other = db_helper.create_session(user, "alice", HISTORIES, CURSORS)  # 另一台设备
+    db_helper.delete_session(token)
+    assert db_helper.restore_session(token) is None
+    assert db_helper.restore_session(other) is not None
+
+
+def test_only_the_secret_hash_is_stored(user, db_path):
+    token = db_helper.create_session(user, "alice", HISTORIES, CURSORS)
+    secret = token.partition(".")[2]
+    assert session_rows(db_path) == [(hashlib.sha256(secret.encode()).hexdigest(), user)]
+    # 主库文件和 WAL 里都找不到明文随机串
+    for path in glob.glob(db_path + "*"):
+        with open(path, "rb") as f:
+            assert secret.encode() not in f.read()
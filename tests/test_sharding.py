@@ -0,0 +1,113 @@
+# tests/test_sharding.py
+# 分库：目录库分配全局 user_id，按班级（没填班级按哈希）把用户放进各自的分片，读写都路由到该分片。
+import os
+import sqlite3
+
+import pytest
+
+from utils import db_helper
+
+
+@pytest.fixture
+def sharded(db_path, monkeypatch):
+    monkeypatch.setattr(db_helper, "SHARDING_MODE", "class")
+    monkeypatch.setattr(db_helper, "CONFIGURED_CLASSES", ("网络1班", "网络2班"))
+    monkeypatch.setattr(db_helper, "_directory_ready", False)
+    monkeypatch.setattr(db_helper, "_ready_shards", set())
+    monkeypatch.setattr(db_helper, "_user_shard_cache", {})
+    db_helper.init_db(db_path)
+    return db_path
+
+
+def account(username):
+    with db_helper.get_conn(db_helper.get_directory_path()) as conn:
+        return conn.execute("SELECT id, shard, class_name FROM accounts WHERE username = ?", (username,)).fetchone()
+
+
+def shard_users(shard):
+    path = db_helper.shard_path(shard)
+    if not os.path.exists(path):
+        return []
+    return [row[0] for row in sqlite3.connect(path).execute("SELECT username FROM users ORDER BY id")]
+
+
+def test_users_land_on_their_class_shard(sharded):
+    assert db_helper.register_user("alice", "pw", "网络1班")[0]
+    assert db_helper.register_user("bob", "pw", "网络2班")[0]
+    assert db_helper.register_user("carol", "pw", "网络1班")[0]
+    assert account("alice")[1:] == ("class_网络1班", "网络1班")
+    assert shard_users("class_网络1班") == ["alice", "carol"]
+    assert shard_users("class_网络2班") == ["bob"]
+    assert db_helper.account_classes([account("alice")[0], account("bob")[0]]) == {
+        account("alice")[0]: "网络1班", account("bob")[0]: "网络2班"}
+    # 主库里没有分片用户
+    assert sqlite3.connect(sharded).execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+
+def test_user_without_class_falls_back_to_hash_shard(sharded):
+    assert db_helper.register_user("dave", "pw")[0]
+    user_id, shard, class_name = account("dave")
+    assert shard == f"hash_{user_id % db_helper.SHARD_COUNT:02d}" and class_name is None
+    assert shard_users(shard) == ["dave"]
+
+
+def test_unknown_class_and_duplicate_names_are_rejected(sharded):
+    assert db_helper.register_user("eve", "pw", "../../etc") == (False, "没有这个班级，请从列表中选择或联系老师")
+    assert account("eve") is None
+    assert db_helper.register_user("eve", "pw", "网络1班")[0]
+    assert db_helper.register_user("eve", "pw", "网络2班") == (False, "用户名已存在")
+    assert db_helper.registration_classes() == ["网络1班", "网络2班"]
+
+
+def test_registration_rolls_back_when_the_shard_insert_fails(sharded, monkeypatch):
+    real_ensure = db_helper._ensure_shard
+
+    def broken_shard(path):
+        if path.endswith("class_网络2班.db"):
+            raise sqlite3.OperationalError("disk I/O error")
+        real_ensure(path)
+
+    monkeypatch.setattr(db_helper, "_ensure_shard", broken_shard)
+    with pytest.raises(sqlite3.OperationalError):
+        db_helper.register_user("frank", "pw", "网络2班")
+    assert account("frank") is None  # 目录里没有留下登不上的账号
+
+    with pytest.raises(sqlite3.OperationalError):
+        db_helper.register_users_bulk([("gina", "hash-g", "网络1班"), ("hank", "hash-h", "网络2班")])
+    assert account("hank") is None
+    assert shard_users("class_网络2班") == []
+    assert account("gina") is not None and shard_users("class_网络1班") == ["gina"]  # 写成功的分片保留
+
+    monkeypatch.setattr(db_helper, "_ensure_shard", real_ensure)
+    assert db_helper.register_user("frank", "pw", "网络2班")[0]
+    assert shard_users("class_网络2班") == ["frank"]
+
+
+def test_reads_and_writes_go_to_the_users_shard(sharded):
+    db_helper.register_user("alice", "pw", "网络1班")
+    db_helper.register_user("bob", "pw", "网络2班")
+    alice = db_helper.authenticate_user("alice", "pw")
+    bob = db_helper.authenticate_user("bob", "pw")
+    assert alice == account("alice")[0] and bob == account("bob")[0]
+    assert db_helper.authenticate_user("alice", "wrong") is None
+
+    db_helper.save_conversation(alice, "s1", "VLAN 划分", "alice 的 trunk 笔记")
+    db_helper.enqueue_save_conversation(bob, "s1", "OSPF", "bob 的 trunk 笔记").result_id(5)
+    assert db_helper.user_db_path(alice) == db_helper.shard_path("class_网络1班")
+    assert [r["title"] for r in db_helper.load_user_conversations(alice)[0]] == ["VLAN 划分"]
+    assert [r["title"] for r in db_helper.load_user_conversations(bob)[0]] == ["OSPF"]
+    assert [hit["title"] for hit in db_helper.search_conversations(bob, "trunk")] == ["OSPF"]
+    count = "SELECT COUNT(*) FROM conversations"
+    assert sqlite3.connect(db_helper.shard_path("class_网络1班")).execute(count).fetchone()[0] == 1
+    assert sqlite3.connect(sharded).execute(count).fetchone()[0] == 0
+
+
+def test_legacy_main_db_user_keeps_working(sharded):
+    with db_helper.get_conn(sharded) as conn:
+        conn.execute("INSERT INTO users (username, password_hash) VALUES ('old', ?)",
+                     (db_helper.hash_password_pooled("pw"),))
+    user_id = db_helper.authenticate_user("old", "pw")
+    assert user_id == 1 and db_helper.user_db_path(user_id) == sharded
+    # 新账号的 id 接在主库老用户之后，不会撞号
+    db_helper.register_user("new", "pw", "网络1班")
+    assert account("new")[0] == 2
@@ -0,0 +1,100 @@
+# tests/test_single_flight.py
+# 单飞：同一时刻完全相同的请求，无论来自同步还是异步引擎，只打一次上游，所有读取方拿到同一份回复。
+import time
+import uuid
+import asyncio
+import threading
+
+import pytest
+
+from utils.single_flight import SharedStream, FlightTable
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+def test_shared_stream_fans_out_to_threads_and_event_loop():
+    stream = SharedStream()
+    results = []
+    lock = threading.Lock()
+
+    def sync_reader():
+        text = "".join(stream.stream())
+        with lock:
+            results.append(text)
+
+    async def async_readers():
+        async def one():
+            return "".join([piece async for piece in stream.astream()])
+        return await asyncio.gather(*(one() for _ in range(5)))
+
+    threads = [threading.Thread(target=sync_reader) for _ in range(5)]
+    loop_thread = threading.Thread(target=lambda: results.extend(asyncio.run(async_readers())))
+    for t in threads + [loop_thread]:
+        t.start()
+    for piece in ("一", "二", "三"):
+        time.sleep(0.02)
+        stream.append(piece)
+    stream.finish()
+    for t in threads + [loop_thread]:
+        t.join(5)
+    assert results == ["一二三"] * 10
+
+
+def test_flight_table_leader_and_landing():
+    table = FlightTable()
+    flight, leader = table.join("k")
+    again, second = table.join("k")
+    assert leader and not second and again is flight
+    table.land("k", flight, ok=True)
+    assert flight.done and flight.ok and len(table) == 0
+    assert table.join("k")[1]  # 落地后再来的是新的 leader
+
+
+def test_sync_and_async_requests_share_one_upstream_call(engines):
+    from utils.ai_engine_async import get_event_loop, collect_all
+
+    upstream, engine, async_engine = engines
+    messages = [{"role": "user", "content": f"VLAN 间路由 {uuid.uuid4()}"}]  # 不命中回复缓存
+    upstream.gate.clear()
+
+    coalesced = async_engine.resilience_stats()["coalesced"]
+    sync_streams = [engine._chat_stream(messages) for _ in range(5)]  # 第一个是 leader
+    future = asyncio.run_coroutine_threadsafe(
+        collect_all(async_engine._chat_stream(messages) for _ in range(10)), get_event_loop())
+    wait_until(lambda: async_engine.resilience_stats()["coalesced"] - coalesced == 10)
+    upstream.gate.set()
+
+    texts = ["".join(stream) for stream in sync_streams] + future.result(5)
+    assert upstream.calls == 1
+    assert texts == [upstream.text] * 15
+    assert len(engine.flights) == 0
+
+
+def test_fresh_requests_are_not_coalesced(engines):
+    upstream, engine, _async_engine = engines
+    messages = [{"role": "user", "content": f"任务单 {uuid.uuid4()}"}]
+    texts = ["".join(engine._chat_stream(messages, fresh=True)) for _ in range(2)]
+    assert upstream.calls == 2 and texts == [upstream.text] * 2
+
+
+@pytest.mark.parametrize("reader", ["sync", "async"])
+def test_reader_leaving_early_does_not_stop_the_flight(engines, reader):
+    from utils.ai_engine_async import iter_sync
+
+    upstream, engine, async_engine = engines
+    messages = [{"role": "user", "content": f"OSPF {uuid.uuid4()}"}]
+    upstream.hold.clear()
+    stream = iter(engine._chat_stream(messages)) if reader == "sync" else iter_sync(async_engine._chat_stream(messages))
+    assert next(stream) == upstream.pieces[0]
+    stream.close()
+    upstream.hold.set()
+    # leader 把流拉完、写进缓存后落地，之后相同的请求直接命中缓存
+    wait_until(lambda: len(engine.flights) == 0)
+    assert "".join(engine._chat_stream(messages)) == upstream.text
+    assert upstream.calls == 1
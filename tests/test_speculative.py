@@ -0,0 +1,89 @@
+# tests/test_speculative.py
+# 推测生成的参考答案：排队中 / 卡住 / 失败时改为现场生成，只有完整的答案才算数（才会存库）。
+import uuid
+from concurrent.futures import wait
+
+import pytest
+
+from tests.fakes import ENGINE_DEPS
+
+for _name in ENGINE_DEPS:
+    pytest.importorskip(_name)
+
+from utils.ai_engine_async import run_sync  # noqa: E402
+from utils.speculative import Speculation, SolutionSpeculator, SolutionAnswer  # noqa: E402
+
+
+def task_text():
+    return f"在两台交换机之间配置 Trunk 并放行 VLAN 10、20 · {uuid.uuid4()}"
+
+
+def live(engine, task):
+    return lambda on_complete: engine.generate_task_solution(task, on_complete=on_complete)
+
+
+def test_finished_speculation_is_used_as_is(engines):
+    upstream, engine, async_engine = engines
+    task = task_text()
+    speculator = SolutionSpeculator(async_engine)
+    speculator.start(1, task).future.result(5)
+
+    answer = SolutionAnswer(speculator.get(1, task), live(engine, task))
+    assert "".join(answer) == upstream.text
+    assert answer.text == upstream.text
+    assert upstream.calls == 1  # 没有再现场生成
+
+
+def test_queued_speculation_is_bypassed(engines):
+    upstream, engine, async_engine = engines
+    task = task_text()
+    speculator = SolutionSpeculator(async_engine, max_inflight=1)
+    run_sync(speculator._semaphore.acquire())  # 占满名额：推测只能排队，一个字都没有
+    try:
+        spec = speculator.start(1, task)
+        assert speculator.get(1, task) is None
+        assert speculator.stats()["bypassed"] == 1
+        answer = SolutionAnswer(None, live(engine, task))
+        assert "".join(answer) == upstream.text and answer.text == upstream.text
+    finally:
+        speculator._semaphore.release()
+    wait([spec.future], 5)
+    assert spec.done and not spec.ok  # 被取消，不会再写库
+
+
+def test_stalled_speculation_falls_back_without_keeping_partial_text(engines):
+    upstream, engine, _async_engine = engines
+    task = task_text()
+
+    class Stalled(Speculation):
+        def stream(self, timeout=0.1):
+            return super().stream(timeout)
+
+    spec = Stalled(1, task)
+    spec.append("半截答案")
+    answer = SolutionAnswer(spec, live(engine, task))
+    shown = "".join(answer)
+    assert shown.startswith("半截答案") and shown.endswith(upstream.text)
+    assert answer.text == upstream.text  # 存下来的只有完整的那一份
+
+
+def test_failed_generation_is_not_kept(engines):
+    upstream, engine, _async_engine = engines
+    upstream.error = ValueError("参数错误")
+    task = task_text()
+    answer = SolutionAnswer(None, live(engine, task))
+    assert "答案生成失败" in "".join(answer)
+    assert answer.text is None
+
+
+def test_only_a_complete_task_reports_completion(engines):
+    # 页面只在任务单完整时启动推测；上游出错返回的错误提示不能拿去“生成答案”
+    upstream, engine, _async_engine = engines
+    completed = []
+    assert "".join(engine.generate_personalized_task("VLAN", "初学", on_complete=completed.append)) == upstream.text
+    assert completed == [upstream.text]
+
+    upstream.error = ValueError("参数错误")
+    completed.clear()
+    assert "任务生成失败" in "".join(engine.generate_personalized_task("VLAN", "初学", on_complete=completed.append))
+    assert completed == []
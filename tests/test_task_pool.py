@@ -0,0 +1,112 @@
+# tests/test_task_pool.py
+# 任务单预生成池：按热门（主题, 掌握度）补货，每个组合不超过 pool_size 份，补货出错也不停。
+import time
+import asyncio
+
+import pytest
+
+from tests.fakes import ENGINE_DEPS
+
+for _name in ENGINE_DEPS:
+    pytest.importorskip(_name)
+
+from utils.ai_engine_async import run_sync  # noqa: E402
+from utils.task_pool import TaskPool, pair_key  # noqa: E402
+
+
+def test_pair_key_ignores_case_and_spacing_only():
+    assert pair_key("OSPF DR/BDR 选举", "初学") == pair_key("ospf  DR/BDR选举", "初学")
+    assert pair_key("ＶＬＡＮ 划分", "熟练") == pair_key("vlan划分", "熟练")  # 全角
+    # 虚词照样算数：不同的主题不能共用任务单
+    assert pair_key("NAT 原理", "初学") != pair_key("NAT", "初学")
+    assert pair_key("需要 VLAN", "初学") != pair_key("VLAN", "初学")
+    assert pair_key("NAT", "初学") != pair_key("NAT", "熟练")
+
+
+async def _refill(pool, rounds=1):
+    semaphore = asyncio.Semaphore(2)
+    for _ in range(rounds):  # 同一轮里多次调用：在途的份数也要算进去
+        pool._refill(semaphore)
+    await asyncio.gather(*list(pool._tasks), return_exceptions=True)
+
+
+def refill(pool, rounds=1):
+    run_sync(_refill(pool, rounds), timeout=10)
+
+
+def make_pool(async_engine):
+    return TaskPool(async_engine, pool_size=2, hot_pairs=2, min_requests=2)
+
+
+def click(pool, topic, level="初学", times=2):
+    for _ in range(times):
+        pool.record_request(topic, level)
+
+
+def test_refill_fills_hot_pairs_and_take_serves_them(engines):
+    upstream, _engine, async_engine = engines
+    pool = make_pool(async_engine)
+    click(pool, "VLAN 划分")
+    click(pool, "冷门主题", times=1)  # 没到 min_requests
+    refill(pool)
+
+    assert pool.stats()["pools"] == {"VLAN 划分 · 初学": 2}
+    assert pool.take("vlan划分", "初学") == upstream.text
+    assert pool.take("VLAN 划分", "初学") == upstream.text
+    assert pool.take("VLAN 划分", "初学") is None
+    assert pool.take("冷门主题", "初学") is None
+    stats = pool.stats()
+    assert (stats["served"], stats["missed"], stats["generated"]) == (2, 2, 2)
+
+
+def test_pool_stays_bounded(engines):
+    _upstream, _engine, async_engine = engines
+    pool = make_pool(async_engine)
+    for i, topic in enumerate(["VLAN", "OSPF", "NAT", "ACL"]):
+        click(pool, topic, times=2 + i)  # ACL 最热，VLAN 最冷
+    refill(pool, rounds=3)
+    refill(pool)
+
+    pools = pool.stats()["pools"]
+    assert pools == {"ACL · 初学": 2, "NAT · 初学": 2}  # 只给最热的 hot_pairs 个组合备货，每个不超过 pool_size
+    assert pool.stats()["generated"] == 4 and pool.stats()["inflight"] == 0
+    pool.take("NAT", "初学")
+    refill(pool)
+    assert pool.stats()["pools"]["NAT · 初学"] == 2  # 取走一份补一份
+
+
+def test_failed_generation_is_not_pooled(engines):
+    upstream, _engine, async_engine = engines
+    upstream.error = ValueError("参数错误")
+    pool = make_pool(async_engine)
+    click(pool, "VLAN")
+    refill(pool)
+    stats = pool.stats()
+    assert stats["failed"] == 2 and stats["generated"] == 0 and stats["inflight"] == 0
+    assert pool.take("VLAN", "初学") is None  # 错误提示不会当任务单发出去
+
+
+def test_refill_loop_survives_an_error(engines, monkeypatch):
+    upstream, _engine, async_engine = engines
+    pool = make_pool(async_engine)
+    click(pool, "VLAN")
+    real_plan = pool._plan
+    calls = []
+
+    def flaky_plan():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("统计出错")
+        return real_plan()
+
+    monkeypatch.setattr(pool, "_plan", flaky_plan)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 5
+        while pool.stats()["pools"].get("VLAN · 初学", 0) < 2:
+            assert time.monotonic() < deadline, "补货循环没有恢复"
+            pool._poke()  # 第一次补货抛异常；循环还活着的话，下一次唤醒会补上
+            time.sleep(0.02)
+        assert len(calls) >= 2 and not pool._future.done()
+    finally:
+        pool._future.cancel()
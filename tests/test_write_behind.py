@@ -0,0 +1,59 @@
+# tests/test_write_behind.py
+# 写队列：一批里有一条写失败时整批回滚、逐条重放，主键只在提交后公布且与库里一致。
+import sqlite3
+
+import pytest
+
+from utils.db_helper import get_conn
+from utils.write_behind import WriteBehindQueue, persisted_id
+
+
+def insert_note(conn, text):
+    return conn.execute("INSERT INTO notes (text) VALUES (?)", (text,)).lastrowid
+
+
+def update_note(conn, note_id, text):
+    conn.execute("UPDATE notes SET text = ? WHERE id = ?", (text, note_id))
+
+
+def broken(conn):
+    raise sqlite3.IntegrityError("坏数据")
+
+
+@pytest.fixture
+def writer(db_path):
+    with get_conn(db_path) as conn:
+        conn.execute("CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL)")
+    # 攒批窗口放长，保证下面的操作落在同一批
+    queue = WriteBehindQueue(get_conn, linger_ms=200)
+    yield queue
+    queue.close()
+
+
+def rows(db_path):
+    return sqlite3.connect(db_path).execute("SELECT id, text FROM notes ORDER BY id").fetchall()
+
+
+def test_failed_batch_is_replayed_one_by_one(writer, db_path):
+    a = writer.submit(insert_note, "a", db_path=db_path)
+    bad = writer.submit(broken, db_path=db_path)
+    edit = writer.submit(update_note, a, "a2", db_path=db_path)  # 引用同批里 a 的主键
+    c = writer.submit(insert_note, "c", db_path=db_path)
+    writer.flush(5)
+
+    assert rows(db_path) == [(1, "a2"), (2, "c")]
+    # 公布的主键是重放后真正提交的那一个
+    assert (a.result_id(1), c.result_id(1)) == (1, 2)
+    assert persisted_id(a) == 1 and persisted_id(c) == 2
+    assert edit.wait(1) is None
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.wait(1)
+    assert persisted_id(bad) is None
+    assert writer.stats()["failed"] == 1
+
+
+def test_ids_are_not_published_before_commit(writer, db_path):
+    op = writer.submit(insert_note, "x", db_path=db_path)
+    assert persisted_id(op) is None  # 还在攒批窗口里
+    assert op.result_id(5) == 1
+    assert persisted_id(op) == 1
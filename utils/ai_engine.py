@@ -1,48 +1,73 @@
 import os
-from openai import OpenAI
+import time
+import httpx
+import threading
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
 import streamlit as st # 新增导入
-class NetworkArchitectAI:
-    def __init__(self):
-        # --- 修改开始：兼容云端 Secrets 和本地 .env ---
-        # 优先尝试从 Streamlit Secrets 读取，如果报错或不存在，则尝试从 os.getenv 读取
-        try:
-            api_key = st.secrets["AI_API_KEY"]
-            base_url = st.secrets["AI_BASE_URL"]
-        except (FileNotFoundError, KeyError):
-            api_key = os.getenv("AI_API_KEY")
-            base_url = os.getenv("AI_BASE_URL")
-        # --- 修改结束 ---
-
-        # 二次验证（防御性编程）
-        if not api_key or not base_url:
-            raise ValueError("环境变量 AI_API_KEY 或 AI_BASE_URL 未设置")
-        if not base_url.rstrip("/").endswith("/v1"):
-            raise ValueError(f"AI_BASE_URL 必须以 /v1 结尾，当前值: {base_url}")
+from utils.llm_cache import get_response_cache, make_key, replay
+from utils.semantic_cache import get_semantic_cache
+from utils.resilience import backoff_delay, get_circuit_breaker
+from utils.single_flight import SINGLE_FLIGHT, get_flight_table
 
-        try:
-            self.client = OpenAI(
-                api_key=api_key,
-                base_url=base_url  # 确保是 https://api.deepseek.com/v1
-            )
-        except Exception as e:
-            # 提供可操作的错误信息（参考知识库 [3][7]）
-            if "401" in str(e) or "authentication" in str(e).lower():
-                raise RuntimeError("API 密钥无效或已过期，请检查 Secrets 中的 AI_API_KEY") from e
-            elif "base_url" in str(e).lower() or "invalid url" in str(e).lower():
-                raise RuntimeError(f"base_url 格式错误: {base_url}。必须为 https://api.deepseek.com/v1") from e
-            else:
-                raise RuntimeError(f"OpenAI 客户端初始化失败: {str(e)}") from e
+MODEL = "deepseek-chat"
 
-    def get_diagnostic_response(self, user_code, user_thought, topic):
-        """
-        S1 升级版：加入学生自己的思考（user_thought）
-        """
-        system_prompt = f"""
+# 整个进程共用一个客户端（见 streamlit_app.get_ai_engine），连接池按全班并发来配：
+# 保持长连接，后续请求免去 TCP + TLS 握手
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("AI_MAX_CONNECTIONS", "64")),
+    max_keepalive_connections=int(os.getenv("AI_MAX_KEEPALIVE", "32")),
+    keepalive_expiry=float(os.getenv("AI_KEEPALIVE_EXPIRY_S", "300")),
+)
+
+# 超时与重试：只在拿到第一个 token 之前重试（之后内容已经显示给学生，不能重来）
+CONNECT_TIMEOUT_S = float(os.getenv("AI_CONNECT_TIMEOUT_S", "5"))
+READ_TIMEOUT_S = float(os.getenv("AI_READ_TIMEOUT_S", "30"))          # 两段数据之间的最长间隔
+FIRST_TOKEN_TIMEOUT_S = float(os.getenv("AI_FIRST_TOKEN_TIMEOUT_S", "20"))
+MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)  # 超时属于 APIConnectionError
+
+
+class FirstTokenTimeout(APIConnectionError):
+    """请求已发出，但在 FIRST_TOKEN_TIMEOUT_S 内没有收到任何内容"""
+
+    def __init__(self, request=None):
+        super().__init__(message=f"{FIRST_TOKEN_TIMEOUT_S:g} 秒内未收到回复", request=request)
+
+
+def message_stream(text):
+    """整段产出一条提示；直接把字符串交给 st.write_stream 会被逐字“流式”打印"""
+    yield text
+
+
+def load_credentials():
+    """返回 (api_key, base_url)，缺失或格式不对时抛 ValueError"""
+    # --- 修改开始：兼容云端 Secrets 和本地 .env ---
+    # 优先尝试从 Streamlit Secrets 读取，如果报错或不存在，则尝试从 os.getenv 读取
+    try:
+        api_key = st.secrets["AI_API_KEY"]
+        base_url = st.secrets["AI_BASE_URL"]
+    except (FileNotFoundError, KeyError):
+        api_key = os.getenv("AI_API_KEY")
+        base_url = os.getenv("AI_BASE_URL")
+    # --- 修改结束 ---
+
+    # 二次验证（防御性编程）
+    if not api_key or not base_url:
+        raise ValueError("环境变量 AI_API_KEY 或 AI_BASE_URL 未设置")
+    if not base_url.rstrip("/").endswith("/v1"):
+        raise ValueError(f"AI_BASE_URL 必须以 /v1 结尾，当前值: {base_url}")
+    return api_key, base_url
+
+
+# ---- 提示词（同步 / 异步引擎共用，保证两边的缓存键一致）----
+
+def diagnostic_messages(user_code, user_thought, topic):
+    system_prompt = f"""
         你是一位苏格拉底式的网络工程导师。
         当前实验主题：{topic}
 
@@ -56,26 +81,12 @@ class NetworkArchitectAI:
         3. 不要直接给代码！通过提问引导。例如："你注意到了 Area ID，但你检查过掩码的反码格式吗？"
         4. 使用 Markdown 格式，语气亲切但专业。
         """
+    return [{"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_code}]
 
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_code}
-                ],
-                stream=True,
-                temperature=0.4
-            )
-            return response
-        except Exception as e:
-            return f"AI 连接中断: {str(e)}"
 
-    def generate_personalized_task(self, learning_topic, mastery_level):
-        """
-        S3 升级版：基于今日学习内容的动态生成
-        """
-        task_prompt = f"""
+def task_messages(learning_topic, mastery_level):
+    task_prompt = f"""
         我是《计算机与网络》课程的学生。
         【今日学习重点】：{learning_topic}
         【我的自评掌握度】：{mastery_level}
@@ -93,22 +104,11 @@ class NetworkArchitectAI:
         ### 💣 预埋故障/配置任务
         ### 🔍 验收标准 (Ping/Show命令)
         """
+    return [{"role": "user", "content": task_prompt}]
 
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[{"role": "user", "content": task_prompt}],
-                stream=True
-            )
-            return response
-        except Exception as e:
-            return f"任务生成失败: {str(e)}"
 
-    def generate_task_solution(self, task_content):
-        """
-        S3 新增功能：根据已生成的任务，生成对应的参考答案
-        """
-        solution_prompt = f"""
+def solution_messages(task_content):
+    solution_prompt = f"""
         你是一位专业的网络工程师。请根据以下生成的实验任务，提供标准的参考答案。
 
         【任务内容回顾】：
@@ -120,31 +120,283 @@ class NetworkArchitectAI:
         3. 给出 1-2 个核心验证命令（show xxx）及其预期输出。
         4. 格式清晰，代码放入 Markdown 代码块中。
         """
+    return [{"role": "user", "content": solution_prompt}]
+
+
+def quiz_messages(concept):
+    prompt = f"""
+        用最通俗易懂的比喻解释"{concept}"这个网络概念，
+        然后向我抛出一个有深度的思考题，测试我是否真的理解了。
+        """
+    return [{"role": "user", "content": prompt}]
+
+
+class NetworkArchitectAI:
+    def __init__(self):
+        api_key, base_url = load_credentials()
+
         try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[{"role": "user", "content": solution_prompt}],
-                stream=True
+            self.client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,  # 确保是 https://api.deepseek.com/v1
+                http_client=httpx.Client(limits=HTTP_LIMITS),
+                timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                max_retries=0  # 重试由 _open_stream 负责（带抖动，且只在首 token 之前）
             )
-            return response
         except Exception as e:
-            return f"答案生成失败: {str(e)}"
+            # 提供可操作的错误信息（参考知识库 [3][7]）
+            if "401" in str(e) or "authentication" in str(e).lower():
+                raise RuntimeError("API 密钥无效或已过期，请检查 Secrets 中的 AI_API_KEY") from e
+            elif "base_url" in str(e).lower() or "invalid url" in str(e).lower():
+                raise RuntimeError(f"base_url 格式错误: {base_url}。必须为 https://api.deepseek.com/v1") from e
+            else:
+                raise RuntimeError(f"OpenAI 客户端初始化失败: {str(e)}") from e
+
+        # 回复缓存（进程级共享，见 utils/llm_cache）；概念追问另有近似匹配（utils/semantic_cache）
+        self.cache = get_response_cache()
+        self.semantic = get_semantic_cache(self.cache)
+        # 上游健康状态全进程共享
+        self.breaker = get_circuit_breaker()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"requests": 0, "retries": 0, "first_token_timeouts": 0, "midstream_errors": 0,
+                         "fallback_cache": 0, "fallback_error": 0, "coalesced": 0}
+        # 单飞在途表（和异步引擎共用，见 utils/single_flight）
+        self.flights = get_flight_table()
+
+    def warm_up(self):
+        """启动时先连一次 API（GET /models），TLS 连接留在池里，
+        第一个学生登录后的首个请求直接复用，首 token 时间不再包含握手。
+        返回耗时（毫秒）；失败只记录，不影响启动。"""
+        t0 = time.perf_counter()
+        try:
+            self.client.models.list()
+        except Exception as e:
+            self.warmup = {"ok": False, "error": str(e)}
+            return None
+        elapsed = (time.perf_counter() - t0) * 1000
+        self.warmup = {"ok": True, "ms": round(elapsed, 1)}
+        return elapsed
+
+    def _count(self, name):
+        with self._metrics_lock:
+            self._metrics[name] += 1
+
+    def _chat_stream(self, messages, temperature=None, cacheable=True, on_cached=None,
+                     error_prefix="AI 连接中断", fresh=False, on_complete=None):
+        """发起流式对话，返回逐段产出文本的生成器（st.write_stream 可直接消费）。
+
+        命中缓存时回放上次的完整回复；未命中时边转发边累积，正常结束后写入缓存，
+        并以缓存键调用 on_cached。上游不可用（熔断中 / 重试耗尽）时改用缓存兜底，
+        没有缓存就整段返回一条错误提示。
+        与正在进行的请求完全相同时不再另发，跟读那一路（先回放已生成的部分）。
+        fresh=True：每次都要上游新写一份（不读缓存、不合并），完整回复照样写入缓存，只留作兜底。
+        on_complete(text)：读到一份完整回复时回调（上游正常结束、缓存回放、兜底回放），
+        错误提示和中途断开的不回调——调用方据此决定能不能把结果存下来。
+        """
+        flight_key = make_key(MODEL, temperature, messages) if cacheable else None
+        key = flight_key if self.cache is not None else None
+        if key is not None and not fresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._replay(cached, on_complete)
+        if flight_key is None or fresh or not SINGLE_FLIGHT:
+            return self._request(key, messages, temperature, on_cached, error_prefix, on_complete)
+
+        # 单飞：同一时刻完全相同的请求只发一次上游，由后台线程拉流，所有人从同一份缓冲读
+        flight, leader = self.flights.join(flight_key)
+        if leader:
+            threading.Thread(target=self._pump, args=(flight_key, flight, key, messages, temperature,
+                                                      on_cached, error_prefix),
+                             name="ai-flight", daemon=True).start()
+        else:
+            self._count("coalesced")
+        return self._follow(flight, on_complete)
+
+    def _pump(self, flight_key, flight, key, messages, temperature, on_cached, error_prefix):
+        # 读取方中途离开（学生切走页面）也把流拉完：其他人还在读，完整回复还要进缓存
+        completed = []
+        try:
+            for piece in self._request(key, messages, temperature, on_cached, error_prefix, completed.append):
+                flight.append(piece)
+        finally:
+            self.flights.land(flight_key, flight, bool(completed))
+
+    @staticmethod
+    def _follow(flight, on_complete=None):
+        yield from flight.stream()
+        if flight.ok and on_complete is not None:
+            on_complete(flight.text)
+
+    @staticmethod
+    def _replay(text, on_complete=None):
+        yield from replay(text)
+        if on_complete is not None:
+            on_complete(text)
+
+    def _request(self, key, messages, temperature, on_cached, error_prefix, on_complete=None):
+        """缓存未命中后的上游请求：熔断 / 重试 / 兜底"""
+        if not self.breaker.allow():
+            return self._fallback(key, error_prefix, "AI 服务暂时不可用，请稍后再试", on_complete)
+        self._count("requests")
+        try:
+            chunks, first = self._open_stream(messages, temperature)
+        except RETRYABLE_ERRORS as e:
+            self.breaker.record_failure()
+            return self._fallback(key, error_prefix, str(e), on_complete)
+        except Exception as e:  # 参数/鉴权错误：上游是健康的，不计入熔断
+            self.breaker.record_success()
+            return message_stream(f"{error_prefix}: {str(e)}")
+        self.breaker.record_success()
+        return self._forward(chunks, first, key, on_cached, on_complete)
+
+    def _open_stream(self, messages, temperature):
+        """发请求并等到第一段内容，返回 (后续分片迭代器, 第一段内容)。
+
+        首 token 之前的连接错误、限流、5xx、首 token 超时按抖动指数退避重试。
+        """
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.client.chat.completions.create(
+                    model=MODEL, messages=messages, stream=True, **kwargs)
+                return self._first_token(response)
+            except RETRYABLE_ERRORS:
+                if attempt == MAX_RETRIES:
+                    raise
+                self._count("retries")
+                time.sleep(backoff_delay(attempt))
+
+    def _first_token(self, response):
+        # 服务端可能先回响应头、再用 SSE 心跳一直拖着不出内容，读超时管不到；
+        # 到点由定时器关掉连接，让阻塞的读立即返回
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            response.close()
+
+        timer = threading.Timer(FIRST_TOKEN_TIMEOUT_S, expire)
+        timer.daemon = True
+        timer.start()
+        chunks = iter(response)
+        try:
+            for chunk in chunks:
+                if chunk.choices and (chunk.choices[0].delta.content or chunk.choices[0].finish_reason):
+                    return chunks, chunk
+        except Exception:
+            if not timed_out.is_set():
+                raise
+        finally:
+            timer.cancel()
+        if timed_out.is_set():
+            self._count("first_token_timeouts")
+            raise FirstTokenTimeout()
+        return chunks, None
+
+    def _fallback(self, key, error_prefix, reason, on_complete=None):
+        cached = self.cache.get(key, allow_stale=True) if key is not None else None
+        if cached is not None:
+            self._count("fallback_cache")
+            return self._replay(cached, on_complete)
+        self._count("fallback_error")
+        return message_stream(f"{error_prefix}: {reason}")
+
+    def _forward(self, chunks, first, key, on_cached=None, on_complete=None):
+        parts = []
+        finished = False
+        try:
+            for chunk in self._chain(first, chunks):
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                    yield choice.delta.content
+                if choice.finish_reason == "stop":
+                    finished = True
+        except Exception as e:
+            # 已经输出了一部分，只能如实告知中断；不缓存残缺的回复
+            self._count("midstream_errors")
+            self.breaker.record_failure()
+            yield f"\n\n⚠️ 回复中断：{str(e)}"
+            return
+        # 只缓存完整结束的回复（被截断 / 中途断开的不缓存）
+        if not (finished and parts):
+            return
+        if key is not None:
+            self.cache.put(key, MODEL, "".join(parts))
+            if on_cached is not None:
+                on_cached(key)
+        if on_complete is not None:
+            on_complete("".join(parts))
+
+    @staticmethod
+    def _chain(first, chunks):
+        if first is not None:
+            yield first
+        yield from chunks
+
+    def resilience_stats(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["inflight_shared"] = len(self.flights)
+        metrics["breaker"] = self.breaker.stats()
+        return metrics
+
+    def cache_stats(self):
+        if self.cache is None:
+            return None
+        stats = self.cache.stats()
+        if self.semantic is not None:
+            stats["semantic"] = self.semantic.stats()
+        return stats
+
+    def get_diagnostic_response(self, user_code, user_thought, topic):
+        """
+        S1 升级版：加入学生自己的思考（user_thought）
+        """
+        try:
+            # 学生自己的代码和思路几乎不会重复，不走缓存
+            return self._chat_stream(diagnostic_messages(user_code, user_thought, topic),
+                                     temperature=0.4, cacheable=False, error_prefix="AI 连接中断")
+        except Exception as e:
+            return message_stream(f"AI 连接中断: {str(e)}")
+
+    def generate_personalized_task(self, learning_topic, mastery_level, on_complete=None):
+        """
+        S3 升级版：基于今日学习内容的动态生成
+        """
+        try:
+            # 同班同主题也要各拿各的任务单，重新生成要换一份：缓存只在上游不可用时兜底
+            return self._chat_stream(task_messages(learning_topic, mastery_level), error_prefix="任务生成失败",
+                                     fresh=True, on_complete=on_complete)
+        except Exception as e:
+            return message_stream(f"任务生成失败: {str(e)}")
+
+    def generate_task_solution(self, task_content, on_complete=None):
+        """
+        S3 新增功能：根据已生成的任务，生成对应的参考答案
+        """
+        try:
+            return self._chat_stream(solution_messages(task_content), error_prefix="答案生成失败",
+                                     on_complete=on_complete)
+        except Exception as e:
+            return message_stream(f"答案生成失败: {str(e)}")
 
 
     def socratic_quiz(self, concept):
         """
         新增功能：概念追问
         """
-        prompt = f"""
-        用最通俗易懂的比喻解释"{concept}"这个网络概念，
-        然后向我抛出一个有深度的思考题，测试我是否真的理解了。
-        """
+        # 换了种问法的同一个概念：直接复用已有讲解
+        if self.semantic is not None:
+            hit = self.semantic.get(concept)
+            if hit is not None:
+                return replay(hit[0])
         try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[{"role": "user", "content": prompt}],
-                stream=True
-            )
-            return response
+            return self._chat_stream(
+                quiz_messages(concept),
+                on_cached=(lambda key: self.semantic.add(concept, key)) if self.semantic is not None else None,
+                error_prefix="Error")
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            return message_stream(f"Error: {str(e)}")
@@ -0,0 +1,296 @@
+# utils/ai_engine_async.py
+# NetworkArchitectAI 的 asyncio 版本：四个功能同名，返回异步生成器（逐段产出文本）。
+# 需要同时发几十个请求的场景（批量出题、预生成、以后的多路调用）在一个事件循环里并发，
+# 不用为每个请求开线程。提示词、回复缓存、熔断器、超时/重试参数都和同步引擎共用。
+#
+# Streamlit 脚本是同步的，用 iter_sync 把异步生成器转成普通生成器交给 st.write_stream：
+#   engine = get_async_ai_engine()
+#   st.write_stream(iter_sync(engine.socratic_quiz("VLAN 间路由")))
+# 批量并发：
+#   texts = run_sync(collect_all(engine.generate_task_solution(t) for t in tasks))
+import asyncio
+import threading
+
+import httpx
+from openai import AsyncOpenAI
+
+from utils.ai_engine import (MODEL, HTTP_LIMITS, CONNECT_TIMEOUT_S, READ_TIMEOUT_S, FIRST_TOKEN_TIMEOUT_S,
+                             MAX_RETRIES, RETRYABLE_ERRORS, FirstTokenTimeout, load_credentials,
+                             diagnostic_messages, task_messages, solution_messages, quiz_messages)
+from utils.llm_cache import get_response_cache, make_key, REPLAY_CHUNK
+from utils.semantic_cache import get_semantic_cache
+from utils.resilience import backoff_delay, get_circuit_breaker
+from utils.single_flight import SINGLE_FLIGHT, get_flight_table
+
+
+async def replay(text, chunk=REPLAY_CHUNK):
+    for i in range(0, len(text), chunk):
+        yield text[i:i + chunk]
+
+
+async def collect(stream):
+    """把异步生成器产出的文本拼成完整字符串"""
+    return "".join([piece async for piece in stream])
+
+
+async def collect_all(streams):
+    """并发消费多个异步生成器，按顺序返回各自的完整文本"""
+    return await asyncio.gather(*(collect(stream) for stream in streams))
+
+
+# ---- 后台事件循环：同步代码（Streamlit 脚本、线程）通过它驱动异步引擎 ----
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """进程级后台事件循环（守护线程），首次调用时启动"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ai-event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro, timeout=None):
+    """在后台事件循环上执行协程，阻塞等待结果"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result(timeout)
+
+
+def iter_sync(stream):
+    """异步生成器 -> 同步生成器。每取一段在后台循环上 await 一次；
+    消费方提前停止（Streamlit 重跑打断脚本）时关闭异步生成器，释放上游连接"""
+    loop = get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(stream.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(stream.aclose(), loop).result()
+
+
+class AsyncNetworkArchitectAI:
+    """客户端的连接池绑定在第一次使用它的事件循环上：
+    通过 get_async_ai_engine() 拿到的实例只在后台循环里用（iter_sync / run_sync）；
+    自己用 asyncio.run() 的脚本请另建实例。"""
+
+    def __init__(self):
+        api_key, base_url = load_credentials()
+        try:
+            self.client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.AsyncClient(limits=HTTP_LIMITS),
+                timeout=httpx.Timeout(READ_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+                max_retries=0
+            )
+        except Exception as e:
+            raise RuntimeError(f"OpenAI 异步客户端初始化失败: {str(e)}") from e
+
+        self.cache = get_response_cache()
+        self.semantic = get_semantic_cache(self.cache)
+        self.breaker = get_circuit_breaker()
+        # 单飞在途表和同步引擎共用：两边同时发出的相同请求也只打一次上游
+        self.flights = get_flight_table()
+        self._pumps = set()  # leader 拉流的任务，留住引用免得被回收
+        # 只在事件循环线程里修改，不需要锁
+        self._metrics = {"requests": 0, "retries": 0, "first_token_timeouts": 0, "midstream_errors": 0,
+                         "fallback_cache": 0, "fallback_error": 0, "coalesced": 0}
+
+    def _count(self, name):
+        self._metrics[name] += 1
+
+    async def _chat_stream(self, messages, temperature=None, cacheable=True, on_cached=None,
+                           error_prefix="AI 连接中断", on_complete=None, fresh=False):
+        """与 NetworkArchitectAI._chat_stream 同样的缓存 / 熔断 / 兜底逻辑（含 fresh、on_complete），异步逐段产出"""
+        flight_key = make_key(MODEL, temperature, messages) if cacheable else None
+        key = flight_key if self.cache is not None else None
+        if key is not None and not fresh:
+            # 缓存查询可能落到 SQLite，放到线程池里，不卡住其他并发请求
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                async for piece in replay(cached):
+                    yield piece
+                if on_complete is not None:
+                    on_complete(cached)
+                return
+        if flight_key is None or fresh or not SINGLE_FLIGHT:
+            async for piece in self._request(key, messages, temperature, on_cached, error_prefix, on_complete):
+                yield piece
+            return
+
+        # 单飞：leader 在事件循环上起一个任务拉流（读取方中途离开也拉完），所有人从同一份缓冲读
+        flight, leader = self.flights.join(flight_key)
+        if leader:
+            pump = asyncio.ensure_future(self._pump(flight_key, flight, key, messages, temperature,
+                                                    on_cached, error_prefix))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            self._count("coalesced")
+        async for piece in flight.astream():
+            yield piece
+        if flight.ok and on_complete is not None:
+            on_complete(flight.text)
+
+    async def _pump(self, flight_key, flight, key, messages, temperature, on_cached, error_prefix):
+        completed = []
+        try:
+            async for piece in self._request(key, messages, temperature, on_cached, error_prefix, completed.append):
+                flight.append(piece)
+        finally:
+            self.flights.land(flight_key, flight, bool(completed))
+
+    async def _request(self, key, messages, temperature, on_cached, error_prefix, on_complete=None):
+        """缓存未命中后的上游请求：熔断 / 重试 / 兜底"""
+        if not self.breaker.allow():
+            async for piece in self._fallback(key, error_prefix, "AI 服务暂时不可用，请稍后再试", on_complete):
+                yield piece
+            return
+        self._count("requests")
+        try:
+            response, chunks, first = await self._open_stream(messages, temperature)
+        except RETRYABLE_ERRORS as e:
+            self.breaker.record_failure()
+            async for piece in self._fallback(key, error_prefix, str(e), on_complete):
+                yield piece
+            return
+        except Exception as e:  # 参数/鉴权错误：上游是健康的，不计入熔断
+            self.breaker.record_success()
+            yield f"{error_prefix}: {str(e)}"
+            return
+        self.breaker.record_success()
+        try:
+            async for piece in self._forward(chunks, first, key, on_cached, on_complete):
+                yield piece
+        finally:
+            await response.close()
+
+    async def _open_stream(self, messages, temperature):
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = await self.client.chat.completions.create(
+                    model=MODEL, messages=messages, stream=True, **kwargs)
+                try:
+                    chunks, first = await self._first_token(response)
+                except BaseException:
+                    await response.close()
+                    raise
+                return response, chunks, first
+            except RETRYABLE_ERRORS:
+                if attempt == MAX_RETRIES:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _first_token(self, response):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FIRST_TOKEN_TIMEOUT_S
+        chunks = response.__aiter__()
+        try:
+            while True:
+                chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                if chunk.choices and (chunk.choices[0].delta.content or chunk.choices[0].finish_reason):
+                    return chunks, chunk
+        except StopAsyncIteration:
+            return chunks, None
+        except asyncio.TimeoutError:
+            self._count("first_token_timeouts")
+            raise FirstTokenTimeout()
+
+    async def _fallback(self, key, error_prefix, reason, on_complete=None):
+        cached = await asyncio.to_thread(self.cache.get, key, True) if key is not None else None
+        if cached is not None:
+            self._count("fallback_cache")
+            async for piece in replay(cached):
+                yield piece
+            if on_complete is not None:
+                on_complete(cached)
+            return
+        self._count("fallback_error")
+        yield f"{error_prefix}: {reason}"
+
+    async def _forward(self, chunks, first, key, on_cached=None, on_complete=None):
+        parts = []
+        finished = False
+        try:
+            if first is not None:
+                chunks = self._chain(first, chunks)
+            async for chunk in chunks:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                    yield choice.delta.content
+                if choice.finish_reason == "stop":
+                    finished = True
+        except Exception as e:
+            self._count("midstream_errors")
+            self.breaker.record_failure()
+            yield f"\n\n⚠️ 回复中断：{str(e)}"
+            return
+        if not (finished and parts):
+            return
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, MODEL, "".join(parts))
+            if on_cached is not None:
+                await asyncio.to_thread(on_cached, key)
+        if on_complete is not None:
+            on_complete("".join(parts))
+
+    @staticmethod
+    async def _chain(first, chunks):
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    def resilience_stats(self):
+        metrics = dict(self._metrics)
+        metrics["inflight_shared"] = len(self.flights)
+        metrics["breaker"] = self.breaker.stats()
+        return metrics
+
+    def get_diagnostic_response(self, user_code, user_thought, topic):
+        return self._chat_stream(diagnostic_messages(user_code, user_thought, topic),
+                                 temperature=0.4, cacheable=False, error_prefix="AI 连接中断")
+
+    def generate_personalized_task(self, learning_topic, mastery_level, cacheable=True, on_complete=None):
+        return self._chat_stream(task_messages(learning_topic, mastery_level), cacheable=cacheable,
+                                 error_prefix="任务生成失败", on_complete=on_complete, fresh=True)
+
+    def generate_task_solution(self, task_content, on_cached=None, on_complete=None):
+        return self._chat_stream(solution_messages(task_content), on_cached=on_cached, error_prefix="答案生成失败",
+                                 on_complete=on_complete)
+
+    async def socratic_quiz(self, concept):
+        if self.semantic is not None:
+            hit = await asyncio.to_thread(self.semantic.get, concept)
+            if hit is not None:
+                async for piece in replay(hit[0]):
+                    yield piece
+                return
+        on_cached = (lambda key: self.semantic.add(concept, key)) if self.semantic is not None else None
+        async for piece in self._chat_stream(quiz_messages(concept), on_cached=on_cached, error_prefix="Error"):
+            yield piece
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_async_ai_engine():
+    """进程级单例，配合 get_event_loop() 的后台循环使用"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AsyncNetworkArchitectAI()
+    return _engine
@@ -0,0 +1,177 @@
+# utils/backup.py
+# 在线增量备份：基于 SQLite 的 online backup API，每次只拷贝少量页并让出时间片，
+# 上课期间的会话照常读写，无需停服。快照按时间戳命名并轮换保留最近 N 份。
+#
+# 页面进程里由 bootstrap() 启动定时任务（DB_BACKUP_INTERVAL_MIN > 0 时）；
+# 也可以交给 cron 单独跑一次：
+#   python -m utils.backup --out /mount/src/netarchitect/backups --keep 24
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STEP_PAGES = int(os.getenv("DB_BACKUP_STEP_PAGES", "256"))       # 每步拷贝的页数（默认 4KB 页 -> 1MB）
+STEP_SLEEP_MS = int(os.getenv("DB_BACKUP_STEP_SLEEP_MS", "20"))  # 每步之间让出的时间
+KEEP = int(os.getenv("DB_BACKUP_KEEP", "24"))
+# 源库在备份过程中被其他连接写入时，backup API 会从头重来；
+# 重来超过这个次数就把剩余页一步拷完（WAL 模式下读事务不阻塞写者）
+MAX_RESTARTS = 3
+
+
+def _snapshot_name(db_path):
+    stem = Path(db_path).stem
+    # 带微秒：同一秒内的多次备份（手动补跑、多个进程）不会互相覆盖
+    return f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.db"
+
+
+def _rotate(dest_dir, stem, keep):
+    snapshots = sorted(Path(dest_dir).glob(f"{stem}-*.db"))
+    for old in snapshots[:-keep] if keep > 0 else ():
+        old.unlink()
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_database(db_path, dest_dir, keep=KEEP, step_pages=STEP_PAGES, step_sleep_ms=STEP_SLEEP_MS):
+    """把 db_path 在线备份到 dest_dir，返回本次备份的统计信息。
+
+    先写入 .tmp 文件，校验通过后再改名，目录里不会出现半截快照。
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    target = dest_dir / _snapshot_name(db_path)
+    tmp = target.with_suffix(".db.tmp")
+    progress = {"steps": 0, "restarts": 0, "last_remaining": None}
+
+    def on_progress(status, remaining, total):
+        # remaining 变大说明源库被改写、备份从头开始了
+        if progress["last_remaining"] is not None and remaining > progress["last_remaining"]:
+            progress["restarts"] += 1
+        progress["last_remaining"] = remaining
+        progress["steps"] += 1
+        if progress["restarts"] > MAX_RESTARTS:
+            raise _Restarted()
+
+    t0 = time.perf_counter()
+    src = sqlite3.connect(db_path, timeout=30)
+    dst = sqlite3.connect(tmp)
+    try:
+        try:
+            src.backup(dst, pages=step_pages, progress=on_progress, sleep=step_sleep_ms / 1000)
+        except _Restarted:
+            src.backup(dst, pages=-1)
+        # 快照是单文件，不需要 WAL
+        dst.execute("PRAGMA journal_mode=DELETE")
+        ok = dst.execute("PRAGMA quick_check").fetchone()[0]
+        if ok != "ok":
+            raise sqlite3.DatabaseError(f"快照校验失败: {ok}")
+    except BaseException:
+        dst.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        src.close()
+    dst.close()
+    os.replace(tmp, target)
+    _rotate(dest_dir, Path(db_path).stem, keep)
+    return {
+        "path": str(target),
+        "size_bytes": target.stat().st_size,
+        "duration_ms": (time.perf_counter() - t0) * 1000,
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+class BackupScheduler:
+    """后台定时备份线程；多个数据库文件（分库时）依次备份"""
+
+    def __init__(self, paths_fn, dest_dir, interval_s, keep=KEEP,
+                 step_pages=STEP_PAGES, step_sleep_ms=STEP_SLEEP_MS):
+        self.paths_fn = paths_fn
+        self.dest_dir = Path(dest_dir)
+        self.interval_s = interval_s
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep_ms = step_sleep_ms
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"backups": 0, "failed": 0, "last": {}, "last_error": None}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-backup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        """立即备份一轮，返回 {db_path: 统计}"""
+        results = {}
+        for db_path in self.paths_fn():
+            if not os.path.exists(db_path):
+                continue
+            # 每个库一个子目录，轮换互不影响
+            dest = self.dest_dir / Path(db_path).stem
+            try:
+                result = backup_database(db_path, dest, self.keep, self.step_pages, self.step_sleep_ms)
+            except Exception as e:
+                logger.exception("备份 %s 失败", db_path)
+                with self._stats_lock:
+                    self._stats["failed"] += 1
+                    self._stats["last_error"] = f"{db_path}: {e}"
+                continue
+            results[db_path] = result
+            with self._stats_lock:
+                self._stats["backups"] += 1
+                self._stats["last"][db_path] = result
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+            snapshot["last"] = dict(snapshot["last"])
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.run_once()
+
+
+def main(argv=None):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.db_helper import all_db_paths, get_backup_dir
+
+    parser = argparse.ArgumentParser(description="NetArchitect 数据库在线备份（不停服）")
+    parser.add_argument("--out", default=None, help="快照目录（默认 DB_BACKUP_DIR 或数据库旁的 backups/）")
+    parser.add_argument("--keep", type=int, default=KEEP, help="每个数据库保留的快照份数")
+    parser.add_argument("--step-pages", type=int, default=STEP_PAGES, help="每步拷贝的页数")
+    parser.add_argument("--step-sleep-ms", type=float, default=STEP_SLEEP_MS, help="每步之间的停顿")
+    args = parser.parse_args(argv)
+
+    scheduler = BackupScheduler(all_db_paths, args.out or get_backup_dir(), interval_s=0,
+                                keep=args.keep, step_pages=args.step_pages, step_sleep_ms=args.step_sleep_ms)
+    for db_path, result in scheduler.run_once().items():
+        print(f"{db_path} -> {result['path']} ({result['size_bytes'] / 1024:.0f} KB, "
+              f"{result['duration_ms']:.0f} ms, {result['steps']} 步, 重来 {result['restarts']} 次)")
+    if scheduler.stats()["failed"]:
+        sys.exit(f"备份失败: {scheduler.stats()['last_error']}")
+
+
+if __name__ == "__main__":
+    main()
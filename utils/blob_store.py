@@ -0,0 +1,68 @@
+# utils/blob_store.py
+# 对话正文（LLM 输出的 Markdown）按内容哈希去重 + 压缩存储。
+# 全班拿到同一份生成任务时，数据库里只存一份压缩后的正文。
+import os
+import zlib
+import hashlib
+
+try:  # 可选依赖：装了 zstandard 就优先用 zstd（更快、压缩率更高）
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 太短的文本压缩收益小于开销，直接原样存
+MIN_COMPRESS_BYTES = 256
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+
+
+def _default_codec():
+    codec = os.getenv("BLOB_CODEC")
+    if codec:
+        return codec
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack(text, codec=None):
+    """文本 -> (hash, codec, data)；压缩后不更小就存 raw"""
+    raw = text.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    codec = codec or _default_codec()
+    if codec != "raw" and len(raw) >= MIN_COMPRESS_BYTES:
+        if codec == "zstd" and zstandard is not None:
+            data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+        else:
+            codec, data = "zlib", zlib.compress(raw, ZLIB_LEVEL)
+        if len(data) < len(raw):
+            return digest, codec, data
+    return digest, "raw", raw
+
+
+def unpack(codec, data):
+    if data is None:
+        return None
+    if codec == "raw":
+        raw = data
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("数据库中有 zstd 压缩的记录，请先 pip install zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raise ValueError(f"未知的压缩格式: {codec}")
+    return bytes(raw).decode("utf-8")
+
+
+def put_blob(conn, text):
+    """写入（或复用）一条正文，返回其哈希；引用计数由 conversations 上的触发器维护"""
+    if text is None:
+        return None
+    digest, codec, data = pack(text)
+    conn.execute("INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                 (digest, codec, len(text.encode("utf-8")), data))
+    return digest
@@ -1,18 +1,1061 @@
 # utils/db_helper.py (新建文件)
 import os
+import re
+import json
+import time
+import zlib
+import queue
+import secrets
 import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+from utils.blob_store import put_blob, unpack
+from utils.write_behind import WriteBehindQueue, resolve_id, executed_id
+from utils.backup import BackupScheduler
+from utils.password_hash import hash_password_pooled, verify_password_pooled, verify_dummy_pooled
+
 def get_db_path():
     """智能判断运行环境"""
+    if os.getenv("NETARCHITECT_DB_PATH"):  # 显式指定（压测/迁移/备份脚本用）
+        return os.getenv("NETARCHITECT_DB_PATH")
     if os.getenv("STREAMLIT_CLOUD"):  # 云端环境
         # 使用Streamlit Cloud的持久化目录
         return "/mount/src/netarchitect/netarchitect.db"
     return "netarchitect.db"  # 本地环境
 
-def init_db():
-    db_path = get_db_path()
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    # ...（原有建表逻辑）
-    return conn
\ No newline at end of file
+
+# ====== 连接池（进程级共享，所有会话复用） ======
+# 连接在创建时一次性设置 PRAGMA，之后借出/归还不再重复开销
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",            # 读写并发：读不阻塞写，写不阻塞读
+    "PRAGMA synchronous=NORMAL",          # WAL 下安全且显著减少 fsync
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",  # 锁冲突时等待而不是立刻报 database is locked
+    "PRAGMA mmap_size=268435456",         # 256MB 内存映射读
+    "PRAGMA cache_size=-16000",           # 每连接约 16MB 页缓存
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class ConnectionPool:
+    """线程安全的 SQLite 连接池：按需建连，最多 size 个，用完归还"""
+
+    def __init__(self, db_path, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()  # 后进先出：优先复用最热的连接
+        self._created = 0
+        self._lock = threading.Lock()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               timeout=BUSY_TIMEOUT_MS / 1000)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        # 已达上限：等待其他线程归还
+        return self._idle.get()
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接；正常退出提交，异常回滚"""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=None):
+    """按数据库路径返回进程级单例连接池"""
+    db_path = db_path or get_db_path()
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = _pools[db_path] = ConnectionPool(db_path)
+    return pool
+
+
+@contextmanager
+def get_conn(db_path=None):
+    """用法：with get_conn() as conn: conn.execute(...)"""
+    with get_pool(db_path).connection() as conn:
+        yield conn
+
+
+# ====== 表结构 & 版本化迁移 ======
+_BLOB_TRIGGERS = (
+    # blobs.refs = 引用该正文的 conversations 行数；降到 0 自动回收
+    """CREATE TRIGGER IF NOT EXISTS conv_blob_ai AFTER INSERT ON conversations BEGIN
+        UPDATE blobs SET refs = refs + 1 WHERE hash IN (NEW.content_hash, NEW.solution_hash);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conv_blob_au AFTER UPDATE OF content_hash, solution_hash ON conversations BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE hash IN (OLD.content_hash, OLD.solution_hash);
+        UPDATE blobs SET refs = refs + 1 WHERE hash IN (NEW.content_hash, NEW.solution_hash);
+        DELETE FROM blobs WHERE refs <= 0 AND hash IN (OLD.content_hash, OLD.solution_hash);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conv_blob_ad AFTER DELETE ON conversations BEGIN
+        UPDATE blobs SET refs = refs - 1 WHERE hash IN (OLD.content_hash, OLD.solution_hash);
+        DELETE FROM blobs WHERE refs <= 0 AND hash IN (OLD.content_hash, OLD.solution_hash);
+    END""",
+)
+
+
+def _migrate_to_blobs(conn):
+    """重建 conversations：content/solution 文本列换成指向 blobs 的哈希"""
+    conn.execute("""CREATE TABLE blobs (
+        hash TEXT PRIMARY KEY,      -- 原文 sha256
+        codec TEXT NOT NULL,        -- raw / zlib / zstd
+        size INTEGER NOT NULL,      -- 原文字节数
+        refs INTEGER NOT NULL DEFAULT 0,
+        data BLOB NOT NULL
+    ) WITHOUT ROWID""")
+    conn.execute("""CREATE TABLE conversations_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        module TEXT NOT NULL,  -- 's1', 's3', 'inquiry'
+        title TEXT NOT NULL,
+        content_hash TEXT NOT NULL REFERENCES blobs(hash),
+        solution_hash TEXT REFERENCES blobs(hash),  -- 仅s3需要
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )""")
+    for sql in _BLOB_TRIGGERS:
+        conn.execute(sql.replace("ON conversations", "ON conversations_new"))
+
+    # 分批搬运，避免把整张旧表读进内存
+    old_rows = conn.execute("SELECT id, user_id, module, title, content, solution, created_at FROM conversations")
+    while True:
+        rows = old_rows.fetchmany(1000)
+        if not rows:
+            break
+        conn.executemany(
+            "INSERT INTO conversations_new (id, user_id, module, title, content_hash, solution_hash, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(cid, uid, module, title, put_blob(conn, content), put_blob(conn, solution or None), created)
+             for cid, uid, module, title, content, solution, created in rows])
+
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'conversations'").fetchone()
+    conn.execute("DROP TABLE conversations")
+    conn.execute("ALTER TABLE conversations_new RENAME TO conversations")
+    if seq:  # 保留自增游标，已删除的 id 不会被复用
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'conversations'", seq)
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_conv_user_module_created
+                    ON conversations (user_id, module, created_at DESC, id DESC)""")
+
+
+def owner_token(user_id):
+    """把 user_id 编成 3 个 Unicode 私用区字符 = 恰好一个 trigram。
+
+    全文索引里每个用户的 owner 词都独一无二、且不会和正文撞车，
+    按用户过滤只需读该用户自己的 doclist，与全班数据量无关。
+    """
+    user_id = int(user_id)
+    return "".join(chr(0xE000 + (user_id // 6400 ** k) % 6400) for k in (2, 1, 0))
+
+
+def _create_fts(conn):
+    """FTS5 全文索引：标题/正文/答案 + owner 词，只存倒排索引。
+
+    content='' 不存原文（原文只在 blobs 里压缩存一份），detail=column 不存词位置
+    （对 LLM 输出的长 Markdown，位置表比原文还大）。代价是不支持短语查询：检索词拆成词元求交，
+    多出来的候选、摘要和高亮都由 search_conversations 解压命中行后在 Python 里处理。
+    索引由 insert_conversation / _update_solution / _delete_conversation 在 Python 里同步维护，
+    不依赖自定义 SQL 函数：sqlite3 命令行、DB 浏览器、直接打开的备份都能照常增删改 conversations
+    （绕过这些函数的改动不会进索引，搜索结果会按 conversations 和原文复核，不会搜出已删改的内容）。
+    """
+    # trigram 分词对中文也能做子串匹配（需 SQLite >= 3.34），老版本退回 unicode61
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE conversations_fts USING fts5(
+            title, content, solution, owner, content='', detail=column, tokenize='trigram')""")
+    except sqlite3.OperationalError:
+        conn.execute("""CREATE VIRTUAL TABLE conversations_fts USING fts5(
+            title, content, solution, owner, content='', detail=column)""")
+    _fill_fts(conn)
+
+
+# 索引一行对话所需的原文；contentless 表删除时必须原样给出当初写入的列值
+_FTS_SOURCE = """
+    SELECT c.id, c.user_id, c.title, bc.codec, bc.data, bs.codec, bs.data
+    FROM conversations c
+    JOIN blobs bc ON bc.hash = c.content_hash
+    LEFT JOIN blobs bs ON bs.hash = c.solution_hash"""
+
+
+def _fts_values(row):
+    cid, uid, title, c_codec, c_data, s_codec, s_data = row
+    return cid, title, unpack(c_codec, c_data), unpack(s_codec, s_data), owner_token(uid)
+
+
+def _fts_insert(conn, values):
+    conn.execute("INSERT INTO conversations_fts (rowid, title, content, solution, owner) VALUES (?, ?, ?, ?, ?)",
+                 values)
+
+
+def _fts_delete(conn, values):
+    # SQLite 3.43 之前没有 contentless_delete，只能用 'delete' 命令带上旧值
+    conn.execute("INSERT INTO conversations_fts (conversations_fts, rowid, title, content, solution, owner) "
+                 "VALUES ('delete', ?, ?, ?, ?, ?)", values)
+
+
+def _fts_indexed(conn, conversation_id, user_id):
+    """该行当前的索引列值；不存在或不属于该用户时返回 None"""
+    row = conn.execute(_FTS_SOURCE + " WHERE c.id = ? AND c.user_id = ?", (conversation_id, user_id)).fetchone()
+    return _fts_values(row) if row else None
+
+
+def _fill_fts(conn, batch_size=1000):
+    """按批把已有对话解压后写进索引"""
+    rows = conn.execute(_FTS_SOURCE)
+    while True:
+        batch = rows.fetchmany(batch_size)
+        if not batch:
+            break
+        conn.executemany(
+            "INSERT INTO conversations_fts (rowid, title, content, solution, owner) VALUES (?, ?, ?, ?, ?)",
+            [_fts_values(row) for row in batch])
+
+
+# 版本号记录在 PRAGMA user_version 中；每个迁移只执行一次，
+# 旧的 netarchitect.db 启动时会被原地升级到最新版本。
+# 迁移项可以是 SQL 语句元组，也可以是 fn(conn)（需要搬数据时用）
+MIGRATIONS = [
+    (1, "基础表：用户 + 对话历史", (
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # 对话历史表（统一存储三个模块）
+        '''CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            module TEXT NOT NULL,  -- 's1', 's3', 'inquiry'
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            solution TEXT,         -- 仅s3需要
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )''',
+    )),
+    (2, "历史加载/删除用的复合索引", (
+        # 登录加载：WHERE user_id AND module ORDER BY created_at DESC
+        """CREATE INDEX IF NOT EXISTS idx_conv_user_module_created
+           ON conversations (user_id, module, created_at DESC, id DESC)""",
+        # 侧边栏删除：WHERE user_id AND module AND title
+        """CREATE INDEX IF NOT EXISTS idx_conv_user_module_title
+           ON conversations (user_id, module, title)""",
+        "ANALYZE",
+    )),
+    (3, "对话改用主键定位，删除按标题匹配的索引", (
+        "DROP INDEX IF EXISTS idx_conv_user_module_title",
+    )),
+    (4, "正文/答案改为按内容哈希去重的压缩存储", _migrate_to_blobs),
+    (5, "历史记录全文检索（FTS5）", _create_fts),
+    (6, "持久登录会话（刷新页面免登录）", (
+        # 只存令牌的哈希；snapshot 是三个历史列表（仅标题）的压缩 JSON
+        """CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            snapshot BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)",
+    )),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """把数据库升级到 SCHEMA_VERSION，返回升级后的版本号"""
+    # BEGIN IMMEDIATE 抢写锁：多个进程同时启动时只有一个在做迁移
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = get_schema_version(conn)
+        for version, _desc, step in MIGRATIONS:
+            if version <= current:
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for sql in step:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+            current = version
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return current
+
+
+def init_db(db_path=None):
+    """建表 + 执行未完成的迁移（幂等）；分库模式下同时初始化目录库和已有分片"""
+    with get_conn(db_path) as conn:
+        version = migrate(conn)
+    if db_path is None and SHARDING_MODE != "off":
+        _ensure_directory()
+        with get_conn(get_directory_path()) as conn:
+            shards = [row[0] for row in conn.execute("SELECT DISTINCT shard FROM accounts")]
+        for shard in shards:
+            _ensure_shard(shard_path(shard))
+    return version
+
+
+# ====== 可选分库：按班级或 user_id 哈希把学生分到不同的数据库文件 ======
+# 每个文件有独立的写锁，写吞吐随分片数增长，而不是被单个 netarchitect.db 封顶。
+# 目录库 (netarchitect_directory.db) 负责：分配全局唯一 user_id、记录用户名 -> 分片。
+#   DB_SHARDING=off   单库（默认，与原来完全一致）
+#   DB_SHARDING=hash  按 user_id % DB_SHARD_COUNT 分片
+#   DB_SHARDING=class 按班级分片（未填班级时退回哈希）
+# 每个班级分片都是一个数据库文件 + 一个连接池，班级只能来自老师导入的花名册（utils/roster_import）
+# 或 DB_CLASSES 配置的列表（逗号分隔）；登录页注册只能从中选择，不能随手造出新分片。
+SHARDING_MODE = os.getenv("DB_SHARDING", "off")
+SHARD_COUNT = int(os.getenv("DB_SHARD_COUNT", "8"))
+CONFIGURED_CLASSES = tuple(c.strip() for c in os.getenv("DB_CLASSES", "").split(",") if c.strip())
+MAIN_SHARD = "main"  # 开启分库前就存在的老用户仍留在主库
+
+_directory_ready = False
+_directory_lock = threading.Lock()
+_ready_shards = set()
+_user_shard_cache = {}  # user_id -> 分片数据库路径（用户不会换分片，可永久缓存）
+
+
+def get_directory_path():
+    return str(Path(get_db_path()).with_name("netarchitect_directory.db"))
+
+
+def shard_path(shard):
+    if shard == MAIN_SHARD:
+        return get_db_path()
+    return str(Path(get_db_path()).parent / "shards" / f"{shard}.db")
+
+
+def _pick_shard(user_id, class_name=None):
+    if SHARDING_MODE == "class" and class_name:
+        # 班级名直接作文件名，去掉路径分隔符等不安全字符
+        safe = re.sub(r"[^\w\-]", "_", class_name.strip())
+        if safe:
+            return f"class_{safe}"
+    return f"hash_{user_id % SHARD_COUNT:02d}"
+
+
+def _ensure_directory():
+    global _directory_ready
+    if _directory_ready:
+        return
+    with _directory_lock:
+        if _directory_ready:
+            return
+        with get_conn(get_directory_path()) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                shard TEXT NOT NULL,
+                class_name TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )""")
+            # 新分配的 id 从主库已有最大 id 之后开始，和老用户不撞号
+            if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'accounts'").fetchone() is None:
+                with get_conn(get_db_path()) as main:
+                    legacy_max = main.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('accounts', ?)", (legacy_max,))
+        _directory_ready = True
+
+
+def _ensure_shard(path):
+    if path not in _ready_shards:
+        init_db(path)
+        _ready_shards.add(path)
+
+
+def user_db_path(user_id):
+    """该用户数据所在的数据库文件；未分库时就是 get_db_path()"""
+    if SHARDING_MODE == "off":
+        return get_db_path()
+    path = _user_shard_cache.get(user_id)
+    if path is None:
+        _ensure_directory()
+        with get_conn(get_directory_path()) as conn:
+            row = conn.execute("SELECT shard FROM accounts WHERE id = ?", (user_id,)).fetchone()
+        path = shard_path(row[0] if row else MAIN_SHARD)
+        _ensure_shard(path)
+        _user_shard_cache[user_id] = path
+    return path
+
+
+def registration_classes():
+    """注册时可选的班级：配置列表 + 花名册导入时已登记的班级"""
+    if SHARDING_MODE != "class":
+        return []
+    _ensure_directory()
+    with get_conn(get_directory_path()) as conn:
+        known = {row[0] for row in conn.execute(
+            "SELECT DISTINCT class_name FROM accounts WHERE class_name IS NOT NULL")}
+    return sorted(known | set(CONFIGURED_CLASSES))
+
+
+def find_user_id(username):
+    """按用户名查全局 user_id（分库时查目录库），不存在返回 None"""
+    if SHARDING_MODE != "off":
+        account = _lookup_account(username)
+        return account[0] if account else None
+    with get_conn() as conn:
+        row = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+
+def account_classes(user_ids):
+    """目录库里登记的班级 {user_id: class_name}；未分库或没登记的不在结果里"""
+    if SHARDING_MODE == "off" or not os.path.exists(get_directory_path()):
+        return {}
+    found = {}
+    ids = list(user_ids)
+    with get_conn(get_directory_path()) as conn:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            found.update(conn.execute(
+                f"SELECT id, class_name FROM accounts WHERE class_name IS NOT NULL AND id IN ({marks})", chunk))
+    return found
+
+
+def _lookup_account(username):
+    """目录库查 (user_id, 分片)；主库里的老用户首次出现时登记进目录"""
+    _ensure_directory()
+    with get_conn(get_directory_path()) as conn:
+        row = conn.execute("SELECT id, shard FROM accounts WHERE username = ?", (username,)).fetchone()
+    if row:
+        return row
+    with get_conn(get_db_path()) as main:
+        legacy = main.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    if legacy is None:
+        return None
+    with get_conn(get_directory_path()) as conn:
+        conn.execute("INSERT OR IGNORE INTO accounts (id, username, shard) VALUES (?, ?, ?)",
+                     (legacy[0], username, MAIN_SHARD))
+    return legacy[0], MAIN_SHARD
+
+
+# ====== 用户认证 & 对话存取（所有调用都走连接池） ======
+# 每个模块在侧边栏保留的历史条数
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "10"))
+
+
+def register_user(username, password, class_name=None):
+    # scrypt 在有界线程池里算，不占满页面脚本线程（见 utils/password_hash）
+    password_hash = hash_password_pooled(password)
+    if SHARDING_MODE == "off":
+        try:
+            with get_conn() as conn:
+                conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                             (username, password_hash))
+            return True, "注册成功！请登录"
+        except sqlite3.IntegrityError:
+            return False, "用户名已存在"
+
+    if class_name and SHARDING_MODE == "class" and class_name not in registration_classes():
+        return False, "没有这个班级，请从列表中选择或联系老师"
+    if _lookup_account(username) is not None:
+        return False, "用户名已存在"
+    try:
+        # 先在目录库占位拿到全局唯一 id，再据此决定分片
+        with get_conn(get_directory_path()) as conn:
+            user_id = conn.execute("INSERT INTO accounts (username, shard, class_name) VALUES (?, '', ?)",
+                                   (username, class_name)).lastrowid
+            shard = _pick_shard(user_id, class_name)
+            conn.execute("UPDATE accounts SET shard = ? WHERE id = ?", (shard, user_id))
+    except sqlite3.IntegrityError:
+        return False, "用户名已存在"
+    path = shard_path(shard)
+    try:
+        _ensure_shard(path)
+        with get_conn(path) as conn:
+            conn.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+                         (user_id, username, password_hash))
+    except Exception:
+        # 分片写失败：撤销目录里的占位，避免留下无法登录的账号
+        with get_conn(get_directory_path()) as conn:
+            conn.execute("DELETE FROM accounts WHERE id = ?", (user_id,))
+        raise
+    _user_shard_cache[user_id] = path
+    return True, "注册成功！请登录"
+
+
+def _existing_usernames(conn, table, usernames):
+    found = set()
+    names = list(usernames)
+    for i in range(0, len(names), 500):  # 控制在 SQLite 变量个数上限以内
+        chunk = names[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f"SELECT username FROM {table} WHERE username IN ({marks})", chunk))
+    return found
+
+
+def register_users_bulk(accounts):
+    """批量建号（花名册导入）。
+
+    accounts: [(username, password_hash, class_name), ...]，密码须已哈希、用户名不重复。
+    每个数据库一个事务；返回 (新建的用户名列表, 已存在而跳过的用户名列表)。
+    """
+    if SHARDING_MODE == "off":
+        with get_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = _existing_usernames(conn, "users", (a[0] for a in accounts))
+            rows = [(name, pw_hash) for name, pw_hash, _cls in accounts if name not in existing]
+            conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)", rows)
+        return [name for name, _ in rows], sorted(existing)
+
+    _ensure_directory()
+    with get_conn(get_db_path()) as main:
+        existing = _existing_usernames(main, "users", (a[0] for a in accounts))
+    by_path = {}
+    with get_conn(get_directory_path()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        existing |= _existing_usernames(conn, "accounts", (a[0] for a in accounts))
+        for name, pw_hash, class_name in accounts:
+            if name in existing:
+                continue
+            user_id = conn.execute("INSERT INTO accounts (username, shard, class_name) VALUES (?, '', ?)",
+                                   (name, class_name)).lastrowid
+            shard = _pick_shard(user_id, class_name)
+            conn.execute("UPDATE accounts SET shard = ? WHERE id = ?", (shard, user_id))
+            by_path.setdefault(shard_path(shard), []).append((user_id, name, pw_hash))
+    created = []
+    try:
+        for path, rows in by_path.items():
+            _ensure_shard(path)
+            with get_conn(path) as conn:
+                conn.executemany("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)", rows)
+            created.extend(rows)
+    except Exception:
+        # 和 register_user 一样：分片没写成的账号从目录里撤掉
+        failed = [(row[0],) for rows in by_path.values() for row in rows if row not in created]
+        with get_conn(get_directory_path()) as conn:
+            conn.executemany("DELETE FROM accounts WHERE id = ?", failed)
+        raise
+    return [name for _id, name, _pw in created], sorted(existing)
+
+
+def authenticate_user(username, password):
+    path = get_db_path()
+    if SHARDING_MODE != "off":
+        account = _lookup_account(username)
+        if account is None:
+            verify_dummy_pooled(password)
+            return None
+        path = shard_path(account[1])
+        _ensure_shard(path)
+    with get_conn(path) as conn:
+        row = conn.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,)).fetchone()
+    if row is None:
+        # 用户名不存在也照样算一次 scrypt，否则响应快慢就能用来枚举账号
+        verify_dummy_pooled(password)
+        return None
+    user_id, stored = row
+    ok, needs_rehash = verify_password_pooled(password, stored)
+    if not ok:
+        return None
+    if needs_rehash:
+        # 旧的无盐 SHA-256（或低于当前代价参数的 scrypt）：登录成功时顺手升级，走后台写队列
+        _enqueue(user_id, _set_password_hash, hash_password_pooled(password))
+    return user_id
+
+
+def _set_password_hash(conn, user_id, password_hash):
+    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+
+
+_HISTORY_BRANCH = """SELECT * FROM (
+    SELECT id, module, title, created_at, solution_hash IS NOT NULL FROM conversations
+    WHERE user_id = :uid AND module = '{module}'
+    ORDER BY created_at DESC, id DESC LIMIT :limit)"""
+
+# 三个模块拼成一条语句：一次往返，每个分支都只沿
+# (user_id, module, created_at DESC) 索引读 limit 行，与历史总量无关
+_HISTORY_SQL = "\nUNION ALL\n".join(_HISTORY_BRANCH.format(module=m) for m in ("s1", "s3", "inquiry"))
+
+
+def load_user_conversations(user_id, limit=None):
+    """加载用户历史列表（只有 id/标题/时间，正文用 load_conversation_body 按需取）"""
+    flush_user_writes(user_id)  # 先等自己排队中的写入落盘，保证读到刚写的记录
+    with get_conn(user_db_path(user_id)) as conn:
+        rows = conn.execute(_HISTORY_SQL, {"uid": user_id, "limit": limit or HISTORY_LIMIT}).fetchall()
+
+    history = {"s1": [], "s3": [], "inquiry": []}
+    for conv_id, module, title, created_at, has_solution in rows:
+        record = {"id": conv_id, "title": title, "created_at": created_at}
+        if module == "s3":  # 仅s3需要答案
+            record["has_solution"] = bool(has_solution)
+        history[module].append(record)
+    # 查询结果是新→旧；会话列表约定最新在末尾（append 新记录、侧边栏 reversed 显示）
+    for records in history.values():
+        records.reverse()
+    return history["s1"], history["s3"], history["inquiry"]
+
+
+def load_conversation_page(user_id, module, before=None, limit=None):
+    """keyset 分页加载某个模块更早的历史。
+
+    before 为上一页最旧记录的 (created_at, id) 游标；沿索引直接定位，
+    第 N 页和第 1 页开销相同。返回 (records 旧→新, next_cursor)，
+    next_cursor 为 None 表示已经没有更早的记录。
+    """
+    limit = limit or HISTORY_LIMIT
+    sql = ("SELECT id, title, created_at, solution_hash IS NOT NULL FROM conversations "
+           "WHERE user_id = ? AND module = ?")
+    params = [user_id, module]
+    if before is not None:
+        sql += " AND (created_at, id) < (?, ?)"
+        params.extend(before)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)  # 多取一行判断是否还有下一页
+
+    if before is None:  # 带游标翻的是更早的页，本会话刚写的记录不会落在其中
+        flush_user_writes(user_id)
+    with get_conn(user_db_path(user_id)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    has_more = len(rows) > limit
+    records = []
+    for conv_id, title, created_at, has_solution in reversed(rows[:limit]):
+        record = {"id": conv_id, "title": title, "created_at": created_at}
+        if module == "s3":
+            record["has_solution"] = bool(has_solution)
+        records.append(record)
+    return records, (history_cursor(records[0]) if has_more else None)
+
+
+def history_cursor(record, user_id=None):
+    """由一条已加载的历史记录得到分页游标。
+    本次会话新建的记录没有 created_at，传入 user_id 时按主键回库查（查不到返回 None）"""
+    if "created_at" in record:
+        return record["created_at"], record["id"]
+    if user_id is None:
+        return None
+    conversation_id = resolve_id(record.get("id"))
+    if conversation_id is None:
+        return None
+    with get_conn(user_db_path(user_id)) as conn:
+        row = conn.execute("SELECT created_at FROM conversations WHERE id = ? AND user_id = ?",
+                           (conversation_id, user_id)).fetchone()
+    return (row[0], conversation_id) if row else None
+
+
+def load_conversation_body(user_id, conversation_id):
+    """按主键取一条对话的正文和答案；不存在或不属于该用户时返回 None"""
+    with get_conn(user_db_path(user_id)) as conn:
+        row = conn.execute("""
+            SELECT bc.codec, bc.data, bs.codec, bs.data
+            FROM conversations c
+            JOIN blobs bc ON bc.hash = c.content_hash
+            LEFT JOIN blobs bs ON bs.hash = c.solution_hash
+            WHERE c.id = ? AND c.user_id = ?""", (conversation_id, user_id)).fetchone()
+    if row is None:
+        return None
+    c_codec, c_data, s_codec, s_data = row
+    return {"content": unpack(c_codec, c_data), "solution": unpack(s_codec, s_data) or ""}
+
+
+# trigram 分词下，少于 3 个字符的词无法走索引，只在该用户自己的记录里按原文过滤
+SEARCH_MIN_TERM = 3
+SNIPPET_CHARS = 40
+
+
+_fts_trigram = {}  # 数据库路径 -> 索引是否用 trigram 分词
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _fts_tokens(conn, path, term):
+    """一个检索词 -> 索引里必须同时出现的词元（detail=column 不支持多词元的短语查询）"""
+    trigram = _fts_trigram.get(path)
+    if trigram is None:
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'conversations_fts'").fetchone()
+        trigram = _fts_trigram[path] = bool(row) and "trigram" in row[0]
+    if trigram:
+        return sorted({term[i:i + 3] for i in range(len(term) - 2)})
+    return sorted(set(re.findall(r"\w+", term)))
+
+
+def _term_pattern(terms):
+    # 长词优先，"VLAN 10" 和 "VLAN" 同时出现时整段高亮
+    return re.compile("|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True)), re.IGNORECASE)
+
+
+def _highlight(text, pattern):
+    return pattern.sub(lambda m: f"**{m.group(0)}**", text)
+
+
+def _snippet(text, pattern, width=SNIPPET_CHARS):
+    """仿 FTS5 snippet()：截取首个命中附近约 width 个字符，命中词用 ** 包裹"""
+    if not text:
+        return ""
+    m = pattern.search(text)
+    start = max(0, m.start() - width // 4) if m else 0
+    end = min(len(text), max(start + width, m.end() if m else 0))
+    return ("…" if start else "") + _highlight(text[start:end], pattern) + ("…" if end < len(text) else "")
+
+
+def search_conversations(user_id, query, module=None, limit=10):
+    """在该用户三个模块的历史里全文检索。
+
+    标题命中的排在前面，其余按时间倒序。返回
+    [{"id", "module", "title", "created_at", "title_hl", "snippet"}]，
+    title_hl / snippet 中命中的词用 ** 包裹（可直接交给 st.markdown）。
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    sql = """
+        SELECT c.id, c.module, c.title, c.created_at
+        FROM conversations_fts f
+        JOIN conversations c ON c.id = f.rowid
+        WHERE conversations_fts MATCH ?"""
+    params = []
+    if module:
+        sql += " AND c.module = ?"
+        params.append(module)
+    # 不用 bm25()：它要遍历全班所有命中文档算 IDF，常见词会慢一个数量级；
+    # 该用户自己的命中集很小，按“标题命中词数 + 时间”排序足够且开销恒定
+    sql += " ORDER BY " + " + ".join(["(instr(lower(c.title), lower(?)) > 0)"] * len(terms))
+    sql += " DESC, c.created_at DESC, c.id DESC"
+    params.extend(terms)
+
+    # 不等后台写队列：刚排队的记录稍后即可搜到，换来搜索不被别人的写入拖慢
+    path = user_db_path(user_id)
+    with get_conn(path) as conn:
+        match = [f'owner : "{owner_token(user_id)}"']
+        for t in terms:
+            tokens = _fts_tokens(conn, path, t) if len(t) >= SEARCH_MIN_TERM else None
+            if tokens:
+                match.append("{title content solution} : (" + " AND ".join(map(_fts_phrase, tokens)) + ")")
+        candidates = conn.execute(sql, [" AND ".join(match)] + params).fetchall()
+
+    # 索引只能判断词元都出现过：逐条解压候选行，按原文复核每个检索词（含短词、
+    # 以及绕过 insert_conversation 改过的行），凑够 limit 条为止；
+    # 摘要取自真正命中的那一列，只有答案命中时显示答案片段
+    pattern = _term_pattern(terms)
+    folded = [t.casefold() for t in terms]
+    results = []
+    for conv_id, mod, title, created_at in candidates:
+        body = load_conversation_body(user_id, conv_id)
+        if body is None:
+            continue
+        texts = [title.casefold(), body["content"].casefold(), body["solution"].casefold()]
+        if not all(any(t in text for text in texts) for t in folded):
+            continue
+        column = body["solution"] if pattern.search(body["solution"]) and not pattern.search(body["content"]) \
+            else body["content"]
+        results.append({"id": conv_id, "module": mod, "title": title, "created_at": created_at,
+                        "title_hl": _highlight(title, pattern), "snippet": _snippet(column, pattern)})
+        if len(results) >= limit:
+            break
+    return results
+
+
+def insert_conversation(conn, user_id, module, title, content, solution=None, created_at=None):
+    """在给定连接（事务）里写一条对话并建索引，返回主键；导入脚本也用它"""
+    cur = conn.execute("INSERT INTO conversations (user_id, module, title, content_hash, solution_hash, created_at) "
+                       "VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                       (user_id, module, title, put_blob(conn, content), put_blob(conn, solution or None),
+                        created_at))
+    _fts_insert(conn, (cur.lastrowid, title, content, solution or None, owner_token(user_id)))
+    return cur.lastrowid
+
+
+def _update_solution(conn, user_id, conversation_id, solution):
+    old = _fts_indexed(conn, conversation_id, user_id)
+    if old is None:
+        return
+    conn.execute("UPDATE conversations SET solution_hash = ? WHERE id = ? AND user_id = ?",
+                 (put_blob(conn, solution or None), conversation_id, user_id))
+    _fts_delete(conn, old)
+    _fts_insert(conn, old[:3] + (solution or None, old[4]))
+
+
+def _delete_conversation(conn, user_id, conversation_id):
+    old = _fts_indexed(conn, conversation_id, user_id)
+    if old is None:
+        return
+    conn.execute("DELETE FROM conversations WHERE id = ? AND user_id = ?", (conversation_id, user_id))
+    _fts_delete(conn, old)
+
+
+def save_conversation(user_id, module, title, content, solution=None):
+    """保存单条对话到数据库，返回新记录的 id"""
+    with get_conn(user_db_path(user_id)) as conn:
+        return insert_conversation(conn, user_id, module, title, content, solution)
+
+
+def update_conversation_solution(user_id, conversation_id, solution):
+    """按主键回写 s3 参考答案"""
+    with get_conn(user_db_path(user_id)) as conn:
+        _update_solution(conn, user_id, conversation_id, solution)
+
+
+def delete_conversation(user_id, conversation_id):
+    """按主键删除（带 user_id 校验，防止删到别人的记录）"""
+    with get_conn(user_db_path(user_id)) as conn:
+        _delete_conversation(conn, user_id, conversation_id)
+
+
+# ====== 后台批量写入（页面线程只入队，不等 SQLite） ======
+# 返回 PendingWrite；会话记录里的 "id" 可以直接存它，
+# 之后的更新/删除也走同一队列，按 FIFO 顺序自动引用到真实主键
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindQueue(
+                    get_conn,
+                    maxsize=int(os.getenv("DB_WRITE_QUEUE_SIZE", "10000")),
+                    batch_size=int(os.getenv("DB_WRITE_BATCH_SIZE", "200")),
+                    durability=os.getenv("DB_DURABILITY", "async"),
+                )
+    return _writer
+
+
+# 每个用户最近一次排队的写入；读之前只需等它（FIFO 保证更早的也已执行），
+# 不必等全班的队列排空
+_last_user_write = {}
+
+
+def _enqueue(user_id, fn, *args):
+    op = get_writer().submit(fn, user_id, *args, db_path=user_db_path(user_id))
+    _last_user_write[user_id] = op
+    return op
+
+
+def enqueue_save_conversation(user_id, module, title, content, solution=None):
+    return _enqueue(user_id, insert_conversation, module, title, content, solution)
+
+
+def enqueue_update_solution(user_id, conversation_id, solution):
+    return _enqueue(user_id, _update_solution, conversation_id, solution)
+
+
+def enqueue_delete_conversation(user_id, conversation_id):
+    return _enqueue(user_id, _delete_conversation, conversation_id)
+
+
+def flush_user_writes(user_id, timeout=None):
+    """等待该用户已排队的写入提交（读自己刚写的数据前调用）"""
+    op = _last_user_write.get(user_id)
+    if op is None:
+        return
+    try:
+        op.wait(timeout)
+    except Exception:  # 写失败已由写线程记录日志，这里不影响读
+        pass
+    if _last_user_write.get(user_id) is op:
+        _last_user_write.pop(user_id, None)
+
+
+def flush_writes(timeout=None):
+    """等待所有排队写入提交（关停/备份/测试前调用）"""
+    if _writer is not None:
+        _writer.flush(timeout)
+
+
+def write_stats():
+    """写队列计数器：队列深度、提交批次、提交耗时等"""
+    return get_writer().stats()
+
+
+# ====== 在线备份（utils/backup.py，后台线程分步拷贝，不停服） ======
+_backups = None
+
+
+def all_db_paths():
+    """需要备份的全部数据库文件：主库，分库模式下再加目录库和各分片（目录库排在主库之后）"""
+    paths = [get_db_path()]
+    if SHARDING_MODE != "off" and os.path.exists(get_directory_path()):
+        paths.append(get_directory_path())
+        with get_conn(get_directory_path()) as conn:
+            shards = [row[0] for row in conn.execute("SELECT DISTINCT shard FROM accounts")]
+        paths.extend(shard_path(shard) for shard in shards if shard != MAIN_SHARD)
+    return paths
+
+
+def get_backup_dir():
+    return os.getenv("DB_BACKUP_DIR") or str(Path(get_db_path()).parent / "backups")
+
+
+def start_backups():
+    """按 DB_BACKUP_INTERVAL_MIN 启动定时备份（0 = 不启用），每个进程只启动一次"""
+    global _backups
+    interval_min = float(os.getenv("DB_BACKUP_INTERVAL_MIN", "0"))
+    if _backups is None and interval_min > 0:
+        _backups = BackupScheduler(all_db_paths, get_backup_dir(), interval_s=interval_min * 60).start()
+    return _backups
+
+
+def backup_stats():
+    """最近一次备份的耗时、大小、路径；未启用定时备份时返回 None"""
+    return _backups.stats() if _backups is not None else None
+
+
+# ====== 持久登录会话：刷新页面后凭令牌恢复登录和历史列表 ======
+# 令牌形如 "<user_id>.<随机串>"：user_id 用来定位分片，随机串才是凭据（库里只存其哈希）。
+# 恢复时按主键查一行即可拿回 user_id 和历史快照，不再走密码校验 + 三个历史查询。
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "12"))
+HISTORY_MODULES = ("s1", "s3", "inquiry")
+
+
+def _parse_token(token):
+    user_id, _, secret = (token or "").partition(".")
+    if not user_id.isdigit() or not secret:
+        return None, None
+    return int(user_id), hashlib.sha256(secret.encode()).hexdigest()
+
+
+def _snapshot_records(histories):
+    """会话里的历史列表 -> 只含标题等元数据的记录（正文按需加载，不进快照）"""
+    snapshot = {}
+    for module, records in zip(HISTORY_MODULES, histories):
+        snapshot[module] = []
+        for r in records:
+            record = {"id": r.get("id"), "title": r["title"],
+                      "has_solution": bool(r.get("has_solution") or r.get("solution"))}
+            if "created_at" in r:  # 本次会话新建的记录没有 created_at，保持原样
+                record["created_at"] = r["created_at"]
+            snapshot[module].append(record)
+    return snapshot
+
+
+def _pack_snapshot(snapshot, cursors):
+    for records in snapshot.values():
+        for record in records:
+            record["id"] = resolve_id(record["id"])
+    payload = {"histories": snapshot, "cursors": cursors}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def create_session(user_id, username, histories, cursors):
+    """登录成功后调用，返回放进 URL 的令牌"""
+    secret = secrets.token_urlsafe(24)
+    token = f"{user_id}.{secret}"
+    now = time.time()
+    with get_conn(user_db_path(user_id)) as conn:
+        conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+        conn.execute("INSERT INTO sessions (token_hash, user_id, username, snapshot, expires_at) "
+                     "VALUES (?, ?, ?, ?, ?)",
+                     (_parse_token(token)[1], user_id, username,
+                      _pack_snapshot(_snapshot_records(histories), cursors),
+                      now + SESSION_TTL_HOURS * 3600))
+    return token
+
+
+def _store_session_snapshot(conn, user_id, token_hash, snapshot, cursors):
+    # 在写线程里执行：本会话先前排队的保存都已执行，PendingWrite 可直接取到主键；
+    # 保存失败的记录不进快照。不改动 snapshot 本身：整批回滚重放时还要重新取主键
+    resolved = {}
+    for module, records in snapshot.items():
+        resolved[module] = []
+        for record in records:
+            row_id = executed_id(record["id"])
+            if row_id is not None:
+                resolved[module].append(dict(record, id=row_id))
+    conn.execute("UPDATE sessions SET snapshot = ? WHERE token_hash = ? AND user_id = ?",
+                 (_pack_snapshot(resolved, cursors), token_hash, user_id))
+
+
+def enqueue_session_snapshot(token, histories, cursors):
+    """历史列表有变化时刷新快照；走后台写队列，排在该用户之前的保存之后"""
+    user_id, token_hash = _parse_token(token)
+    if user_id is None:
+        return None
+    return _enqueue(user_id, _store_session_snapshot, token_hash, _snapshot_records(histories), dict(cursors))
+
+
+def restore_session(token):
+    """令牌有效时返回 {"user_id", "username", "histories", "cursors"}，否则 None"""
+    user_id, token_hash = _parse_token(token)
+    if user_id is None:
+        return None
+    flush_user_writes(user_id)  # 刚排队的快照更新先落库
+    with get_conn(user_db_path(user_id)) as conn:
+        row = conn.execute("SELECT username, snapshot, expires_at FROM sessions WHERE token_hash = ? AND user_id = ?",
+                           (token_hash, user_id)).fetchone()
+        if row is not None and row[2] <= time.time():
+            # 过期的令牌顺手删掉，不必等下一次有人登录时才清理
+            conn.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash,))
+            row = None
+    if row is None:
+        return None
+    payload = json.loads(zlib.decompress(row[1]).decode("utf-8"))
+    histories = payload["histories"]
+    for record in histories["s1"] + histories["inquiry"]:
+        record.pop("has_solution", None)
+    return {"user_id": user_id, "username": row[0],
+            "histories": tuple(histories[m] for m in HISTORY_MODULES),
+            # JSON 把游标元组存成了列表，还原成 (created_at, id)
+            "cursors": {m: tuple(c) if c else None for m, c in payload["cursors"].items()}}
+
+
+def delete_session(token):
+    """退出登录：令牌立即失效"""
+    user_id, token_hash = _parse_token(token)
+    if user_id is None:
+        return
+    with get_conn(user_db_path(user_id)) as conn:
+        conn.execute("DELETE FROM sessions WHERE token_hash = ? AND user_id = ?", (token_hash, user_id))
@@ -0,0 +1,348 @@
+# utils/history_transfer.py
+# 用户与对话历史的流式导出 / 导入。
+# 全程按批读写，内存占用与数据总量无关；可用于：
+#   - 备份、在本地 netarchitect.db 与 /mount/src/netarchitect/netarchitect.db 之间迁移
+#   - 把学期数据交给分析（Parquet 可直接被 pandas/DuckDB/Spark 读取）
+#
+# 用法：
+#   python -m utils.history_transfer export --db netarchitect.db --out history.jsonl.gz
+#   python -m utils.history_transfer import --db /mount/src/netarchitect/netarchitect.db --in history.jsonl.gz
+#   python -m utils.history_transfer export --format parquet --out term_2024/
+#   python -m utils.history_transfer export --out - | python -m utils.history_transfer import --db new.db --in -
+#
+# 默认不导出密码哈希（导出文件常常要交给别人分析）；整库迁移时加 --include-credentials。
+# 不带哈希导入的新账号无法登录，需要重新设置密码。
+#
+# 不指定 --db 时按 DB_SHARDING 的布局读写：导出遍历主库和全部分片（all_db_paths），
+# 导入经目录库分配 user_id / 分片（register_users_bulk），对话写进各自用户的分片（user_db_path）。
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_helper import (get_conn, init_db, insert_conversation, all_db_paths, get_directory_path,  # noqa: E402
+                             user_db_path, find_user_id, account_classes, register_users_bulk,
+                             SHARDING_MODE)
+from utils.blob_store import unpack  # noqa: E402
+
+BATCH_SIZE = 2000
+
+USER_FIELDS = ("id", "username", "class_name", "created_at")
+CREDENTIAL_FIELDS = ("password_hash",)
+# 不是任何密码的哈希：导入时没有密码哈希的账号先锁住
+LOCKED_PASSWORD = "!"
+CONVERSATION_FIELDS = ("id", "user_id", "username", "module", "title", "content", "solution", "created_at")
+
+
+# ====== 读：数据库 -> 记录生成器 ======
+def source_paths(db_path=None):
+    """要导出的数据库：指定了就只读它，否则主库 + 全部分片（目录库只用来查班级）"""
+    if db_path is not None:
+        return [db_path]
+    return [path for path in all_db_paths() if path != get_directory_path()]
+
+
+def iter_users(db_path, batch_size=BATCH_SIZE, include_credentials=False):
+    # 班级只记在目录库里
+    columns = ("id", "username", "created_at") + (CREDENTIAL_FIELDS if include_credentials else ())
+    with get_conn(db_path) as conn:
+        cur = conn.execute(f"SELECT {', '.join(columns)} FROM users ORDER BY id")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            classes = account_classes(row[0] for row in rows)
+            for row in rows:
+                user = dict(zip(columns, row))
+                user["class_name"] = classes.get(user["id"])
+                yield user
+
+
+def iter_all_users(paths, batch_size=BATCH_SIZE, include_credentials=False):
+    for path in paths:
+        yield from iter_users(path, batch_size, include_credentials)
+
+
+def iter_all_conversations(paths, batch_size=BATCH_SIZE):
+    for path in paths:
+        yield from iter_conversations(path, batch_size)
+
+
+def iter_conversations(db_path, batch_size=BATCH_SIZE):
+    """逐批读取并解压正文；同一份正文在一批内只解压一次"""
+    with get_conn(db_path) as conn:
+        cur = conn.execute("""
+            SELECT c.id, c.user_id, u.username, c.module, c.title,
+                   bc.codec, bc.data, bs.codec, bs.data, c.created_at,
+                   c.content_hash, c.solution_hash
+            FROM conversations c
+            LEFT JOIN users u ON u.id = c.user_id
+            JOIN blobs bc ON bc.hash = c.content_hash
+            LEFT JOIN blobs bs ON bs.hash = c.solution_hash
+            ORDER BY c.id""")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            texts = {}
+            for (cid, uid, username, module, title, c_codec, c_data, s_codec, s_data,
+                 created_at, c_hash, s_hash) in rows:
+                if c_hash not in texts:
+                    texts[c_hash] = unpack(c_codec, c_data)
+                if s_hash is not None and s_hash not in texts:
+                    texts[s_hash] = unpack(s_codec, s_data)
+                yield {"id": cid, "user_id": uid, "username": username, "module": module,
+                       "title": title, "content": texts[c_hash],
+                       "solution": texts[s_hash] if s_hash is not None else None,
+                       "created_at": created_at}
+
+
+# ====== 写：记录流 -> 数据库（大批量事务） ======
+class Importer:
+    """按用户名对齐用户（目标库已存在同名用户则复用，不覆盖密码），
+    对话按批写入，每批每个数据库一个事务。
+
+    db_path 为 None 且开启了分库时，账号经目录库建立（和花名册导入一样按班级 / 哈希分片），
+    对话写进所属用户的分片。"""
+
+    def __init__(self, db_path, batch_size=BATCH_SIZE):
+        self.db_path = db_path
+        self.sharded = db_path is None and SHARDING_MODE != "off"
+        self.batch_size = batch_size
+        self.user_map = {}  # 源库 user_id -> 目标库 user_id
+        self.stats = {"users_created": 0, "users_existing": 0, "users_locked": 0, "conversations": 0, "skipped": 0}
+        self._users = []
+        self._conversations = []
+        init_db(db_path)
+
+    def add(self, kind, record):
+        if kind == "user":
+            self._users.append(record)
+            if len(self._users) >= self.batch_size:
+                self._flush_users()
+        elif kind == "conversation":
+            # 对话引用的用户必须先落库
+            if self._users:
+                self._flush_users()
+            self._conversations.append(record)
+            if len(self._conversations) >= self.batch_size:
+                self._flush_conversations()
+        else:
+            raise ValueError(f"未知的记录类型: {kind}")
+
+    def finish(self):
+        self._flush_users()
+        self._flush_conversations()
+        return self.stats
+
+    def _flush_users(self):
+        if not self._users:
+            return
+        if self.sharded:
+            self._flush_users_sharded()
+            return
+        with get_conn(self.db_path) as conn:
+            for user in self._users:
+                password_hash = user.get("password_hash") or LOCKED_PASSWORD
+                cur = conn.execute("INSERT OR IGNORE INTO users (username, password_hash, created_at) "
+                                   "VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+                                   (user["username"], password_hash, user.get("created_at")))
+                if cur.rowcount:
+                    self.stats["users_created"] += 1
+                    if password_hash == LOCKED_PASSWORD:
+                        self.stats["users_locked"] += 1
+                    new_id = cur.lastrowid
+                else:
+                    self.stats["users_existing"] += 1
+                    new_id = conn.execute("SELECT id FROM users WHERE username = ?",
+                                          (user["username"],)).fetchone()[0]
+                self.user_map[user["id"]] = new_id
+        self._users = []
+
+    def _flush_users_sharded(self):
+        # 同一批里的重名只建第一个（register_users_bulk 要求用户名不重复）
+        accounts = {}
+        for user in self._users:
+            accounts.setdefault(user["username"], (user["username"], user.get("password_hash") or LOCKED_PASSWORD,
+                                                   user.get("class_name")))
+        created, existing = register_users_bulk(list(accounts.values()))
+        self.stats["users_created"] += len(created)
+        self.stats["users_existing"] += len(self._users) - len(created)
+        self.stats["users_locked"] += sum(1 for name in created if accounts[name][1] == LOCKED_PASSWORD)
+        for user in self._users:
+            self.user_map[user["id"]] = find_user_id(user["username"])
+        self._users = []
+
+    def _resolve_user(self, record):
+        uid = self.user_map.get(record.get("user_id"))
+        if uid is None and record.get("username"):
+            if self.sharded:
+                uid = find_user_id(record["username"])
+            else:
+                with get_conn(self.db_path) as conn:
+                    row = conn.execute("SELECT id FROM users WHERE username = ?", (record["username"],)).fetchone()
+                uid = row[0] if row else None
+            if uid is not None:
+                self.user_map[record.get("user_id")] = uid
+        return uid
+
+    def _flush_conversations(self):
+        if not self._conversations:
+            return
+        by_path = {}
+        for record in self._conversations:
+            uid = self._resolve_user(record)
+            if uid is None:  # 找不到所属用户，跳过并计数
+                self.stats["skipped"] += 1
+                continue
+            path = user_db_path(uid) if self.sharded else self.db_path
+            by_path.setdefault(path, []).append((uid, record))
+        for path, records in by_path.items():
+            with get_conn(path) as conn:
+                for uid, record in records:
+                    # 逐条写入：正文去重和全文索引都由 insert_conversation 维护
+                    insert_conversation(conn, uid, record["module"], record["title"], record["content"],
+                                        record.get("solution"), record.get("created_at"))
+            self.stats["conversations"] += len(records)
+        self._conversations = []
+
+
+# ====== JSONL ======
+@contextlib.contextmanager
+def _open_text(path, mode):
+    if path == "-":
+        yield sys.stdout if "w" in mode else sys.stdin
+    elif path.endswith(".gz"):
+        with gzip.open(path, mode + "t", encoding="utf-8") as f:
+            yield f
+    else:
+        with open(path, mode, encoding="utf-8") as f:
+            yield f
+
+
+def export_jsonl(db_path, out_path, include_credentials=False):
+    paths = source_paths(db_path)
+    counts = {"user": 0, "conversation": 0}
+    with _open_text(out_path, "w") as f:
+        for kind, records in (("user", iter_all_users(paths, include_credentials=include_credentials)),
+                              ("conversation", iter_all_conversations(paths))):
+            for record in records:
+                f.write(json.dumps({"type": kind, **record}, ensure_ascii=False))
+                f.write("\n")
+                counts[kind] += 1
+    return counts
+
+
+def import_jsonl(db_path, in_path, batch_size=BATCH_SIZE):
+    importer = Importer(db_path, batch_size)
+    with _open_text(in_path, "r") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                importer.add(record.pop("type"), record)
+    return importer.finish()
+
+
+# ====== Parquet（可选依赖 pyarrow） ======
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet 导入导出需要 pyarrow：pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_parquet(db_path, out_dir, batch_size=BATCH_SIZE, include_credentials=False):
+    """输出目录下的 users.parquet / conversations.parquet，每批一个 row group"""
+    pa, pq = _require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    paths = source_paths(db_path)
+    user_columns = [("id", pa.int64()), ("username", pa.string()), ("class_name", pa.string()),
+                    ("created_at", pa.string())]
+    if include_credentials:
+        user_columns.append(("password_hash", pa.string()))
+    schemas = {
+        "user": pa.schema(user_columns),
+        "conversation": pa.schema([("id", pa.int64()), ("user_id", pa.int64()), ("username", pa.string()),
+                                   ("module", pa.string()), ("title", pa.string()), ("content", pa.string()),
+                                   ("solution", pa.string()), ("created_at", pa.string())]),
+    }
+    counts = {"user": 0, "conversation": 0}
+    for kind, records, filename in (("user", iter_all_users(paths, batch_size, include_credentials),
+                                     "users.parquet"),
+                                    ("conversation", iter_all_conversations(paths, batch_size),
+                                     "conversations.parquet")):
+        with pq.ParquetWriter(os.path.join(out_dir, filename), schemas[kind], compression="zstd") as writer:
+            for batch in _batched(records, batch_size):
+                writer.write_table(pa.Table.from_pylist(batch, schema=schemas[kind]))
+                counts[kind] += len(batch)
+    return counts
+
+
+def import_parquet(db_path, in_dir, batch_size=BATCH_SIZE):
+    _pa, pq = _require_pyarrow()
+    importer = Importer(db_path, batch_size)
+    for kind, filename in (("user", "users.parquet"), ("conversation", "conversations.parquet")):
+        path = os.path.join(in_dir, filename)
+        if not os.path.exists(path):
+            continue
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for record in batch.to_pylist():
+                importer.add(kind, record)
+    return importer.finish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NetArchitect 用户与对话历史的流式导出/导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="数据库 -> JSONL / Parquet")
+    exp.add_argument("--db", default=None, help="源数据库（默认主库，分库时连同全部分片）")
+    exp.add_argument("--out", required=True, help="JSONL 文件（.gz 自动压缩，- 为标准输出）或 Parquet 输出目录")
+    exp.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    exp.add_argument("--include-credentials", action="store_true",
+                     help="同时导出密码哈希（整库迁移用；导出文件要按密码库的级别保管）")
+
+    imp = sub.add_parser("import", help="JSONL / Parquet -> 数据库")
+    imp.add_argument("--db", default=None,
+                     help="目标数据库（默认主库，分库时按 DB_SHARDING 分配；不存在会自动建表）")
+    imp.add_argument("--in", dest="src", required=True, help="JSONL 文件（- 为标准输入）或 Parquet 目录")
+    imp.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    imp.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每个事务写入的记录数")
+
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    try:
+        if args.command == "export":
+            if args.format == "jsonl":
+                result = export_jsonl(args.db, args.out, args.include_credentials)
+            else:
+                result = export_parquet(args.db, args.out, include_credentials=args.include_credentials)
+        else:
+            fn = import_jsonl if args.format == "jsonl" else import_parquet
+            result = fn(args.db, args.src, args.batch_size)
+    except RuntimeError as e:  # 缺少可选依赖等
+        parser.error(str(e))
+    # 统计信息走 stderr，避免污染管道里的 JSONL
+    print(f"{args.command} 完成 ({time.perf_counter() - t0:.1f}s): {result}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
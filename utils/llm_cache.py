@@ -0,0 +1,152 @@
+# utils/llm_cache.py
+# 大模型回复缓存：同一天全班都在学“OSPF 的 DR/BDR 选举”，出题/答案/概念追问的输入高度重复，
+# 相同（规范化后的提示词 + 模型 + 温度）直接复用上次的完整回复，不再等几秒、也不再花钱。
+#   第一层：进程内 LRU（线程安全，所有会话共享）
+#   第二层：SQLite（llm_cache.db，与用户数据分开），带 TTL，超出行数上限按最久未用淘汰
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+
+from utils.db_helper import get_conn, get_db_path
+from utils.lru_cache import LRUCache
+
+CACHE_ENABLED = os.getenv("LLM_CACHE", "on") != "off"
+MEMORY_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))
+MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "5000"))
+PRUNE_EVERY = 50  # 每写入这么多条清理一次过期/超额的行
+REPLAY_CHUNK = 24  # 命中时按多少字符一段回放
+
+
+def normalize_prompt(text):
+    """全角/半角统一、每行去掉缩进和首尾空白、丢掉空行：
+    f-string 里的缩进或学生多敲的空格不应该让缓存失效"""
+    text = unicodedata.normalize("NFKC", text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_key(model, temperature, messages):
+    payload = [model, None if temperature is None else round(float(temperature), 2),
+               [[m["role"], normalize_prompt(m["content"])] for m in messages]]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def replay(text, chunk=REPLAY_CHUNK):
+    """把缓存的完整回复切段产出，st.write_stream 照常逐段渲染"""
+    for i in range(0, len(text), chunk):
+        yield text[i:i + chunk]
+
+
+class ResponseCache:
+    def __init__(self, db_path, memory_size=MEMORY_SIZE, ttl_hours=TTL_HOURS, max_rows=MAX_ROWS):
+        self.db_path = db_path
+        self.ttl = ttl_hours * 3600
+        self.max_rows = max_rows
+        self._memory = LRUCache(memory_size)  # key -> (回复, 过期时间)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+                       "memory_evictions": 0, "disk_evictions": 0, "expired": 0}
+        with get_conn(db_path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _remember(self, key, text, expires_at):
+        with self._lock:
+            before = len(self._memory)
+            known = key in self._memory
+            self._memory.put(key, (text, expires_at))
+            self._stats["memory_evictions"] += before + (0 if known else 1) - len(self._memory)
+
+    def get(self, key, allow_stale=False):
+        """allow_stale=True：上游不可用时的兜底，过期但还没被清理的条目也返回"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._count("memory_hits")
+                return entry[0]
+            with self._lock:
+                self._memory.pop(key)
+            self._count("expired")
+        with get_conn(self.db_path) as conn:
+            row = conn.execute("SELECT response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                               (key, 0 if allow_stale else now)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE llm_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?", (now, key))
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        if row[1] > now:
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key, model, text):
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, text, expires_at)
+        with get_conn(self.db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, expires_at, last_used_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (key, model, text, now, expires_at, now))
+        with self._lock:
+            self._stats["stores"] += 1
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """删掉过期行；仍超出 max_rows 时按最久未用淘汰"""
+        with get_conn(self.db_path) as conn:
+            expired = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_rows
+            evicted = 0
+            if overflow > 0:
+                evicted = conn.execute("DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                                       "ORDER BY last_used_at LIMIT ?)", (overflow,)).rowcount
+        self._count("expired", expired)
+        self._count("disk_evictions", evicted)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["memory_entries"] = len(self._memory)
+        lookups = snapshot["memory_hits"] + snapshot["disk_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = (snapshot["memory_hits"] + snapshot["disk_hits"]) / lookups if lookups else 0.0
+        return snapshot
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """进程级单例；LLM_CACHE=off 时返回 None"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                path = os.getenv("LLM_CACHE_DB_PATH") or str(Path(get_db_path()).with_name("llm_cache.db"))
+                _cache = ResponseCache(path)
+    return _cache
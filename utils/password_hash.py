@@ -0,0 +1,134 @@
+# utils/password_hash.py
+# 密码哈希：加盐 scrypt（内存困难型 KDF），取代原来无盐的单次 SHA-256。
+# scrypt 一次要几十毫秒 CPU，全班同时登录时在有界线程池里算
+# （hashlib.scrypt 计算期间释放 GIL），不会把所有脚本线程一起拖住。
+#
+# 存储格式：scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+# 旧库里的 64 位十六进制 SHA-256 仍可登录，登录成功后自动换成 scrypt。
+#
+# 校准代价参数（输出建议的 PASSWORD_SCRYPT_N）：
+#   python -m utils.password_hash --calibrate --target-ms 50
+import os
+import hmac
+import time
+import base64
+import secrets
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))  # CPU/内存代价，必须是 2 的幂
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+KEY_BYTES = 32
+# 同时在算的哈希个数上限；默认留一个核给页面脚本
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+_dummy_hash = None  # 用户名不存在时拿它做一次校验，登录耗时不暴露账号是否存在
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password, n=None):
+    """明文 -> 存储用的编码串（每次随机盐）"""
+    n = n or SCRYPT_N
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def is_legacy(stored):
+    return not stored.startswith("scrypt$")
+
+
+def verify_password(password, stored):
+    """返回 (是否匹配, 是否需要重新哈希)。
+
+    旧的 SHA-256 记录和代价参数低于当前配置的记录，匹配后都应重新哈希。
+    """
+    if is_legacy(stored):
+        ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        return ok, ok
+    try:
+        _scheme, n, r, p, salt, key = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        expected = base64.b64decode(salt), base64.b64decode(key)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(_scrypt(password, expected[0], n, r, p), expected[1])
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+    return _pool
+
+
+def _get_dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        with _pool_lock:
+            if _dummy_hash is None:
+                # 当前代价参数下一个随机密码的哈希，谁也登不上
+                _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+
+def hash_password_pooled(password, timeout=None):
+    return _get_pool().submit(hash_password, password).result(timeout)
+
+
+def verify_password_pooled(password, stored, timeout=None):
+    return _get_pool().submit(verify_password, password, stored).result(timeout)
+
+
+def verify_dummy_pooled(password, timeout=None):
+    """账号不存在时调用：花和真实校验一样的时间，结果总是失败"""
+    _get_pool().submit(verify_password, password, _get_dummy_hash()).result(timeout)
+    return False, False
+
+
+def calibrate(target_ms, rounds=3):
+    """找出单次哈希不超过 target_ms 的最大 N（2 的幂），返回 (n, 实测毫秒)"""
+    n, best = 2 ** 10, None
+    while n <= 2 ** 22:
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            hash_password("calibration", n=n)
+        elapsed = (time.perf_counter() - t0) * 1000 / rounds
+        if elapsed > target_ms:
+            break
+        best = (n, elapsed)
+        n *= 2
+    return best or (2 ** 10, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="scrypt 代价参数校准")
+    parser.add_argument("--calibrate", action="store_true", help="按目标耗时给出 PASSWORD_SCRYPT_N")
+    parser.add_argument("--target-ms", type=float, default=50, help="单次登录哈希的目标耗时")
+    args = parser.parse_args(argv)
+    if not args.calibrate:
+        parser.print_help()
+        return
+    n, elapsed = calibrate(args.target_ms)
+    print(f"PASSWORD_SCRYPT_N={n}  # 单次约 {elapsed:.1f} ms（r={SCRYPT_R}, p={SCRYPT_P}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# utils/resilience.py
+# 调用大模型的容错：指数退避（带抖动）+ 进程级共享的熔断器。
+# 上游变慢或报错时，熔断器打开后新请求立即失败（或改用缓存内容），
+# 不再让每个会话都卡满超时，拖垮尾延迟。
+#
+#   closed     正常放行；连续失败达到阈值 -> open
+#   open       直接拒绝；冷却 reset_timeout 秒后 -> half_open
+#   half_open  只放行一个探测请求：成功 -> closed，失败 -> open
+import os
+import time
+import random
+import threading
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+RESET_TIMEOUT_S = float(os.getenv("AI_BREAKER_RESET_S", "30"))
+BACKOFF_BASE_S = float(os.getenv("AI_BACKOFF_BASE_S", "0.5"))
+BACKOFF_CAP_S = float(os.getenv("AI_BACKOFF_CAP_S", "8"))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_S, cap=BACKOFF_CAP_S, rng=random):
+    """第 attempt 次重试前的等待（full jitter：0 ~ min(cap, base * 2^attempt) 均匀分布），
+    避免全班的请求在同一时刻一起重试"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_S, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock  # 测试里换成可手动拨动的时钟
+        self._state = CLOSED
+        self._failures = 0          # 连续失败次数
+        self._opened_at = 0.0
+        self._probing = False       # half_open 时是否已有探测请求在途
+        self._lock = threading.Lock()
+        self._stats = {"allowed": 0, "rejected": 0, "successes": 0, "failures": 0,
+                       "opened": 0, "half_opened": 0, "closed": 0}
+        self._state_since = self._clock()
+
+    def _transition(self, state):
+        # 调用方已持有锁
+        self._state = state
+        self._state_since = self._clock()
+        self._stats[{OPEN: "opened", HALF_OPEN: "half_opened", CLOSED: "closed"}[state]] += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """本次请求能否发往上游；放行后必须调用 record_success / record_failure 之一"""
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                self._probing = False
+            if self._state == CLOSED or (self._state == HALF_OPEN and not self._probing):
+                if self._state == HALF_OPEN:
+                    self._probing = True
+                self._stats["allowed"] += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats["successes"] += 1
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                self._transition(OPEN)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["state"] = self._state
+            snapshot["state_for_s"] = round(self._clock() - self._state_since, 1)
+            snapshot["consecutive_failures"] = self._failures
+        return snapshot
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """进程级单例：所有会话、同步/异步引擎共用一个上游健康状态"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
@@ -0,0 +1,117 @@
+# utils/roster_import.py
+# 开学批量建号：读班级花名册 CSV，多进程并行计算密码哈希，一个事务批量写入，
+# 输出冲突报告（已存在 / 表内重复 / 用户名为空），不用学生逐个在登录页注册。
+#
+# CSV 需有表头，列名：username（必填）、password（选填）、class（选填）。
+# 未给密码的行会生成随机初始密码，写进 --report，方便老师下发。
+#
+# 用法：
+#   python -m utils.roster_import roster.csv --report result.csv
+#   python -m utils.roster_import grade2024.csv --class 2024级1班 --workers 8
+import os
+import sys
+import csv
+import time
+import secrets
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_helper import init_db, register_users_bulk  # noqa: E402
+from utils.password_hash import hash_password  # noqa: E402
+
+PASSWORD_ALPHABET = "abcdefghjkmnpqrstuvwxyz23456789"  # 去掉易混淆的 i/l/o/0/1
+PASSWORD_LENGTH = 8
+REPORT_FIELDS = ("username", "class", "status", "password")
+
+
+def read_roster(path, default_class=None):
+    """返回 (待建账号列表, 有问题的行)；账号为 dict(username, password, class, generated)"""
+    accounts, problems, seen = [], [], set()
+    with open(path, newline="", encoding="utf-8-sig") as f:  # 兼容 Excel 另存的 BOM
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or "username" not in reader.fieldnames:
+            raise ValueError("CSV 缺少 username 列")
+        for row in reader:
+            name = (row.get("username") or "").strip()
+            class_name = (row.get("class") or "").strip() or default_class
+            if not name:
+                problems.append({"username": "", "class": class_name, "status": "invalid"})
+                continue
+            if name in seen:
+                problems.append({"username": name, "class": class_name, "status": "duplicate"})
+                continue
+            seen.add(name)
+            password = (row.get("password") or "").strip()
+            generated = not password
+            if generated:
+                password = "".join(secrets.choice(PASSWORD_ALPHABET) for _ in range(PASSWORD_LENGTH))
+            accounts.append({"username": name, "password": password, "class": class_name,
+                             "generated": generated})
+    return accounts, problems
+
+
+def hash_all(passwords, workers):
+    """scrypt 是 CPU 密集型，分给进程池；workers=0 时在当前进程里算"""
+    if workers == 0 or len(passwords) < 2:
+        return [hash_password(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+
+def write_report(path, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NetArchitect 花名册批量建号")
+    parser.add_argument("roster", help="花名册 CSV（列：username, password, class）")
+    parser.add_argument("--class", dest="class_name", default=None, help="CSV 未填班级时使用的班级")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="计算密码哈希的进程数（0 = 不用进程池）")
+    parser.add_argument("--report", default=None,
+                        help="结果 CSV：每个用户名的状态，以及自动生成的初始密码")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        accounts, problems = read_roster(args.roster, args.class_name)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not args.report and any(a["generated"] for a in accounts):
+        # 生成的初始密码只会出现在报告里，没有报告就无法下发
+        parser.error("有行未填写密码，需要自动生成初始密码，请加 --report 指定输出文件")
+    init_db()
+    t_hash = time.perf_counter()
+    hashes = hash_all([a["password"] for a in accounts], args.workers)
+    t_insert = time.perf_counter()
+    created, existing = register_users_bulk(
+        [(a["username"], h, a["class"]) for a, h in zip(accounts, hashes)])
+    t_done = time.perf_counter()
+
+    created, existing = set(created), set(existing)
+    report = list(problems)
+    for a in accounts:
+        status = "created" if a["username"] in created else "exists"
+        report.append({"username": a["username"], "class": a["class"], "status": status,
+                       "password": a["password"] if a["generated"] and status == "created" else ""})
+    if args.report:
+        write_report(args.report, report)
+
+    conflicts = [r for r in report if r["status"] != "created"]
+    for r in conflicts[:20]:
+        print(f"  跳过 {r['username'] or '(空用户名)'}: {r['status']}", file=sys.stderr)
+    if len(conflicts) > 20:
+        print(f"  …… 其余 {len(conflicts) - 20} 条见 --report", file=sys.stderr)
+    print(f"新建 {len(created)}，已存在 {len(existing)}，表内重复/无效 {len(problems)}；"
+          f"哈希 {t_insert - t_hash:.2f}s，写库 {t_done - t_insert:.2f}s，总计 {t_done - t0:.2f}s",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# utils/semantic_cache.py
+# 概念追问的近似重复缓存：学生对同一个困惑有很多种问法
+# （“为什么 TCP 需要三次握手？” / “TCP三次握手的原因”），精确缓存全部落空。
+# 这里对问过的概念建字符 n-gram TF-IDF 倒排索引（纯 CPU、NumPy），
+# 相似度超过阈值就直接复用那条概念的讲解。
+#
+# 相似度取 TF-IDF 余弦和双向覆盖率中最小的一个：新问法和已有概念各自至少有这么大比例的内容能在对方里找到。
+# 只看余弦时，“ARP 欺骗” 会命中 “什么是 ARP”、“VLAN” 会命中 “VLAN 间路由”——共同的协议名占了大头，
+# 多出来的那部分（问的到底是哪个方面）几乎不影响分数。
+#
+# 只做字面相似：跨语言的同义问法（“why 3-way handshake”）需要向量模型，不在此列。
+# 依赖 NumPy（Streamlit 自带）；没装时语义缓存自动关闭，只剩精确缓存。
+import os
+import re
+import math
+import time
+import threading
+import unicodedata
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils.db_helper import get_conn
+
+THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.65"))
+NGRAM_SIZES = (2, 3)
+# 一个英文单词 / 缩写和一个双字中文词分量相当；汉字按字数计
+WORD_MASS = 2.0
+# 文档数较上次重算范数时增长超过该比例，就按新的 IDF 重算所有范数
+RENORM_GROWTH = 1.1
+# 最相似的概念讲解已过期/被淘汰时，再看接下来几个过了阈值的
+CANDIDATES = 3
+
+# 提问时的套话，不影响问的是哪个概念
+_FILLERS = re.compile(r"为什么|为何|是什么|什么是|什么|怎么样|怎么|如何|原因|原理|请问|请|解释|一下|"
+                      r"的|了|吗|呢|啊|需要|\bwhy\b|\bwhat\b|\bhow\b|\bis\b|\bare\b|\bthe\b|\bdoes\b|\bdo\b|\ba\b")
+_PUNCT = re.compile(r"[^\w]+")
+# 中英文混写（“OSPF中DR选举”）时在字母数字和汉字之间断开
+_RUNS = re.compile(r"[a-z0-9]+|[^\sa-z0-9]+")
+
+
+def normalize_concept(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _FILLERS.sub(" ", text)
+    return " ".join(_RUNS.findall(_PUNCT.sub(" ", text)))
+
+
+def char_ngrams(text):
+    """按空白切段后取字符 2/3-gram（英文单词两侧补空格，保留词边界）。
+
+    每段的 gram 权重之和等于该段的分量（英文词 WORD_MASS，中文按字数），
+    否则补了空格的 “arp” 有 7 个 gram，“欺骗” 只有 1 个，协议名会压过其余内容。
+    """
+    grams = {}
+    for part in text.split():
+        padded = f" {part} " if part.isascii() else part
+        local = {}
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                local[gram] = local.get(gram, 0) + 1
+        if len(padded) < NGRAM_SIZES[0]:  # 单个汉字
+            local[padded] = 1
+        scale = (WORD_MASS if part.isascii() else len(part)) / sum(local.values())
+        for gram, tf in local.items():
+            grams[gram] = grams.get(gram, 0) + tf * scale
+    return grams
+
+
+class ConceptIndex:
+    """增量 TF-IDF 倒排索引。
+
+    add() 只追加倒排表；IDF 在查询时按当前文档频率计算，
+    文档范数和总权重在库规模明显变化后再统一重算，避免每次插入都重建矩阵。
+    """
+
+    def __init__(self, threshold=THRESHOLD):
+        if np is None:
+            raise RuntimeError("语义缓存需要 numpy：pip install numpy")
+        self.threshold = threshold
+        self._vocab = {}       # gram -> 列号
+        self._df = []          # 列号 -> 文档频率
+        self._postings = []    # 列号 -> ([doc], [tf])
+        self._arrays = {}      # 列号 -> (doc 数组, tf 数组)，倒排表变动后失效
+        self._docs = []        # doc -> {列号: tf}
+        self._payloads = []    # doc -> (概念原文, 负载)
+        self._norms = np.zeros(0, dtype=np.float64)
+        self._masses = np.zeros(0, dtype=np.float64)  # doc -> sum(tf * idf)，算覆盖率用
+        self._normed_at = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _idf(self, cols):
+        df = np.fromiter((self._df[c] for c in cols), dtype=np.float64, count=len(cols))
+        return np.log((1 + len(self._docs)) / (1 + df)) + 1
+
+    def _doc_weights(self, terms):
+        """(范数, 总权重)"""
+        cols = list(terms)
+        w = np.fromiter(terms.values(), dtype=np.float64, count=len(cols)) * self._idf(cols)
+        return float(np.sqrt(np.sum(w ** 2))) or 1.0, float(np.sum(w)) or 1.0
+
+    def _renorm(self):
+        weights = np.array([self._doc_weights(terms) for terms in self._docs], dtype=np.float64).reshape(-1, 2)
+        self._norms, self._masses = weights[:, 0].copy(), weights[:, 1].copy()
+        self._normed_at = len(self._docs)
+
+    def add(self, concept, payload):
+        grams = char_ngrams(normalize_concept(concept))
+        if not grams:
+            return None
+        with self._lock:
+            doc = len(self._docs)
+            terms = {}
+            for gram, tf in grams.items():
+                col = self._vocab.get(gram)
+                if col is None:
+                    col = self._vocab[gram] = len(self._df)
+                    self._df.append(0)
+                    self._postings.append(([], []))
+                self._df[col] += 1
+                self._postings[col][0].append(doc)
+                self._postings[col][1].append(tf)
+                self._arrays.pop(col, None)
+                terms[col] = tf
+            self._docs.append(terms)
+            self._payloads.append((concept, payload))
+            if doc + 1 >= self._normed_at * RENORM_GROWTH:
+                self._renorm()
+            else:
+                norm, mass = self._doc_weights(terms)
+                self._norms = np.append(self._norms, norm)
+                self._masses = np.append(self._masses, mass)
+        return doc
+
+    def search(self, concept, k=1):
+        """返回最相似的 k 个 [(相似度, 概念原文, 负载)]；相似度 = min(余弦, 查询覆盖率, 概念覆盖率)"""
+        grams = char_ngrams(normalize_concept(concept))
+        with self._lock:
+            cols = [self._vocab[g] for g in grams if g in self._vocab]
+            if not cols or not self._docs:
+                return []
+            idf = self._idf(cols)
+            q = np.fromiter((grams[g] for g in grams if g in self._vocab), dtype=np.float64, count=len(cols)) * idf
+            # 查询范数和总权重要算上索引里没有的 gram（它们的 df = 0）
+            unseen = [tf for g, tf in grams.items() if g not in self._vocab]
+            unseen_idf = math.log(1 + len(self._docs)) + 1
+            q_norm = math.sqrt(float(np.sum(q ** 2)) + sum((tf * unseen_idf) ** 2 for tf in unseen))
+            q_mass = float(np.sum(q)) + sum(tf * unseen_idf for tf in unseen)
+            scores = np.zeros(len(self._docs), dtype=np.float64)
+            overlap = np.zeros(len(self._docs), dtype=np.float64)
+            for col, weight, w_idf in zip(cols, q, idf):
+                arrays = self._arrays.get(col)
+                if arrays is None:
+                    docs, tfs = self._postings[col]
+                    arrays = self._arrays[col] = (np.array(docs), np.array(tfs, dtype=np.float64))
+                np.add.at(scores, arrays[0], weight * w_idf * arrays[1])
+                np.add.at(overlap, arrays[0], np.minimum(weight, w_idf * arrays[1]))
+            # 范数 / 总权重是按上次重算时的 IDF 算的，略有偏差，截到 1 以内
+            scores = np.minimum(scores / (self._norms * q_norm), 1.0)
+            # 双向覆盖：新问法多出来的内容（“ARP 欺骗” 的 “欺骗”）和
+            # 已有概念多出来的内容（“VLAN 间路由” 的 “间路由”）都会拉低分数
+            scores = np.minimum(scores, overlap / q_mass)
+            scores = np.minimum(scores, overlap / self._masses)
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]),) + self._payloads[i] for i in top]
+
+    def lookup(self, concept):
+        """相似度达到阈值时返回 (相似度, 概念原文, 负载)，否则 None"""
+        hits = self.search(concept, 1)
+        if hits and hits[0][0] >= self.threshold:
+            return hits[0]
+        return None
+
+
+class SemanticQuizCache:
+    """ConceptIndex + 持久化：概念 -> 精确缓存里的键，存在 llm_cache.db 的 quiz_concepts 表。
+
+    讲解正文仍由 utils.llm_cache.ResponseCache 保存（TTL/淘汰规则一致），
+    命中的键若已过期就当作未命中。
+    """
+
+    def __init__(self, response_cache, threshold=THRESHOLD):
+        self.response_cache = response_cache
+        self.index = ConceptIndex(threshold)
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "lookup_ms_total": 0.0}
+        self._lock = threading.Lock()
+        with get_conn(response_cache.db_path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS quiz_concepts (
+                key TEXT PRIMARY KEY,
+                concept TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+            # 讲解已被淘汰的概念一并清掉，再从仍未过期的缓存条目重建索引
+            conn.execute("DELETE FROM quiz_concepts WHERE key NOT IN (SELECT key FROM llm_cache)")
+            rows = conn.execute("""SELECT q.key, q.concept FROM quiz_concepts q
+                                   JOIN llm_cache c ON c.key = q.key
+                                   WHERE c.expires_at > ? ORDER BY q.created_at""", (time.time(),)).fetchall()
+        self._keys = set()
+        for key, concept in rows:
+            self.index.add(concept, key)
+            self._keys.add(key)
+
+    def add(self, concept, key):
+        # 检查和登记要在同一把锁里：两个会话同时问同一个概念时只进索引一次
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.add(key)
+        self.index.add(concept, key)
+        with get_conn(self.response_cache.db_path) as conn:
+            conn.execute("INSERT OR IGNORE INTO quiz_concepts (key, concept, created_at) VALUES (?, ?, ?)",
+                         (key, concept, time.time()))
+
+    def get(self, concept):
+        """返回 (讲解正文, 相似度, 匹配到的概念) 或 None"""
+        t0 = time.perf_counter()
+        hit = text = None
+        stale = False
+        for candidate in self.index.search(concept, CANDIDATES):
+            if candidate[0] < self.index.threshold:
+                break
+            text = self.response_cache.get(candidate[2])
+            if text is not None:
+                hit = candidate
+                break
+            stale = True
+        with self._lock:
+            self._stats["lookup_ms_total"] += (time.perf_counter() - t0) * 1000
+            if text is not None:
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+                if stale:
+                    self._stats["stale"] += 1
+        return (text, hit[0], hit[1]) if text is not None else None
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["avg_lookup_ms"] = snapshot.pop("lookup_ms_total") / lookups if lookups else 0.0
+        snapshot["concepts"] = len(self.index)
+        snapshot["threshold"] = self.index.threshold
+        return snapshot
+
+
+_semantic = None
+_semantic_lock = threading.Lock()
+
+
+def get_semantic_cache(response_cache):
+    """进程级单例；没有 numpy 或精确缓存被关闭时返回 None"""
+    global _semantic
+    if np is None or response_cache is None:
+        return None
+    if _semantic is None:
+        with _semantic_lock:
+            if _semantic is None:
+                _semantic = SemanticQuizCache(response_cache)
+    return _semantic
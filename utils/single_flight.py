@@ -0,0 +1,124 @@
+# utils/single_flight.py
+# 单飞：同一时刻完全相同的请求（全班同时问同一个概念）合并成一次上游调用。
+# 在途表按 make_key 登记，同步引擎（线程拉流）和异步引擎（事件循环拉流）共用同一张：
+# 谁先到谁当 leader 发请求，其余的无论来自哪个引擎都跟读同一份缓冲。
+import os
+import asyncio
+import threading
+
+SINGLE_FLIGHT = os.getenv("AI_SINGLE_FLIGHT", "on") != "off"
+
+
+class SharedStream:
+    """一路生成、多处读取的文本流：生产方 append / finish，
+    读取方通过 stream()（同步）或 astream()（异步）先拿到已生成的全部内容，再跟着后续分片往下读"""
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.ok = False
+        self._cond = threading.Condition()
+        self._waiters = []  # 异步读取方：(事件循环, asyncio.Event)
+
+    @property
+    def text(self):
+        with self._cond:
+            return "".join(self.parts)
+
+    def _notify(self):
+        # 调用方已持有 _cond
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def append(self, piece):
+        with self._cond:
+            self.parts.append(piece)
+            self._notify()
+
+    def finish(self, ok=True):
+        with self._cond:
+            self.ok = ok
+            self.done = True
+            self._notify()
+
+    def stream(self, timeout=None):
+        """同步生成器（st.write_stream 可直接消费）；timeout 秒内没有新内容就停止等待"""
+        sent = 0
+        while True:
+            with self._cond:
+                if sent >= len(self.parts) and not self.done:
+                    self._cond.wait(timeout)
+                new = self.parts[sent:]
+                finished = self.done
+            if not new and not finished:
+                return  # 等待超时
+            if new:
+                sent += len(new)
+                yield "".join(new)
+            if finished and sent >= len(self.parts):
+                return
+
+    async def astream(self, timeout=None):
+        """stream() 的异步版本：等待时不占事件循环"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            self._waiters.append(waiter)
+        try:
+            sent = 0
+            while True:
+                with self._cond:
+                    new = self.parts[sent:]
+                    finished = self.done
+                    if not new and not finished:
+                        event.clear()  # 在锁内清除：之后的 append 一定会再 set
+                if new:
+                    sent += len(new)
+                    yield "".join(new)
+                elif finished:
+                    return
+                else:
+                    try:
+                        await asyncio.wait_for(event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        return  # 等待超时
+        finally:
+            with self._cond:
+                self._waiters.remove(waiter)
+
+
+class FlightTable:
+    """请求键 -> 正在进行的 SharedStream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key):
+        """返回 (flight, 是否 leader)；leader 负责拉流，结束时调用 land()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = SharedStream()
+            return flight, True
+
+    def land(self, key, flight, ok):
+        """leader 拉完流：先摘掉（回复已写入缓存，之后的相同请求直接命中缓存），再通知读取方结束"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(ok)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+
+_flights = FlightTable()
+
+
+def get_flight_table():
+    """进程级在途表，同步 / 异步引擎共用"""
+    return _flights
@@ -0,0 +1,209 @@
+# utils/speculative.py
+# S3 参考答案的推测生成：任务单一生成完，就在后台（异步引擎的事件循环上）开始写参考答案，
+# 完成后随任务记录一起存库。学生做完实验点“查看参考答案”时（SolutionAnswer）：
+#   已生成完 -> 直接显示；已在输出 -> 先回放已有部分，再跟着后台流继续输出；
+#   还在排队 / 没有 / 失败 -> 照旧现场生成；跟读时后台流卡住或中断 -> 也改为现场生成。
+# 只有完整的答案才会存库，空的、截断的和错误提示都不存。
+#
+# 推测生成不能挤占交互请求：
+#   - 每个用户同时只保留 SPECULATIVE_PER_USER 个在跑的推测（新任务会取消最旧的）
+#   - 全进程最多 SPECULATIVE_MAX_INFLIGHT 个同时发往上游，其余排队
+#   - 熔断器不是 closed 时不发起推测
+#   - 用的是异步引擎自己的连接池，不占同步引擎的连接
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.ai_engine import MODEL, READ_TIMEOUT_S, solution_messages
+from utils.single_flight import SharedStream
+from utils.ai_engine_async import get_async_ai_engine, get_event_loop
+from utils.llm_cache import make_key
+from utils.db_helper import enqueue_update_solution
+from utils.resilience import CLOSED
+
+ENABLED = os.getenv("SPECULATIVE_SOLUTIONS", "on") != "off"
+PER_USER = int(os.getenv("SPECULATIVE_PER_USER", "1"))
+MAX_INFLIGHT = int(os.getenv("SPECULATIVE_MAX_INFLIGHT", "8"))
+KEEP_PER_USER = 4       # 每个用户保留最近几个推测结果（切换历史任务时还能用上）
+KEEP_S = 3 * 3600       # 超过这个时间的推测结果不再保留（答案已经存库）
+
+
+def task_digest(task_text):
+    return hashlib.sha256(task_text.encode("utf-8")).hexdigest()
+
+
+class Speculation(SharedStream):
+    """一个任务的后台参考答案。分片由事件循环线程追加，脚本线程通过 stream() 读取"""
+
+    def __init__(self, user_id, task_text):
+        super().__init__()
+        self.user_id = user_id
+        self.task_text = task_text
+        self.created_at = time.time()
+        self.stored = False   # 已随任务记录写库
+        self.future = None
+
+    @property
+    def running(self):
+        return not self.done
+
+    def stream(self, timeout=READ_TIMEOUT_S):
+        return super().stream(timeout)
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+
+
+class SolutionSpeculator:
+    def __init__(self, engine, per_user=PER_USER, max_inflight=MAX_INFLIGHT):
+        self.engine = engine
+        self.per_user = per_user
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._by_user = {}  # user_id -> OrderedDict(task_digest -> Speculation)
+        self._stats = {"started": 0, "skipped": 0, "cancelled": 0, "completed": 0, "failed": 0,
+                       "used_ready": 0, "used_attached": 0, "bypassed": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def start(self, user_id, task_text, record_id=None):
+        """任务单生成完后调用；record_id 可以是 int 或写队列的 PendingWrite"""
+        if not task_text or self.engine.cache is None or self.engine.breaker.state != CLOSED:
+            self._count("skipped")
+            return None
+        digest = task_digest(task_text)
+        spec = Speculation(user_id, task_text)
+        to_cancel = []
+        with self._lock:
+            specs = self._by_user.setdefault(user_id, OrderedDict())
+            if digest in specs:
+                return specs[digest]
+            running = [s for s in specs.values() if s.running]
+            while len(running) >= self.per_user:
+                to_cancel.append(running.pop(0))
+            specs[digest] = spec
+            self._prune(specs)
+            self._stats["started"] += 1
+        for old in to_cancel:
+            old.cancel()
+        spec.future = asyncio.run_coroutine_threadsafe(self._run(spec, record_id), get_event_loop())
+        # 还没开始就被取消时 _run 不会执行，这里兜底标记结束，免得读取方一直等
+        spec.future.add_done_callback(lambda _: spec.finish(spec.ok))
+        return spec
+
+    def _prune(self, specs):
+        # 调用方已持有锁；只淘汰已结束的
+        cutoff = time.time() - KEEP_S
+        for digest, spec in list(specs.items()):
+            if spec.done and (len(specs) > KEEP_PER_USER or spec.created_at < cutoff):
+                del specs[digest]
+
+    async def _run(self, spec, record_id):
+        ok = False
+        try:
+            key = make_key(MODEL, None, solution_messages(spec.task_text))
+            cached = await asyncio.to_thread(self.engine.cache.get, key)
+            if cached is not None:
+                spec.append(cached)
+                ok = True
+            else:
+                completed = []
+                async with self._semaphore:
+                    # 只有拿到完整答案才回调 on_complete，据此区分正常答案和错误提示 / 截断
+                    async for piece in self.engine.generate_task_solution(
+                            spec.task_text, on_complete=completed.append):
+                        spec.append(piece)
+                ok = bool(completed and completed[0])
+            if ok and spec.user_id is not None and record_id is not None:
+                # DB_DURABILITY=commit 时入队会等到批次提交，队列满时也会阻塞：不能卡住事件循环
+                await asyncio.to_thread(enqueue_update_solution, spec.user_id, record_id, spec.text)
+                spec.stored = True
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            raise
+        except Exception:
+            self._count("failed")
+            raise
+        else:
+            self._count("completed" if ok else "failed")
+        finally:
+            spec.finish(ok)
+
+    def get(self, user_id, task_text):
+        """取该任务可用的推测：已成功完成，或已经在输出内容。
+        还在排队（信号量满、一个字都没有）的推测没法指望，取消掉让调用方现场生成；失败 / 取消的返回 None"""
+        if not task_text:
+            return None
+        with self._lock:
+            spec = self._by_user.get(user_id, {}).get(task_digest(task_text))
+        if spec is None or (spec.done and not spec.ok):
+            return None
+        if spec.running and not spec.parts:
+            spec.cancel()
+            self._count("bypassed")
+            return None
+        self._count("used_attached" if spec.running else "used_ready")
+        return spec
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["running"] = sum(1 for specs in self._by_user.values()
+                                      for s in specs.values() if s.running)
+        return snapshot
+
+
+class SolutionAnswer:
+    """“查看参考答案”的输出流，交给 st.write_stream 消费。
+
+    有可用的推测就跟读它；推测读超时、失败或为空时（已输出的部分加一行提示）改为现场生成。
+    generate(on_complete) 返回现场生成的同步生成器，如 lambda cb: engine.generate_task_solution(task, cb)。
+    读完后 text 是完整答案，不完整（错误提示、中途断开）时为 None；stored 表示后台已经写过库。
+    """
+
+    def __init__(self, speculation, generate):
+        self.speculation = speculation
+        self.generate = generate
+        self.text = None
+        self.stored = False
+
+    def __iter__(self):
+        spec = self.speculation
+        if spec is not None:
+            shown = False
+            for piece in spec.stream():
+                shown = True
+                yield piece
+            if spec.done and spec.ok and spec.text:
+                self.text = spec.text
+                self.stored = spec.stored
+                return
+            spec.cancel()  # 读超时：后台那一路不再等，免得之后再写一份答案
+            if shown:
+                yield "\n\n---\n\n⚠️ 后台生成中断，重新生成：\n\n"
+        completed = []
+        yield from self.generate(completed.append)
+        if completed and completed[0]:
+            self.text = completed[0]
+
+
+_speculator = None
+_speculator_lock = threading.Lock()
+
+
+def get_speculator():
+    """进程级单例；SPECULATIVE_SOLUTIONS=off 时返回 None"""
+    global _speculator
+    if not ENABLED:
+        return None
+    if _speculator is None:
+        with _speculator_lock:
+            if _speculator is None:
+                _speculator = SolutionSpeculator(get_async_ai_engine())
+    return _speculator
@@ -0,0 +1,203 @@
+# utils/task_pool.py
+# S3 任务单预生成池：一周里全班练的就那几个重点，掌握度只有四档，
+# 但每次点“生成任务单”都要现等一整段生成。这里按最近的点击频率找出最热的（主题, 掌握度）组合，
+# 在后台（异步引擎的事件循环上）为每个组合备好几份任务单和对应的参考答案：
+#   - 每份只发给一个学生（取出即移除），所以池里的任务单生成时不走回复缓存，保证各不相同
+#   - 参考答案写进回复缓存：学生点“查看参考答案”时直接命中，推测生成也立即完成
+#   - 取走后立刻唤醒补货；超过 TASK_POOL_TTL_MIN 的存货丢弃；组合不再热门就不再补
+#   - 并发很低（TASK_POOL_CONCURRENCY），熔断器不是 closed 时暂停，不和交互请求抢上游
+import os
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import deque
+
+from utils.ai_engine_async import get_async_ai_engine, get_event_loop, collect
+from utils.resilience import CLOSED
+
+ENABLED = os.getenv("TASK_POOL", "on") != "off"
+POOL_SIZE = int(os.getenv("TASK_POOL_SIZE", "3"))                   # 每个热门组合备几份
+HOT_PAIRS = int(os.getenv("TASK_POOL_HOT_PAIRS", "6"))              # 最多给几个组合备货
+MIN_REQUESTS = int(os.getenv("TASK_POOL_MIN_REQUESTS", "3"))        # 窗口内至少被点几次才算热门
+WINDOW_S = float(os.getenv("TASK_POOL_WINDOW_MIN", "120")) * 60     # 统计点击频率的时间窗口
+TTL_S = float(os.getenv("TASK_POOL_TTL_MIN", "180")) * 60
+REFILL_INTERVAL_S = float(os.getenv("TASK_POOL_REFILL_S", "30"))
+CONCURRENCY = int(os.getenv("TASK_POOL_CONCURRENCY", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+def pair_key(topic, level):
+    """只忽略大小写、全半角和空白：“OSPF DR/BDR 选举” 和 “ospf DR/BDR选举” 算同一个主题。
+    不去“的/原理/需要”这类虚词（语义缓存那套归一化会把 “NAT 原理” 和 “NAT” 并成一个，
+    两个主题就会领到同一批任务单）"""
+    return "".join(unicodedata.normalize("NFKC", topic).casefold().split()), level
+
+
+class TaskPool:
+    def __init__(self, engine, pool_size=POOL_SIZE, hot_pairs=HOT_PAIRS, min_requests=MIN_REQUESTS):
+        self.engine = engine
+        self.pool_size = pool_size
+        self.hot_pairs = hot_pairs
+        self.min_requests = min_requests
+        self._lock = threading.Lock()
+        self._requests = {}   # key -> deque[点击时间]
+        self._topics = {}     # key -> 最近一次的原始写法（生成时用它）
+        self._ready = {}      # key -> deque[(任务单, 生成时间)]
+        self._inflight = {}   # key -> 正在生成的份数（降到 0 就删掉）
+        self._tasks = set()   # 正在跑的生成协程；事件循环只持有弱引用，这里留住它们免得被回收
+        self._wake = None     # asyncio.Event，只在事件循环里创建和使用
+        self._future = None
+        self._stats = {"served": 0, "missed": 0, "generated": 0, "failed": 0, "expired": 0}
+
+    def start(self):
+        if self._future is None:
+            self._future = asyncio.run_coroutine_threadsafe(self._refill_loop(), get_event_loop())
+
+    def _poke(self):
+        if self._wake is not None:
+            get_event_loop().call_soon_threadsafe(self._wake.set)
+
+    def record_request(self, topic, level):
+        """每次点“生成任务单”都记一次，用于找热门组合"""
+        key = pair_key(topic, level)
+        if not key[0]:
+            return
+        now = time.time()
+        with self._lock:
+            self._requests.setdefault(key, deque()).append(now)
+            self._topics[key] = topic
+
+    def take(self, topic, level):
+        """取一份现成的任务单（取出即从池中移除），没有返回 None"""
+        key = pair_key(topic, level)
+        cutoff = time.time() - TTL_S
+        with self._lock:
+            ready = self._ready.get(key)
+            while ready and ready[0][1] < cutoff:
+                ready.popleft()
+                self._stats["expired"] += 1
+            task = ready.popleft()[0] if ready else None
+            self._stats["served" if task is not None else "missed"] += 1
+        self._poke()
+        return task
+
+    def _plan(self):
+        """清理过期数据，返回 [(key, 主题原文, 还差几份)]"""
+        now = time.time()
+        plan = []
+        with self._lock:
+            for key in list(self._requests):
+                hits = self._requests[key]
+                while hits and hits[0] < now - WINDOW_S:
+                    hits.popleft()
+                if not hits:
+                    del self._requests[key]
+                    self._topics.pop(key, None)
+            for key in list(self._ready):
+                ready = self._ready[key]
+                while ready and ready[0][1] < now - TTL_S:
+                    ready.popleft()
+                    self._stats["expired"] += 1
+                if not ready and not self._inflight.get(key):
+                    del self._ready[key]
+            hot = sorted(((len(hits), key) for key, hits in self._requests.items()
+                          if len(hits) >= self.min_requests), reverse=True)[:self.hot_pairs]
+            for _, key in hot:
+                missing = self.pool_size - len(self._ready.get(key, ())) - self._inflight.get(key, 0)
+                if missing > 0:
+                    plan.append((key, self._topics[key], missing))
+        return plan
+
+    async def _refill_loop(self):
+        self._wake = asyncio.Event()
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), REFILL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # 单轮出错只记日志，补货循环本身不能停
+            try:
+                self._refill(semaphore)
+            except Exception:
+                logger.exception("任务单池补货失败")
+
+    def _refill(self, semaphore):
+        if self.engine.breaker.state != CLOSED:
+            return
+        for key, topic, missing in self._plan():
+            with self._lock:
+                self._inflight[key] = self._inflight.get(key, 0) + missing
+            for _ in range(missing):
+                task = asyncio.ensure_future(self._generate(key, topic, semaphore))
+                self._tasks.add(task)
+                task.add_done_callback(self._reap)
+
+    def _reap(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("预生成任务单出错", exc_info=task.exception())
+
+    async def _generate(self, key, topic, semaphore):
+        task = None
+        try:
+            async with semaphore:
+                if self.engine.breaker.state != CLOSED:
+                    return
+                tasks = []
+                await collect(self.engine.generate_personalized_task(
+                    topic, key[1], cacheable=False, on_complete=tasks.append))
+                if not tasks:
+                    return
+                # 参考答案要进回复缓存：已在缓存里（回放）也算
+                solved = []
+                await collect(self.engine.generate_task_solution(tasks[0], on_complete=solved.append))
+                if solved:
+                    task = tasks[0]
+        finally:
+            with self._lock:
+                self._inflight[key] -= 1
+                if not self._inflight[key]:
+                    del self._inflight[key]
+                if task is not None:
+                    self._ready.setdefault(key, deque()).append((task, time.time()))
+                    self._stats["generated"] += 1
+                else:
+                    self._stats["failed"] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["pools"] = {f"{self._topics.get(key, key[0])} · {key[1]}": len(ready)
+                                 for key, ready in self._ready.items()}
+            snapshot["inflight"] = sum(self._inflight.values())
+            snapshot["tracked_pairs"] = len(self._requests)
+        lookups = snapshot["served"] + snapshot["missed"]
+        snapshot["hit_rate"] = snapshot["served"] / lookups if lookups else 0.0
+        return snapshot
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_task_pool():
+    """进程级单例，首次调用时启动后台补货；TASK_POOL=off 或回复缓存关闭时返回 None
+    （池里任务单的参考答案靠回复缓存秒出）"""
+    global _pool
+    if not ENABLED:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                engine = get_async_ai_engine()
+                if engine.cache is None:
+                    return None
+                pool = TaskPool(engine)
+                pool.start()
+                _pool = pool
+    return _pool
@@ -0,0 +1,227 @@
+# utils/write_behind.py
+# 后台写线程：所有会话的 INSERT/UPDATE/DELETE 先进有界队列，
+# 由一个线程攒批后在同一个事务里提交（group commit），
+# 页面脚本线程只负责入队，st.write_stream 结束后不再等 SQLite 的锁。
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 持久化模式：
+#   "async"  —— 入队即返回（默认，最快；进程被强杀时可能丢最后一批）
+#   "commit" —— 入队后等待所在批次提交再返回（仍然享受批量提交）
+DURABILITY_MODES = ("async", "commit")
+
+
+class PendingWrite:
+    """一次排队中的写操作。
+
+    写线程执行完语句就填入 row_id，同批后续操作可以直接引用；
+    对外（result_id / wait）则要等整个批次提交后才公布：
+    批次失败会回滚后逐条重放，重放前公布的主键可能已经作废。
+    """
+    __slots__ = ("fn", "args", "db_path", "row_id", "error", "_committed")
+
+    def __init__(self, fn, args, db_path):
+        self.fn = fn
+        self.args = args
+        self.db_path = db_path
+        self.row_id = None
+        self.error = None
+        self._committed = threading.Event()
+
+    def result_id(self, timeout=None):
+        """等到所在批次提交，返回 lastrowid（INSERT）或操作返回值"""
+        return self.wait(timeout)
+
+    def wait(self, timeout=None):
+        """等到所在批次提交（或失败）"""
+        if not self._committed.wait(timeout):
+            raise TimeoutError("写队列繁忙，等待超时")
+        if self.error:
+            raise self.error
+        return self.row_id
+
+    @property
+    def done(self):
+        return self._committed.is_set()
+
+
+def resolve_id(value, timeout=None):
+    """把 int 或 PendingWrite 统一解析成数据库主键"""
+    if isinstance(value, PendingWrite):
+        return value.result_id(timeout)
+    return value
+
+
+def persisted_id(value):
+    """已提交的主键；还在队列里或写入失败返回 None（不等待）"""
+    if isinstance(value, PendingWrite):
+        return value.row_id if value.done and not value.error else None
+    return value
+
+
+def executed_id(value):
+    """写线程内部用：取同队列中先前操作已生成的主键（失败的为 None）。
+    不能用 resolve_id——它要等批次提交，而该操作可能和调用方在同一批里"""
+    if isinstance(value, PendingWrite):
+        return None if value.error else value.row_id
+    return value
+
+
+class WriteBehindQueue:
+    """有界队列 + 单写线程的批量提交器。
+
+    conn_factory(db_path) 需返回上下文管理器（正常退出提交、异常回滚），
+    即 utils.db_helper.get_conn。
+    """
+
+    def __init__(self, conn_factory, maxsize=10000, batch_size=200,
+                 linger_ms=5, durability="async"):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"未知的持久化模式: {durability}，可选 {DURABILITY_MODES}")
+        self.conn_factory = conn_factory
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.durability = durability
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "committed": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+        }
+
+    # ---------- 调用方（脚本线程） ----------
+    def submit(self, fn, *args, db_path=None):
+        """入队一个 fn(conn, *args) 写操作，返回 PendingWrite"""
+        if self._closed:
+            raise RuntimeError("写队列已关闭")
+        self._ensure_started()
+        op = PendingWrite(fn, args, db_path)
+        self._queue.put(op)  # 队列满时阻塞 = 背压
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+        if self.durability == "commit":
+            op.wait()
+        return op
+
+    def flush(self, timeout=None):
+        """等待当前已入队的写入全部提交"""
+        marker = self.submit(_noop)
+        return marker.wait(timeout)
+
+    def close(self, timeout=10):
+        """停止写线程；进程退出时由 atexit 调用，保证队列落盘"""
+        if self._closed:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._closed = True
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self._queue.qsize()
+        snapshot["avg_commit_ms"] = (snapshot.pop("total_commit_ms") / snapshot["batches"]
+                                     if snapshot["batches"] else 0.0)
+        return snapshot
+
+    # ---------- 写线程 ----------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch = [op]
+            deadline = time.monotonic() + self.linger
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch):
+        # 按数据库文件分组，每组一个事务
+        groups = {}
+        for op in batch:
+            groups.setdefault(op.db_path, []).append(op)
+        for db_path, ops in groups.items():
+            t0 = time.perf_counter()
+            try:
+                with self.conn_factory(db_path) as conn:
+                    for op in ops:
+                        op.row_id = op.fn(conn, *_resolve_args(op.args))
+            except Exception:
+                # 整批回滚后逐条重试，避免一条坏数据拖累同批其他人的记录；
+                # 回滚前填入的主键已经作废，重放时重新生成
+                logger.exception("批量写入失败，改为逐条提交")
+                for op in ops:
+                    op.row_id = None
+                self._commit_one_by_one(ops)
+                continue
+            self._record_commit(len(ops), (time.perf_counter() - t0) * 1000)
+            for op in ops:
+                op._committed.set()
+
+    def _commit_one_by_one(self, ops):
+        for op in ops:
+            t0 = time.perf_counter()
+            try:
+                with self.conn_factory(op.db_path) as conn:
+                    op.row_id = op.fn(conn, *_resolve_args(op.args))
+            except Exception as e:
+                logger.exception("写入失败，已丢弃: %s", getattr(op.fn, "__name__", op.fn))
+                op.error = e
+                with self._stats_lock:
+                    self._stats["failed"] += 1
+            else:
+                self._record_commit(1, (time.perf_counter() - t0) * 1000)
+            op._committed.set()
+
+    def _record_commit(self, count, elapsed_ms):
+        with self._stats_lock:
+            s = self._stats
+            s["committed"] += count
+            s["batches"] += 1
+            s["last_commit_ms"] = elapsed_ms
+            s["max_commit_ms"] = max(s["max_commit_ms"], elapsed_ms)
+            s["total_commit_ms"] += elapsed_ms
+
+
+def _noop(conn):
+    return None
+
+
+def _resolve_args(args):
+    # 同一队列按 FIFO 执行，引用的 PendingWrite 此时已执行过
+    return [executed_id(a) for a in args]